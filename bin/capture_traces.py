@@ -23,6 +23,10 @@ def parse_args():
     parser.add_argument("-b","--baud",type=int,
         help="Baud rate to communicate with target at",default=9600)
     
+    parser.add_argument("--negotiate-baud",action="store_true",
+        help="After the handshake, switch to the framed protocol and the "+
+             "fastest baud rate the link supports reliably")
+
     parser.add_argument("-k","--keep-data",action="store_true",
         help="Store input data with the captured traces")
     
@@ -68,6 +72,9 @@ def main(argparser,capture_class = scass.trace.TraceCapture):
         print(e)
         return 1
 
+    if(args.negotiate_baud):
+        log.info("Negotiated baud rate: %d" % target.negotiateBaud())
+
     experiment_name = target.doGetExperiementName()
 
     log.info("Experiment Name    : '%s'" % experiment_name)
@@ -23,6 +23,9 @@ scass_path = os.path.expandvars(
 sys.path.append(scass_path)
 
 import scass
+from   scass.cpa.BitKernels             import hammingWeightVector
+from   scass.cpa.CorrolationAccumulator import accumulateFromDisk
+from   scass.cpa.CorrolationAccumulator import saveConvergenceHistory
 
 def parse_args():
     """
@@ -82,6 +85,15 @@ def parse_args():
     parser.add_argument("--sample-rate",type = int, default=250000000,
         help="Sample rate - used for filtering.")
 
+    parser.add_argument("--chunk-size",type=int,default=10000,
+        help="Number of traces to load and process at once.")
+
+    parser.add_argument("--report-every",type=int,default=0,
+        help="Report the correlation after every N chunks of traces.")
+
+    parser.add_argument("--convergence",type=str,
+        help="Write the max correlation at each report point to this file.")
+
     parser.add_argument("--graph",type=str,
         help="Write plot to this file path")
     
@@ -98,21 +110,6 @@ def butter_lowpass_filter(data, cutoff, fs, btype, order=10):
     y = lfilter(b, a, data)
     return y
 
-def hw(x):
-    """Return hamming weight of x"""
-    c = 0
-    if(isinstance(x,np.ndarray)):
-        for y in x:
-            z = y
-            while z > 0:
-                c  = c + 1
-                z &= z-1
-    else:
-        while x > 0:
-            c  = c + 1
-            x &= x-1
-    return c
-
 def get_operation_results_to_check(args):
 
     ops_to_check    = []
@@ -161,55 +158,26 @@ def get_operation_results_to_check(args):
     return ops_to_check
     
 
-def get_hamming_weight(inputs,traces):
-    D_trace_count, T_trace_len  = traces.shape
-
-    # Key guesses are always one here, since we take values directly from
-    # the input arrays.
-    K_guesses                   = 1
+def get_hamming_weights(to_check):
+    """
+    Build one hypothesis column per operand and result in to_check, so
+    they can all be correlated against the traces in a single pass.
+    Returns a tuple (labels, H) where H is a DxK matrix, with one column
+    per label.
+    """
+    labels  = []
+    columns = []
 
-    log.debug("Trace Count   D=%d" % D_trace_count)
-    log.debug("Trace Length  T=%d" % T_trace_len  )
-    
-    T = traces
-    log.debug("T = DxT matrix = %d x %d" % T.shape)
+    for t in to_check:
+        name, values = t
+        for v in values:
+            labels.append("%s-%s" % (name, v))
+            columns.append(hammingWeightVector(values[v]))
 
-    H = np.zeros((D_trace_count, K_guesses))
+    H = np.stack(columns, axis=1)
     log.debug("H = DxK matrix = %d x %d" % H.shape)
 
-    for i in range(0, D_trace_count):
-        H[i,0] = hw(inputs[i])
-
-    H_avgs = np.mean(H,axis=0)
-    T_avgs = np.mean(T,axis=0)
-    
-    R = np.zeros((K_guesses, T_trace_len))
-    log.debug("R = KxT matrix = %d x %d" % R.shape)
-
-    for i in range(0,K_guesses):
-
-        H_avg   = H_avgs[i]
-        H_col   = H[:,i]
-        H_col_d = H_col - H_avg
-    
-        H_col_sq_sum = np.dot(H_col_d,H_col_d)
-
-        for j in range(0, T_trace_len):
-
-            T_avg   = T_avgs[j]
-            T_col   = traces[:D_trace_count,j]
-            T_col_d = T_col - T_avg
-            T_col_sq_sum = np.dot(T_col_d, T_col_d)
-
-            top = np.dot(H_col_d, T_col_d)
-
-            bot = np.sqrt(H_col_sq_sum * T_col_sq_sum)
-            if(bot == 0):
-                bot = 1
-
-            R[i,j] = np.abs(top/bot)
-
-    return R
+    return (labels, H)
 
 
 def main(args):
@@ -217,52 +185,63 @@ def main(args):
     Script main function
     """
 
-    log.info("Loading traces...")
-    
-    gzfh_traces     = gzip.GzipFile(args.traces,"r")
-    traces          = np.load(gzfh_traces)
-
     to_check = get_operation_results_to_check(args)
+    select   = None
 
     if(args.trace_filter_out != None):
         log.info("Filtering traces...")
         gzfh_filter_out = gzip.GzipFile(args.trace_filter_out,"r")
         fbits           = np.load(gzfh_filter_out)
-        select_idx      = np.nonzero(fbits <  1)
-
-        traces          = traces[select_idx]
-
-        for t in to_check:
-            name, values = t
-            for k in values:
-                values[k] = values[k][select_idx]
+        select          = fbits <  1
 
+    filters = []
 
     if(args.low_pass):
         log.info("Running low-pass filter at %dHz"% args.low_pass)
         log.info("Sample rate set at: %dHz"% args.sample_rate)
-        traces = butter_lowpass_filter(
-            traces, args.low_pass, args.sample_rate, 'lowpass')
+        filters.append((args.low_pass, 'lowpass'))
 
     if(args.high_pass):
         log.info("Running high-pass filter at %dHz"% args.high_pass)
         log.info("Sample rate set at: %dHz"% args.sample_rate)
-        traces = butter_lowpass_filter(
-            traces, args.high_pass, args.sample_rate,'highpass')
+        filters.append((args.high_pass, 'highpass'))
+
+    def preprocess(chunk):
+        for cutoff, btype in filters:
+            chunk = butter_lowpass_filter(
+                chunk, cutoff, args.sample_rate, btype)
+        return chunk[:,args.trim_start:chunk.shape[1]-args.trim_end]
 
-    traces=traces[:,args.trim_start:-args.trim_end]
+    log.info("Calculating hamming weights for all operations...")
+    labels, H = get_hamming_weights(to_check)
+
+    log.info("Streaming traces in chunks of %d..." % args.chunk_size)
+
+    acc, history = accumulateFromDisk(
+        args.traces,
+        H,
+        chunk_size      = args.chunk_size,
+        select          = select,
+        preprocess      = preprocess,
+        report_every    = args.report_every
+    )
+
+    log.info("Trace Count   D=%d" % acc.num_traces)
+    log.info("Trace Length  T=%d" % acc.trace_length)
+
+    R = acc.corrolation()
+    log.debug("R = KxT matrix = %d x %d" % R.shape)
+
+    if(args.convergence):
+        log.info("Dumping correlation convergence to %s" % args.convergence)
+        saveConvergenceHistory(args.convergence, history)
     
     plt.figure(1)
     fig = plt.gcf()
     fig.set_size_inches(9.5,5,forward=True)
 
-    for t in to_check:
-        name, values = t
-        for v in values:
-            label   = "%s-%s" % (name, v)
-            log.info("Calculating hamming weight for %s"%(label))
-            R       = get_hamming_weight(values[v],traces)
-            plt.plot(R.transpose(),linewidth=0.2,label=label)
+    for i,label in enumerate(labels):
+        plt.plot(R[i],linewidth=0.2,label=label)
 
     plt.legend()
     plt.tight_layout()
@@ -22,7 +22,10 @@ scass_path = os.path.expandvars(
 sys.path.append(scass_path)
 
 import scass
-from   scass.trace import loadTracesFromDisk
+from   scass.trace                      import loadTracesFromDisk
+from   scass.cpa.BitKernels             import hammingWeightVector
+from   scass.cpa.CorrolationAccumulator import accumulateFromDisk
+from   scass.cpa.CorrolationAccumulator import saveConvergenceHistory
 
 def parse_args():
     """
@@ -51,6 +54,15 @@ def parse_args():
     parser.add_argument("--sample-rate",type = int, default=250000000,
         help="Sample rate - used for filtering.")
 
+    parser.add_argument("--chunk-size",type=int,default=10000,
+        help="Number of traces to load and process at once.")
+
+    parser.add_argument("--report-every",type=int,default=0,
+        help="Report the correlation after every N chunks of traces.")
+
+    parser.add_argument("--convergence",type=str,
+        help="Write the max correlation at each report point to this file.")
+
     parser.add_argument("--dump",type=str,
         help="Write the final HW corrolation trace to this file.")
 
@@ -70,104 +82,64 @@ def butter_lowpass_filter(data, cutoff, fs, btype, order=10):
     y = lfilter(b, a, data)
     return y
 
-def hw(x):
-    """Return hamming weight of x"""
-    c = 0
-    if(isinstance(x,np.ndarray)):
-        for y in x:
-            z = y
-            while z > 0:
-                c  = c + 1
-                z &= z-1
-    else:
-        while x > 0:
-            c  = c + 1
-            x &= x-1
-    return c
-
 def main(args):
     """
     Script main function
     """
 
-    log.info("Loading traces...")
+    log.info("Loading inputs...")
     
-    traces          = loadTracesFromDisk(args.traces)
     inputs          = loadTracesFromDisk(args.inputs)
+    select          = None
 
     if(args.trace_filter_out != None):
         log.info("Filtering traces...")
         fbits           = loadTracesFromDisk(args.trace_filter_out)
-        select_idx      = np.nonzero(fbits <  1)
+        select          = fbits <  1
 
-        traces          = traces[select_idx]
-        inputs          = inputs[select_idx]
+    filters = []
 
     if(args.low_pass):
         log.info("Running low-pass filter at %dHz"% args.low_pass)
         log.info("Sample rate set at: %dHz"% args.sample_rate)
-        traces = butter_lowpass_filter(
-            traces, args.low_pass, args.sample_rate, 'lowpass')
+        filters.append((args.low_pass, 'lowpass'))
 
     if(args.high_pass):
         log.info("Running high-pass filter at %dHz"% args.high_pass)
         log.info("Sample rate set at: %dHz"% args.sample_rate)
-        traces = butter_lowpass_filter(
-            traces, args.high_pass, args.sample_rate,'highpass')
+        filters.append((args.high_pass, 'highpass'))
 
-    D_trace_count, T_trace_len  = traces.shape
+    def preprocess(chunk):
+        for cutoff, btype in filters:
+            chunk = butter_lowpass_filter(
+                chunk, cutoff, args.sample_rate, btype)
+        return chunk
 
     # Key guesses are always one here, since we take values directly from
     # the input arrays.
-    K_guesses                   = 1
+    H = hammingWeightVector(inputs)
+    log.info("H = DxK matrix = %d x %d" % (H.shape[0], 1))
 
-    log.info("Trace Count   D=%d" % D_trace_count)
-    log.info("Trace Length  T=%d" % T_trace_len  )
-    
-    T = traces
-    log.info("T = DxT matrix = %d x %d" % T.shape)
-
-    H = np.zeros((D_trace_count, K_guesses))
-    log.info("H = DxK matrix = %d x %d" % H.shape)
+    log.info("Streaming traces in chunks of %d..." % args.chunk_size)
 
-    for i in range(0, D_trace_count):
-        H[i,0] = hw(inputs[i])
+    acc, history = accumulateFromDisk(
+        args.traces,
+        H,
+        chunk_size      = args.chunk_size,
+        select          = select,
+        preprocess      = preprocess,
+        report_every    = args.report_every
+    )
 
-    H_avgs = np.mean(H,axis=0)
-    T_avgs = np.mean(T,axis=0)
+    log.info("Trace Count   D=%d" % acc.num_traces)
+    log.info("Trace Length  T=%d" % acc.trace_length)
 
-    #print(np.min(H))
-    #print(np.max(H))
-    #print(T)
-    #print(T_avgs.shape)
-    #print(T_avgs)
-    #print(inputs)
-    
-    R = np.zeros((K_guesses, T_trace_len))
+    R = acc.corrolation()
     log.info("R = KxT matrix = %d x %d" % R.shape)
 
-    for i in range(0,K_guesses):
-
-        H_avg   = H_avgs[i]
-        H_col   = H[:,i]
-        H_col_d = H_col - H_avg
-    
-        H_col_sq_sum = np.dot(H_col_d,H_col_d)
-
-        for j in range(0, T_trace_len):
-
-            T_avg   = T_avgs[j]
-            T_col   = traces[:D_trace_count,j]
-            T_col_d = T_col - T_avg
-            T_col_sq_sum = np.dot(T_col_d, T_col_d)
-
-            top = np.dot(H_col_d, T_col_d)
-
-            bot = np.sqrt(H_col_sq_sum * T_col_sq_sum)
-            if(bot == 0):
-                bot = 1
-
-            R[i,j] = np.abs(top/bot)
+    if(args.convergence):
+        log.info("Dumping correlation convergence to %s" % args.convergence)
+        saveConvergenceHistory(args.convergence, history)
 
     if(args.dump):
         log.info("Dumping CPA HW trace to %s" % args.dump)
@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+
+"""
+A tool script for running a last round AES Corrolation Power Analysis
+(CPA) on traces captured with ciphertext output variables. Each byte of
+the last round key is guessed using a last round leakage model, and the
+cipher key recovered by inverting the key schedule.
+"""
+
+import os
+import sys
+import argparse
+import logging as log
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+scass_path = os.path.expandvars(
+    os.path.join(os.path.dirname(__file__),"../")
+)
+sys.path.append(scass_path)
+
+import scass
+from   scass.trace                      import loadTracesFromDisk
+from   scass.cpa                        import AES
+from   scass.cpa.CorrolationAccumulator import accumulateFromDisk
+from   scass.cpa.CorrolationAccumulator import saveConvergenceHistory
+
+def parse_args():
+    """
+    Parse command line arguments to the script
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("traces",type=str,
+        help="File path of input trace set")
+
+    parser.add_argument("--ciphertexts",type=str,
+        help="File path of ciphertext output variables.")
+
+    parser.add_argument("--keys",type=str,
+        help="File path of key input variables. Used with --messages to "+
+             "compute ciphertexts if --ciphertexts is not given.")
+
+    parser.add_argument("--messages",type=str,
+        help="File path of message input variables.")
+
+    parser.add_argument("--model",type=str,default="hd",
+        choices=["hd","hd-unshifted","hw"],
+        help="Last round leakage model.")
+
+    parser.add_argument("--bytes",type=int,nargs="+",default=list(range(16)),
+        help="Indexes of the last round key bytes to guess.")
+
+    parser.add_argument("--expected-key",type=str,default="",
+        help="Expected cipher key, as a hex string.")
+
+    parser.add_argument("--trace-filter-out",type=str,
+        help="Filepath to Mask to filter out a subset of traces from <traces>")
+
+    parser.add_argument("-l", "--logfile", type=str,default=None,
+        help="Log CPA information and progress to this file.)")
+
+    parser.add_argument("--chunk-size",type=int,default=10000,
+        help="Number of traces to load and process at once.")
+
+    parser.add_argument("--report-every",type=int,default=0,
+        help="Report the correlation after every N chunks of traces.")
+
+    parser.add_argument("--convergence",type=str,
+        help="Write the max correlation at each report point to this file.")
+
+    parser.add_argument("--dump",type=str,
+        help="Write the (bytes, K, T) corrolation matrix to this file.")
+
+    parser.add_argument("--graph",type=str,
+        help="Write plot to this file path")
+
+    return parser.parse_args()
+
+def get_model(args):
+    """
+    Return the last round leakage model selected by the arguments.
+    """
+    if(args.model == "hw"):
+        return scass.cpa.CPAModelLastRoundHW()
+
+    return scass.cpa.CPAModelLastRoundHD(shifted = args.model == "hd")
+
+def get_ciphertexts(args):
+    """
+    Load the ciphertext output variables, or compute them from the key
+    and message input variables.
+    """
+    if(args.ciphertexts != None):
+        return loadTracesFromDisk(args.ciphertexts)
+
+    if(args.keys == None or args.messages == None):
+        raise ValueError("Need either --ciphertexts or --keys and --messages")
+
+    log.info("Computing ciphertexts from keys and messages...")
+
+    return AES.encrypt(
+        loadTracesFromDisk(args.keys),
+        loadTracesFromDisk(args.messages)
+    )
+
+def main(args):
+    """
+    Script main function
+    """
+
+    log.info("Loading inputs...")
+
+    ciphertexts     = get_ciphertexts(args)
+    select          = None
+    model           = get_model(args)
+    K               = model.K
+
+    if(args.trace_filter_out != None):
+        log.info("Filtering traces...")
+        fbits           = loadTracesFromDisk(args.trace_filter_out)
+        select          = fbits <  1
+
+    # One block of K hypothesis columns per key byte, so every byte is
+    # correlated in the same pass over the traces.
+    H = np.concatenate([
+        model.inputHypotheses(ciphertexts, b) for b in args.bytes
+    ], axis=1)
+    log.info("H = DxK matrix = %d x %d" % H.shape)
+
+    log.info("Streaming traces in chunks of %d..." % args.chunk_size)
+
+    acc, history = accumulateFromDisk(
+        args.traces,
+        H,
+        chunk_size      = args.chunk_size,
+        select          = select,
+        report_every    = args.report_every
+    )
+
+    log.info("Trace Count   D=%d" % acc.num_traces)
+    log.info("Trace Length  T=%d" % acc.trace_length)
+
+    R = acc.corrolation().reshape(len(args.bytes), K, acc.trace_length)
+
+    scores          = np.max(R, axis=2)
+    guesses         = np.argmax(scores, axis=1)
+
+    for i, b in enumerate(args.bytes):
+        log.info("Byte %2d: guess %s (%f)" % (
+            b, hex(guesses[i]), scores[i,guesses[i]]))
+
+    if(len(args.bytes) == 16):
+        last_round_key = np.zeros(16, dtype=np.uint8)
+        last_round_key[args.bytes] = guesses
+
+        log.info("Last Round Key Guess: %s" % bytes(last_round_key).hex())
+        log.info("Cipher Key Guess    : %s" % bytes(
+            AES.invertKeySchedule(last_round_key)[0]).hex())
+
+    if(args.expected_key != ""):
+        expected = bytes.fromhex(args.expected_key.replace("0x",""))
+        expected = AES.expandKey(expected)[0,10]
+
+        ranks    = [scass.cpa.KeyRank.guessRanks(scores[i], expected[b])
+            for i, b in enumerate(args.bytes)]
+
+        log.info("Expected Last Round Key: %s" % bytes(expected).hex())
+        log.info("Expected key byte ranks: %s" % str([int(r) for r in ranks]))
+
+    if(args.convergence):
+        log.info("Dumping correlation convergence to %s" % args.convergence)
+        saveConvergenceHistory(args.convergence, history)
+
+    if(args.dump):
+        log.info("Dumping CPA trace to %s" % args.dump)
+        np.save(args.dump, R)
+
+    if(args.graph != None):
+        plt.figure(1)
+        fig = plt.gcf()
+        fig.set_size_inches(9.5,5,forward=True)
+        plt.plot(scores.transpose(),linewidth=0.5)
+        plt.xlabel("Key guess")
+        plt.ylabel("Max corrolation")
+        plt.tight_layout()
+        plt.savefig(args.graph,bbox_inches="tight", pad_inches=0)
+
+
+
+if(__name__ == "__main__"):
+    args = parse_args()
+    if(args.logfile != None):
+        log.basicConfig(filename=args.logfile, filemode="w",level=log.INFO)
+    else:
+        log.basicConfig(level=log.INFO)
+    result = main(args)
+    sys.exit(result)
+
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+
+"""
+A tool script for fitting a PCA or LDA projection to a trace set, which
+reduces each trace to a few components. The projection can be passed to
+cpa.py, ttest_analyse.py and the template scripts with --projection.
+"""
+
+import os
+import sys
+import argparse
+import logging as log
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+scass_path = os.path.expandvars(
+    os.path.join(os.path.dirname(__file__),"../")
+)
+sys.path.append(scass_path)
+
+import scass
+from   scass.trace   import loadTracesFromDisk
+from   scass.trace   import iterTracesFromDisk
+from   scass.trace   import fitPCA
+from   scass.trace   import fitLDA
+from   scass.cpa.AES import sbox
+
+def parse_args():
+    """
+    Parse command line arguments to the script
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("traces",type=str,
+        help="File path of (profiling) trace set")
+
+    parser.add_argument("projection",type=str,
+        help="File path to write the projection (.npz) to.")
+
+    parser.add_argument("--method",type=str,default="pca",
+        choices=["pca","lda"],
+        help="PCA needs no labels. LDA needs --inputs and --keys.")
+
+    parser.add_argument("--components",type=int,default=20,
+        help="Number of output components.")
+
+    parser.add_argument("--pca-first",type=int,default=50,
+        help="For LDA, reduce traces to this many PCA components first.")
+
+    parser.add_argument("--poi",type=str,default=None,
+        help="Only use these sample indexes, e.g. from snr.py.")
+
+    parser.add_argument("--inputs",type=str,
+        help="File path of message input variables, for LDA labels.")
+
+    parser.add_argument("--keys",type=str,
+        help="File path of key input variables, for LDA labels.")
+
+    parser.add_argument("--byte",type=int,default=0,
+        help="LDA classes are the first round S-box output of this byte.")
+
+    parser.add_argument("--iterations",type=int,default=2,
+        help="Number of PCA power iterations, one pass over traces each.")
+
+    parser.add_argument("-l", "--logfile", type=str,default=None,
+        help="Log information and progress to this file.)")
+
+    parser.add_argument("--chunk-size",type=int,default=10000,
+        help="Number of traces to load and process at once.")
+
+    parser.add_argument("--graph",type=str,
+        help="Plot the weight of every sample in each component.")
+
+    return parser.parse_args()
+
+def main(args):
+    """
+    Script main function
+    """
+
+    source  = lambda: iterTracesFromDisk(args.traces, args.chunk_size)
+    poi     = None
+
+    if(args.poi):
+        poi = loadTracesFromDisk(args.poi)
+        log.info("Using %d points of interest" % poi.size)
+
+    if(args.method == "pca"):
+
+        log.info("Fitting %d PCA components..." % args.components)
+
+        projection = fitPCA(
+            source,
+            args.components,
+            samples     = poi,
+            num_iter    = args.iterations
+        )
+
+        log.info("Explained variance: %s" % str(
+            projection.explained_variance))
+
+    else:
+
+        if(args.inputs == None or args.keys == None):
+            log.error("LDA needs --inputs and --keys for class labels")
+            return 1
+
+        inputs  = loadTracesFromDisk(args.inputs)
+        keys    = loadTracesFromDisk(args.keys)
+        labels  = np.array(sbox, dtype=np.uint8)[
+            inputs[:, args.byte] ^ keys[:, args.byte]]
+
+        pre     = None
+
+        if(args.pca_first > 0):
+            log.info("Fitting %d PCA components..." % args.pca_first)
+            pre = fitPCA(
+                source,
+                args.pca_first,
+                samples     = poi,
+                num_iter    = args.iterations
+            )
+
+        log.info("Fitting %d LDA components..." % args.components)
+
+        projection = fitLDA(
+            source,
+            labels,
+            args.components,
+            samples = poi,
+            pre     = pre
+        )
+
+        log.info("Eigenvalues: %s" % str(projection.eigenvalues))
+
+    log.info("Writing projection to %s" % args.projection)
+    projection.save(args.projection)
+
+    if(args.graph != None):
+        plt.figure(1)
+        fig = plt.gcf()
+        fig.set_size_inches(9.5,5,forward=True)
+        x = np.arange(projection.input_length) \
+            if projection.samples is None else projection.samples
+        plt.plot(x, projection.components, linewidth=0.3)
+        plt.xlabel("Sample")
+        plt.ylabel("Component weight")
+        plt.tight_layout()
+        plt.savefig(args.graph,bbox_inches="tight", pad_inches=0)
+
+
+
+if(__name__ == "__main__"):
+    args = parse_args()
+    if(args.logfile != None):
+        log.basicConfig(filename=args.logfile, filemode="w",level=log.INFO)
+    else:
+        log.basicConfig(level=log.INFO)
+    result = main(args)
+    sys.exit(result)
+
@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+
+"""
+A tool script for computing the per-sample signal-to-noise ratio (SNR)
+of a trace set, with traces grouped by an intermediate value, and for
+picking points of interest to restrict later analyses to.
+"""
+
+import os
+import sys
+import argparse
+import logging as log
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+scass_path = os.path.expandvars(
+    os.path.join(os.path.dirname(__file__),"../")
+)
+sys.path.append(scass_path)
+
+import scass
+from   scass.trace              import loadTracesFromDisk
+from   scass.cpa.AES            import sbox
+from   scass.cpa.SNRAccumulator import snrFromDisk
+from   scass.cpa.SNRAccumulator import selectPointsOfInterest
+
+def parse_args():
+    """
+    Parse command line arguments to the script
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("traces",type=str,
+        help="File path of input trace set")
+
+    parser.add_argument("inputs",type=str,
+        help="File path of input variables used to label the traces.")
+
+    parser.add_argument("--byte",type=int,default=0,
+        help="Index of the input variable byte to label traces with.")
+
+    parser.add_argument("--key",type=str,default=None,
+        help="If given, label traces with sbox[input ^ key] rather than "+
+             "the input byte itself. Hex string of the full key.")
+
+    parser.add_argument("--trace-filter-out",type=str,
+        help="Filepath to Mask to filter out a subset of traces from <traces>")
+
+    parser.add_argument("-l", "--logfile", type=str,default=None,
+        help="Log SNR information and progress to this file.)")
+
+    parser.add_argument("--chunk-size",type=int,default=10000,
+        help="Number of traces to load and process at once.")
+
+    parser.add_argument("--poi-num",type=int,default=None,
+        help="Maximum number of points of interest to select.")
+
+    parser.add_argument("--poi-threshold",type=float,default=None,
+        help="Minimum SNR of a point of interest.")
+
+    parser.add_argument("--poi-spacing",type=int,default=0,
+        help="Minimum distance in samples between points of interest.")
+
+    parser.add_argument("--poi",type=str,
+        help="Write the selected point of interest indexes to this file.")
+
+    parser.add_argument("--dump",type=str,
+        help="Write the SNR trace to this file.")
+
+    parser.add_argument("--graph",type=str,
+        help="Write plot to this file path")
+
+    return parser.parse_args()
+
+def main(args):
+    """
+    Script main function
+    """
+
+    log.info("Loading inputs...")
+
+    inputs          = loadTracesFromDisk(args.inputs)
+    labels          = inputs[:, args.byte].astype(np.uint8)
+    select          = None
+
+    if(args.key != None):
+        key     = bytes.fromhex(args.key.replace("0x",""))
+        labels  = np.array(sbox, dtype=np.uint8)[labels ^ key[args.byte]]
+        log.info("Labelling traces with sbox[input ^ 0x%02x]" % (
+            key[args.byte]))
+
+    if(args.trace_filter_out != None):
+        log.info("Filtering traces...")
+        fbits           = loadTracesFromDisk(args.trace_filter_out)
+        select          = fbits <  1
+
+    log.info("Streaming traces in chunks of %d..." % args.chunk_size)
+
+    acc = snrFromDisk(
+        args.traces,
+        labels,
+        chunk_size  = args.chunk_size,
+        select      = select
+    )
+
+    snr = acc.snr()
+
+    log.info("Trace Count   D=%d" % acc.num_traces)
+    log.info("Trace Length  T=%d" % acc.trace_length)
+    log.info("Max SNR         %f at sample %d" % (snr.max(), snr.argmax()))
+
+    poi = selectPointsOfInterest(
+        snr,
+        num         = args.poi_num,
+        threshold   = args.poi_threshold,
+        min_spacing = args.poi_spacing
+    )
+
+    log.info("Selected %d points of interest (%.1fx fewer samples)" % (
+        poi.size, snr.size / max(poi.size, 1)))
+
+    if(args.poi):
+        log.info("Dumping points of interest to %s" % args.poi)
+        np.save(args.poi, poi)
+
+    if(args.dump):
+        log.info("Dumping SNR trace to %s" % args.dump)
+        np.save(args.dump, snr)
+
+    if(args.graph != None):
+        plt.figure(1)
+        fig = plt.gcf()
+        fig.set_size_inches(9.5,5,forward=True)
+        plt.plot(snr,linewidth=0.3)
+        plt.plot(poi, snr[poi], "rx", markersize=3)
+        plt.xlabel("Sample")
+        plt.ylabel("SNR")
+        plt.tight_layout()
+        plt.savefig(args.graph,bbox_inches="tight", pad_inches=0)
+
+
+
+if(__name__ == "__main__"):
+    args = parse_args()
+    if(args.logfile != None):
+        log.basicConfig(filename=args.logfile, filemode="w",level=log.INFO)
+    else:
+        log.basicConfig(level=log.INFO)
+    result = main(args)
+    sys.exit(result)
+
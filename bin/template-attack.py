@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+
+"""
+A tool script for recovering a key byte by matching attack traces
+against templates built with template-build.py.
+"""
+
+import os
+import sys
+import argparse
+import logging as log
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+scass_path = os.path.expandvars(
+    os.path.join(os.path.dirname(__file__),"../")
+)
+sys.path.append(scass_path)
+
+import scass
+from   scass.trace   import loadTracesFromDisk
+from   scass.attacks import Templates
+from   scass.attacks import matchTemplatesFromDisk
+
+def parse_args():
+    """
+    Parse command line arguments to the script
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("traces",type=str,
+        help="File path of attack trace set")
+
+    parser.add_argument("inputs",type=str,
+        help="File path of message input variables.")
+
+    parser.add_argument("templates",type=str,
+        help="File path of templates from template-build.py")
+
+    parser.add_argument("--byte",type=int,default=0,
+        help="Index of the key byte to attack.")
+
+    parser.add_argument("--expected-key",type=str,default="",
+        help="Expected key, as a hex string.")
+
+    parser.add_argument("--checkpoint-every",type=int,default=0,
+        help="Record the key guess scores every N attack traces.")
+
+    parser.add_argument("--projection",type=str,default=None,
+        help="Project traces with this PCA/LDA projection (.npz) first. "+
+             "Must be the one the templates were built with, as their "+
+             "points of interest then index its components.")
+
+    parser.add_argument("--trace-filter-out",type=str,
+        help="Filepath to Mask to filter out a subset of traces from <traces>")
+
+    parser.add_argument("-l", "--logfile", type=str,default=None,
+        help="Log template attack information to this file.)")
+
+    parser.add_argument("--chunk-size",type=int,default=10000,
+        help="Number of traces to load and process at once.")
+
+    parser.add_argument("--dump",type=str,
+        help="Write the final score of every key guess to this file.")
+
+    parser.add_argument("--graph",type=str,
+        help="Write a plot of the expected key byte rank to this file.")
+
+    return parser.parse_args()
+
+def main(args):
+    """
+    Script main function
+    """
+
+    log.info("Loading inputs...")
+
+    inputs          = loadTracesFromDisk(args.inputs)
+    templates       = Templates.load(args.templates)
+    select          = None
+    checkpoints     = None
+    preprocess      = None
+
+    if(args.projection != None):
+        projection      = scass.trace.Projection.load(args.projection)
+        preprocess      = projection.project
+        log.info("Projecting traces onto %d components" % (
+            projection.num_components))
+
+    log.info("Templates: %d classes over %d points of interest" % (
+        templates.num_classes, templates.samples.size))
+
+    if(args.trace_filter_out != None):
+        log.info("Filtering traces...")
+        fbits           = loadTracesFromDisk(args.trace_filter_out)
+        select          = fbits <  1
+
+    num_traces = inputs.shape[0] if select is None else np.count_nonzero(select)
+
+    if(args.checkpoint_every > 0):
+        checkpoints = list(range(args.checkpoint_every, num_traces+1,
+            args.checkpoint_every))
+
+    scores, history = matchTemplatesFromDisk(
+        args.traces,
+        templates,
+        inputs[:, args.byte],
+        chunk_size  = args.chunk_size,
+        select      = select,
+        preprocess  = preprocess,
+        checkpoints = checkpoints
+    )
+
+    guess = int(np.argmax(scores))
+
+    log.info("Attack traces: %d" % num_traces)
+    log.info("Byte %d guess: %s" % (args.byte, hex(guess)))
+
+    if(args.expected_key != ""):
+        expected = bytes.fromhex(args.expected_key.replace("0x",""))
+        expected = expected[args.byte]
+
+        rank = scass.cpa.KeyRank.guessRanks(scores, expected)
+        log.info("Expected byte %s has rank %d" % (hex(expected), rank))
+
+        if(checkpoints):
+            ranks = scass.cpa.KeyRank.guessRanks(history, expected)
+            ttd   = scass.cpa.KeyRank.tracesToDisclosure(
+                checkpoints, ranks[np.newaxis,:])
+            log.info("Traces to disclosure: %s" % (
+                "not reached" if ttd is None else str(ttd)))
+
+            if(args.graph):
+                plt.figure(1)
+                plt.plot(checkpoints, ranks)
+                plt.xlabel("Attack traces")
+                plt.ylabel("Key byte rank")
+                plt.savefig(args.graph,bbox_inches="tight", pad_inches=0)
+
+    if(args.dump):
+        log.info("Dumping key guess scores to %s" % args.dump)
+        np.save(args.dump, scores)
+
+
+
+if(__name__ == "__main__"):
+    args = parse_args()
+    if(args.logfile != None):
+        log.basicConfig(filename=args.logfile, filemode="w",level=log.INFO)
+    else:
+        log.basicConfig(level=log.INFO)
+    result = main(args)
+    sys.exit(result)
+
@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+
+"""
+A tool script for building Gaussian templates with a pooled covariance
+matrix from profiling traces with known keys, for use with
+template-attack.py.
+"""
+
+import os
+import sys
+import argparse
+import logging as log
+
+import numpy as np
+
+scass_path = os.path.expandvars(
+    os.path.join(os.path.dirname(__file__),"../")
+)
+sys.path.append(scass_path)
+
+import scass
+from   scass.trace              import loadTracesFromDisk
+from   scass.cpa.AES            import sbox
+from   scass.cpa.SNRAccumulator import snrFromDisk
+from   scass.cpa.SNRAccumulator import selectPointsOfInterest
+from   scass.attacks            import buildTemplatesFromDisk
+
+def parse_args():
+    """
+    Parse command line arguments to the script
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("traces",type=str,
+        help="File path of profiling trace set")
+
+    parser.add_argument("inputs",type=str,
+        help="File path of message input variables.")
+
+    parser.add_argument("keys",type=str,
+        help="File path of key input variables.")
+
+    parser.add_argument("templates",type=str,
+        help="File path to write the templates (.npz) to.")
+
+    parser.add_argument("--byte",type=int,default=0,
+        help="Index of the key byte to build templates for.")
+
+    parser.add_argument("--poi",type=str,default=None,
+        help="File of point of interest sample indexes, e.g. from snr.py. "+
+             "If not given, they are picked from an SNR pass first.")
+
+    parser.add_argument("--poi-num",type=int,default=16,
+        help="Number of points of interest to pick if --poi is not given.")
+
+    parser.add_argument("--poi-spacing",type=int,default=0,
+        help="Minimum distance in samples between picked points.")
+
+    parser.add_argument("--projection",type=str,default=None,
+        help="Project traces with this PCA/LDA projection (.npz) first. "+
+             "Cannot be combined with --poi: points of interest are then "+
+             "picked among the components, and samples can be selected "+
+             "with the --poi option of bin/fit-projection.py.")
+
+    parser.add_argument("--trace-filter-out",type=str,
+        help="Filepath to Mask to filter out a subset of traces from <traces>")
+
+    parser.add_argument("-l", "--logfile", type=str,default=None,
+        help="Log template information and progress to this file.)")
+
+    parser.add_argument("--chunk-size",type=int,default=10000,
+        help="Number of traces to load and process at once.")
+
+    return parser.parse_args()
+
+def main(args):
+    """
+    Script main function
+    """
+
+    assert(args.poi is None or args.projection is None), \
+        "--poi cannot be combined with --projection. Pass --poi to "+\
+        "bin/fit-projection.py instead, so the projection selects them."
+
+    log.info("Loading inputs...")
+
+    inputs          = loadTracesFromDisk(args.inputs)
+    keys            = loadTracesFromDisk(args.keys)
+    select          = None
+    preprocess      = None
+
+    if(args.projection != None):
+        projection      = scass.trace.Projection.load(args.projection)
+        preprocess      = projection.project
+        log.info("Projecting traces onto %d components" % (
+            projection.num_components))
+
+    # Class label of every trace is the first round S-box output.
+    labels          = np.array(sbox, dtype=np.uint8)[
+        inputs[:, args.byte] ^ keys[:, args.byte]]
+
+    if(args.trace_filter_out != None):
+        log.info("Filtering traces...")
+        fbits           = loadTracesFromDisk(args.trace_filter_out)
+        select          = fbits <  1
+
+    if(args.poi != None):
+        poi = loadTracesFromDisk(args.poi)
+    else:
+        log.info("Picking points of interest by SNR...")
+        snr = snrFromDisk(
+            args.traces,
+            labels,
+            chunk_size  = args.chunk_size,
+            select      = select,
+            preprocess  = preprocess
+        ).snr()
+        poi = selectPointsOfInterest(
+            snr, num = args.poi_num, min_spacing = args.poi_spacing)
+
+    log.info("Points of interest: %s" % str([int(p) for p in poi]))
+
+    log.info("Building templates in chunks of %d..." % args.chunk_size)
+
+    templates = buildTemplatesFromDisk(
+        args.traces,
+        labels,
+        poi,
+        chunk_size  = args.chunk_size,
+        select      = select,
+        preprocess  = preprocess
+    )
+
+    log.info("Traces per class: min %d, max %d" % (
+        templates.counts.min(), templates.counts.max()))
+
+    log.info("Writing templates to %s" % args.templates)
+    templates.save(args.templates)
+
+
+
+if(__name__ == "__main__"):
+    args = parse_args()
+    if(args.logfile != None):
+        log.basicConfig(filename=args.logfile, filemode="w",level=log.INFO)
+    else:
+        log.basicConfig(level=log.INFO)
+    result = main(args)
+    sys.exit(result)
+
@@ -59,6 +59,15 @@ def parse_args():
     parser.add_argument("--trim-end",type=int,default = 1,
         help="Trim this many samples from end of graph.")
 
+    parser.add_argument("--poi",type=str,default=None,
+        help="Only test these sample indexes (points of interest), "+
+             "relative to the trimmed traces.")
+
+    parser.add_argument("--projection",type=str,default=None,
+        help="Project the trimmed traces with this PCA/LDA projection "+
+             "(.npz) and test the components. Cannot be combined with "+
+             "--poi: use the --poi option of bin/fit-projection.py.")
+
     parser.add_argument("--abs",action="store_true",
         help="Plot the absolute value of the TTrace.")
     
@@ -103,6 +112,12 @@ def main():
         log.error("Input fixed mask %s does not exist." % args.trs_fixed)
         return 2
 
+    if(args.poi and args.projection):
+        log.error("--poi cannot be combined with --projection. Pass --poi "+
+            "to bin/fit-projection.py instead, so the projection selects "+
+            "them.")
+        return 3
+
     log.info("Decompressing traceset %s" % args.trs_trace)
 
     fbits       = loadTracesFromDisk(args.trs_fixed)
@@ -147,11 +162,26 @@ def main():
             ts_random[i]= butter_filter(
                 ts_random[i], args.high_pass, args.sample_rate, 'highpass')
     
+    if(args.projection):
+        projection  = scass.trace.Projection.load(args.projection)
+        log.info("Projecting traces onto %d components" % (
+            projection.num_components))
+        ts_fixed    = projection.project(ts_fixed)
+        ts_random   = projection.project(ts_random)
+        args.avg    = False
+
+    poi = None
+
+    if(args.poi):
+        poi = loadTracesFromDisk(args.poi)
+        log.info("Testing %d points of interest" % poi.size)
+
     log.info("Running TTest...")
     ttest       = scass.ttest.TTest (
         ts_fixed,
         ts_random,
-        second_order = args.second_order
+        second_order = args.second_order,
+        samples      = poi
     )
 
     if(args.ttrace_dump):
@@ -167,23 +197,26 @@ def main():
         plt.xlabel("Sample")
         plt.ylabel("T-Statistic")
 
+        # Sample index of each ttrace entry
+        x = np.arange(ttest.ttrace.size) if poi is None else poi
+
         if(args.avg):
             ax2 = ax1.twinx()
             ax2.set_label("Average Power Consumption, DC blocked")
             ax2.plot(average_trace, color='green', linewidth=0.15)
 
         ax1.plot(
-            [args.critical_value]*ttest.ttrace.size,
+            x, [args.critical_value]*ttest.ttrace.size,
             linewidth=0.3,color="red"
         )
 
         if(args.abs):
-            ax1.plot(np.abs(ttest.ttrace), linewidth=0.3)
+            ax1.plot(x, np.abs(ttest.ttrace), linewidth=0.3)
         else:
-            ax1.plot(       ttest.ttrace , linewidth=0.3)
+            ax1.plot(x,        ttest.ttrace , linewidth=0.3)
 
             ax1.plot(
-                [-args.critical_value]*ttest.ttrace.size,
+                x, [-args.critical_value]*ttest.ttrace.size,
                 linewidth=0.3,color="red"
             )
 
@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+"""
+A tool script for capturing one TTest data set across several benches
+"""
+
+import os
+import sys
+import argparse
+import logging as log
+
+scass_path = os.path.expandvars(
+    os.path.join(os.path.dirname(__file__),"../")
+)
+sys.path.append(scass_path)
+
+import scass
+
+def parse_args():
+    """
+    Parse command line arguments to the script
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-n","--num-traces",type=int,
+        help="Number of traces to capture in total, across all benches",
+        default=10000)
+
+    parser.add_argument("-b","--baud",type=int,
+        help="Baud rate to communicate with targets at",default=9600)
+
+    parser.add_argument("--negotiate-baud",action="store_true",
+        help="After the handshake, switch to the framed protocol and the "+
+             "fastest baud rate each link supports reliably")
+
+    parser.add_argument("-l", "--logfile", type=str,default=None,
+        help="Log TTest information and progress to this file.)")
+
+    parser.add_argument("--zero-fixed",action="store_true",
+        help="Tie all TTest fixed values to zero")
+
+    parser.add_argument("--read-outputs",action="store_true",
+        help="Read back output variables (e.g. ciphertexts) after each trace")
+
+    parser.add_argument("--target-prng",action="store_true",
+        help="Have the targets generate random inputs with their seeded "+
+             "PRNGs instead of uploading them before each trace")
+
+    parser.add_argument("--burst",type=int,default=0,
+        help="Capture N traces per target command using segmented scope "+
+             "capture. Needs --target-prng for randomised inputs.")
+
+    parser.add_argument("--num-samples",type=int,default=None,
+        help="Samples per trace. Defaults to the smallest trigger window "+
+             "found by any bench.")
+
+    parser.add_argument("--trace-ext",type=str,default=".npy",
+        help="Extension, and so format, of the per bench trace files.")
+
+    parser.add_argument("--set-vars", type=str, nargs="+",
+        help="Set an input variable/parameter of the experiment to this "+
+             "value, as <name>=<integer>")
+
+    parser.add_argument("--bench",type=str,nargs=2,action="append",
+        required=True, metavar=("PORT","SCOPE_CONFIG"),
+        help="Add a bench: the target's TTY port and its scope "+
+             "configuration file. May be given several times.")
+
+    parser.add_argument("power_channel",type=str,
+        help="Scope Channel ID which samples the power signal")
+
+    parser.add_argument("output_dir",type=str,
+        help="Directory to write the per bench shards and the trace, "+
+             "fixed/random and variable indexes (traces.json, fixed.json, "+
+             "var-<name>.json) too.")
+
+    return parser
+
+def main(argparser):
+    """
+    Main function for the tool script
+    parameters:
+    argparser  - instance of argparse.ArgumentParser
+    """
+    args    = argparser.parse_args()
+
+    if(args.logfile != None):
+        log.basicConfig(filename=args.logfile, filemode="w",level=log.DEBUG)
+    else:
+        log.basicConfig(level=log.DEBUG)
+
+    benches = [scass.ttest.CaptureBench(port, scope, args.baud,
+        args.power_channel) for port, scope in args.bench]
+
+    campaign = scass.ttest.TTestCampaign(benches, args.output_dir,
+        args.num_traces, trace_ext = args.trace_ext)
+
+    campaign.num_samples    = args.num_samples
+    campaign.negotiate_baud = args.negotiate_baud
+
+    campaign.capture_options = {
+        "zeros_as_fixed_value"  : args.zero_fixed,
+        "read_output_vars"      : args.read_outputs,
+        "target_prng"           : args.target_prng,
+        "burst_size"            : args.burst
+    }
+
+    for varset in (args.set_vars or []):
+        varname, value = varset.split("=")
+        log.info("Setting input variable %s = %s" % (varname, value))
+        campaign.fixed_values[varname] = int(value)
+
+    log.info("Capturing %d traces on %d benches, seed %s" % (
+        args.num_traces, len(benches), hex(campaign.seed)))
+
+    try:
+        summaries = campaign.run()
+    except Exception as e:
+        log.error(str(e))
+        return 1
+
+    for s in summaries:
+        log.info("Shard %d (%s): %d traces of %d samples, %d fixed, %.1fs" % (
+            s["index"], s["bench"], s["num_traces"], s["num_samples"],
+            s["fixed_count"], s["seconds"]))
+
+    log.info("Finished Successfully")
+
+    return 0
+
+
+if(__name__ == "__main__"):
+
+    argparser = parse_args()
+
+    sys.exit(main(argparser))
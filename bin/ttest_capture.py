@@ -29,6 +29,10 @@ def parse_args():
     parser.add_argument("-b","--baud",type=int,
         help="Baud rate to communicate with target at",default=9600)
     
+    parser.add_argument("--negotiate-baud",action="store_true",
+        help="After the handshake, switch to the framed protocol and the "+
+             "fastest baud rate the link supports reliably")
+
     parser.add_argument("-k","--keep-data",action="store_true",
         help="Store input data with the captured traces")
     
@@ -38,6 +42,22 @@ def parse_args():
     parser.add_argument("--zero-fixed",action="store_true",
         help="Tie all TTest fixed values to zero")
 
+    parser.add_argument("--read-outputs",action="store_true",
+        help="Read back output variables (e.g. ciphertexts) after each trace")
+
+    parser.add_argument("--target-prng",action="store_true",
+        help="Have the target generate random inputs with its seeded PRNG "+
+             "instead of uploading them before each trace")
+
+    parser.add_argument("--burst",type=int,default=0,
+        help="Capture N traces per target command using segmented scope "+
+             "capture. Needs --target-prng for randomised inputs.")
+
+    parser.add_argument("--metadata-cache",type=str,default=None,
+        help="Cache target variable, clock and trigger window information "+
+             "in this file, keyed by experiment name and firmware build, "+
+             "to skip querying it again on later runs")
+
     parser.add_argument("--set-vars", type=str, nargs="+",
         help="Set an input variable/parameter of the experiment to this value"
         )
@@ -86,7 +106,18 @@ def main(argparser,ttest_class = scass.ttest.TTestCapture):
         print(e)
         return 1
 
-    experiment_name = target.doGetExperiementName()
+    if(args.negotiate_baud):
+        log.info("Negotiated baud rate: %d" % target.negotiateBaud())
+
+    metadata        = None
+
+    if(args.metadata_cache != None):
+        cache           = scass.comms.TargetMetadataCache(args.metadata_cache)
+        metadata        = cache.lookup(target)
+        experiment_name = metadata.experiment_name
+        log.info("Firmware Build ID  : '%s'" % metadata.build_id)
+    else:
+        experiment_name = target.doGetExperiementName()
 
     log.info("Experiment Name    : '%s'" % experiment_name)
 
@@ -115,24 +146,47 @@ def main(argparser,ttest_class = scass.ttest.TTestCapture):
     sig_trigger = None
     sig_power   = None
 
-    log.info("Finding trigger window size...")
-    window_size = scass.scope.findTriggerWindowSize(scope,target,power_channel)
+    window_size = None
 
-    if(window_size <= 10):
-        log.error("Failed to find window size after 10 attempts.")
-        return 1
-        
-    sig_power   = scope.getRawChannelData(
-        power_channel,scope.max_samples)
+    if(metadata != None):
+        # The trigger window depends on the scope setup as well as the
+        # firmware and its clock.
+        window_key  = scass.comms.TargetMetadata.windowKey(args.scope,
+            args.power_channel, metadata.current_clk_cfg, scope.sample_freq)
 
-    log.info("Trigger Window Size: %d" % window_size)
-    log.info("Trace Datatype     : %s" % str(sig_power.dtype))
+        window_size = metadata.trigger_windows.get(window_key, None)
 
-    log.info("Experiment Cycles : %d" % target.doGetExperimentCycles())
-    log.info("Experiment InstRet: %d" % target.doGetExperimentInstrRet())
-    
-    log.info("Random Bytes      : %d" % target.doRandGetLen())
-    log.info("Randomness Rate   : %d" % target.doRandGetRefreshRate())
+    if(window_size != None):
+        log.info("Trigger Window Size: %d (cached)" % window_size)
+
+    else:
+        log.info("Finding trigger window size...")
+        window_size = scass.scope.findTriggerWindowSize(
+            scope,target,power_channel)
+
+        if(window_size <= 10):
+            log.error("Failed to find window size after 10 attempts.")
+            return 1
+
+        sig_power   = scope.getRawChannelData(
+            power_channel,scope.max_samples)
+
+        log.info("Trigger Window Size: %d" % window_size)
+        log.info("Trace Datatype     : %s" % str(sig_power.dtype))
+
+        if(metadata != None):
+            metadata.trigger_windows[window_key] = window_size
+            cache.save()
+
+        log.info("Experiment Cycles : %d" % target.doGetExperimentCycles())
+        log.info("Experiment InstRet: %d" % target.doGetExperimentInstrRet())
+
+    if(metadata != None):
+        log.info("Random Bytes      : %d" % metadata.randomness_len)
+        log.info("Randomness Rate   : %d" % metadata.randomness_rate)
+    else:
+        log.info("Random Bytes      : %d" % target.doRandGetLen())
+        log.info("Randomness Rate   : %d" % target.doRandGetRefreshRate())
 
     ttest       = ttest_class(
         target,
@@ -148,6 +202,11 @@ def main(argparser,ttest_class = scass.ttest.TTestCapture):
     if(args.zero_fixed):
         ttest.zeros_as_fixed_value = True
 
+    ttest.read_output_vars = args.read_outputs
+    ttest.target_prng      = args.target_prng
+    ttest.burst_size       = args.burst
+    ttest.metadata         = metadata
+
     log.info("Initialising TTest Capture...")
 
     ttest.initialiseTTest()
@@ -166,8 +225,7 @@ def main(argparser,ttest_class = scass.ttest.TTestCapture):
             var = ttest.getVariableByName(varname)
             value_bytes = value_int.to_bytes(var.size, byteorder="little")
 
-            var.setFixedValue(value_bytes)
-            var.takeFixedValue()
+            ttest.fixed_values[varname] = value_bytes
 
             # Variables have their values sent to the target device
             # by the TTestCapture class, _assign_ttest_fixed_values
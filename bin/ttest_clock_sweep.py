@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+
+"""
+A tool script for capturing a TTest data set per target clock configuration
+"""
+
+import os
+import sys
+import argparse
+import logging as log
+
+scass_path = os.path.expandvars(
+    os.path.join(os.path.dirname(__file__),"../")
+)
+sys.path.append(scass_path)
+
+import scass
+
+def parse_args():
+    """
+    Parse command line arguments to the script
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-n","--num-traces",type=int,
+        help="Number of traces to capture per clock configuration",
+        default=10000)
+
+    parser.add_argument("-b","--baud",type=int,
+        help="Baud rate to communicate with target at",default=9600)
+
+    parser.add_argument("--negotiate-baud",action="store_true",
+        help="After the handshake, switch to the framed protocol and the "+
+             "fastest baud rate the link supports reliably")
+
+    parser.add_argument("-l", "--logfile", type=str,default=None,
+        help="Log TTest information and progress to this file.)")
+
+    parser.add_argument("--clk-cfgs",type=int,nargs="+",default=None,
+        help="Indexes of the target clock configurations to sweep, in "+
+             "order. Defaults to every configuration the target reports.")
+
+    parser.add_argument("--samples-per-cycle",type=float,default=None,
+        help="Scope samples per target clock cycle. Defaults to the scope "+
+             "configuration's sample rate over the target's starting "+
+             "clock rate.")
+
+    parser.add_argument("--num-samples",type=int,default=None,
+        help="Samples per trace. Defaults to the trigger window found "+
+             "for each clock configuration.")
+
+    parser.add_argument("--metadata-cache",type=str,default=None,
+        help="Cache target variable, clock and trigger window information "+
+             "in this file, keyed by experiment name and firmware build")
+
+    parser.add_argument("--trace-ext",type=str,default=".npy",
+        help="Extension, and so format, of the trace files.")
+
+    parser.add_argument("--zero-fixed",action="store_true",
+        help="Tie all TTest fixed values to zero")
+
+    parser.add_argument("--read-outputs",action="store_true",
+        help="Read back output variables (e.g. ciphertexts) after each trace")
+
+    parser.add_argument("--target-prng",action="store_true",
+        help="Have the target generate random inputs with its seeded PRNG "+
+             "instead of uploading them before each trace")
+
+    parser.add_argument("--burst",type=int,default=0,
+        help="Capture N traces per target command using segmented scope "+
+             "capture. Needs --target-prng for randomised inputs.")
+
+    parser.add_argument("--set-vars", type=str, nargs="+",
+        help="Set an input variable/parameter of the experiment to this "+
+             "value, as <name>=<integer>")
+
+    parser.add_argument("target",type=str,
+        help="TTY port to connect too when communicating with the target")
+
+    parser.add_argument("scope",type=str,
+        help="Scope configuration file")
+
+    parser.add_argument("power_channel",type=str,
+        help="Scope Channel ID which samples the power signal")
+
+    parser.add_argument("output_dir",type=str,
+        help="Directory to write a clk-<index>-<rate>Hz directory of "+
+             "traces, fixed/random and variable files per clock "+
+             "configuration too, and a sweep.json summary.")
+
+    return parser
+
+def main(argparser):
+    """
+    Main function for the tool script
+    parameters:
+    argparser  - instance of argparse.ArgumentParser
+    """
+    args    = argparser.parse_args()
+
+    if(args.logfile != None):
+        log.basicConfig(filename=args.logfile, filemode="w",level=log.DEBUG)
+    else:
+        log.basicConfig(level=log.DEBUG)
+
+    log.info("Connecting to %s @ %d"%(args.target,args.baud))
+
+    target  = scass.comms.Target(args.target,args.baud)
+
+    try:
+        assert(target.doHelloWorld()),"Failed target hello world handshake"
+    except Exception as e:
+        print(e)
+        return 1
+
+    if(args.negotiate_baud):
+        log.info("Negotiated baud rate: %d" % target.negotiateBaud())
+
+    log.info("Scope Configuration: %s" % args.scope)
+    scope   = scass.scope.fromConfig(args.scope)
+
+    try:
+        assert(target.doInitExperiment()),"Failed target experiment init"
+    except Exception as e:
+        print(e)
+        return 2
+
+    sweep   = scass.ttest.TTestClockSweep(
+        target,
+        scope,
+        scope.getChannel(args.power_channel),
+        args.output_dir,
+        args.num_traces,
+        clk_cfgs    = args.clk_cfgs,
+        trace_ext   = args.trace_ext
+    )
+
+    sweep.samples_per_cycle = args.samples_per_cycle
+    sweep.num_samples       = args.num_samples
+
+    if(args.metadata_cache != None):
+        sweep.cache         = scass.comms.TargetMetadataCache(
+            args.metadata_cache)
+        sweep.scope_config  = args.scope
+
+    sweep.capture_options = {
+        "zeros_as_fixed_value"  : args.zero_fixed,
+        "read_output_vars"      : args.read_outputs,
+        "target_prng"           : args.target_prng,
+        "burst_size"            : args.burst
+    }
+
+    for varset in (args.set_vars or []):
+        varname, value = varset.split("=")
+        log.info("Setting input variable %s = %s" % (varname, value))
+        sweep.fixed_values[varname] = int(value)
+
+    try:
+        summaries = sweep.run()
+    except Exception as e:
+        log.error(str(e))
+        return 1
+
+    for s in summaries:
+        log.info("Clock %d (%dHz): %d traces of %d samples at %fHz, %.1fs" % (
+            s["clk_cfg"], s["sys_clk_rate"], s["num_traces"],
+            s["num_samples"], s["sample_freq"], s["seconds"]))
+
+    log.info("Finished Successfully")
+
+    return 0
+
+
+if(__name__ == "__main__"):
+
+    argparser = parse_args()
+
+    sys.exit(main(argparser))
@@ -7,6 +7,7 @@ A tool script for running ttests on captured data.
 import os
 import sys
 import array
+import hashlib
 import argparse
 import logging as log
 
@@ -49,6 +50,12 @@ def parse_args(parser):
 
     parser.add_argument("--convolve-len",type=int,default=0,
         help="Blur together the samples in each trace based on an N length filter.")
+    parser.add_argument("--align-max-offset",type=int,default=0,
+        help="Align traces against the average trace, shifting each by at most N samples.")
+    parser.add_argument("--align-window",type=int,nargs=2,default=None,
+        help="Start and end sample of the average trace to align against.")
+    parser.add_argument("--align-min-corr",type=float,default=None,
+        help="Drop traces whose alignment correlation is below this value.")
     parser.add_argument("--subsample-factor",type=int,default=1,
         help="Subsample traces using linear interpolation before processing.")
     
@@ -61,8 +68,120 @@ def parse_args(parser):
     parser.add_argument("--graphs",action="store_true",
         help="Write out graphs of results?")
 
+    parser.add_argument("--engine",type=str,default="cpa",
+        choices=sorted(ENGINES.keys()),
+        help="Distinguisher: correlation (cpa), single bit difference of "+
+             "means (dpa) or mutual information (mia).")
+    parser.add_argument("--mia-bins",type=int,default=16,
+        help="Histogram bins per sample for --engine mia.")
+    parser.add_argument("--model",type=str,default=None,
+        choices=sorted(MODELS.keys()),
+        help="Leakage model used to compute hypotheses. Defaults to "+
+             "hw-sbox, or identity for --engine dpa.")
+    parser.add_argument("--model-bit",type=int,default=0,
+        help="S-box output bit to use with --model bit.")
+    parser.add_argument("--model-table",type=str,default=None,
+        help=".npy file of 256 leakage values for --model table.")
+    parser.add_argument("--ciphertexts",type=str,default=None,
+        help="Ciphertext output variable file for last round models. "+
+             "If not given, ciphertexts are computed from the aux data.")
+    parser.add_argument("--poi",type=str,default=None,
+        help="File of sample indexes (points of interest) to restrict the "+
+             "analysis to, e.g. from bin/snr.py")
+    parser.add_argument("--projection",type=str,default=None,
+        help="Project traces with this PCA/LDA projection (.npz) from "+
+             "bin/fit-projection.py before the analysis. Use its --poi "+
+             "option rather than this script's to restrict the samples.")
+    parser.add_argument("--second-order",type=int,nargs=4,default=None,
+        metavar=("A_START","A_END","B_START","B_END"),
+        help="Second order CPA on centered products of two sample windows.")
+    parser.add_argument("--second-order-tile",type=int,default=32,
+        help="Window A samples combined at once in second order mode.")
+    parser.add_argument("--checkpoint-every",type=int,default=0,
+        help="Record key guess correlations and ranks every N traces.")
+    parser.add_argument("--checkpoints",type=int,nargs="+",default=None,
+        help="Record key guess correlations and ranks at these trace counts.")
+    parser.add_argument("--ttd-dump",type=str,default=None,
+        help="Write checkpoint correlations, ranks and guessing entropy to this .npz file.")
+    parser.add_argument("--ttd-graph",type=str,default=None,
+        help="Write a plot of key byte ranks and guessing entropy against trace count to this file.")
+    parser.add_argument("--store",type=str,default=None,
+        help="Directory to keep per byte CPA accumulators in. Reruns resume "+
+             "from it, and only process traces added since the last run.")
+    parser.add_argument("--store-every",type=int,default=10000,
+        help="Save each byte's accumulator to --store every N traces.")
+    parser.add_argument("--scores-dump",type=str,default=None,
+        help="Write the (bytes x 256) matrix of max score per key guess to this .npy file.")
+    parser.add_argument("--enumerate",type=int,default=0,
+        help="Enumerate up to N full keys in order of likelihood, testing "+
+             "each against --known-plaintext and --known-ciphertext.")
+    parser.add_argument("--known-plaintext",type=str,default=None,
+        help="Hex plaintext block used to test enumerated keys.")
+    parser.add_argument("--known-ciphertext",type=str,default=None,
+        help="Hex ciphertext of --known-plaintext under the target key.")
+    parser.add_argument("--rank-bins",type=int,default=2048,
+        help="Histogram bins per byte when estimating the full key rank.")
+
     return parser
 
+MODELS = {
+    "hw-sbox"       : scass.cpa.CPAModelHammingWeightSbox,
+    "hd-sbox"       : scass.cpa.CPAModelHammingDistanceSbox,
+    "hw-input"      : scass.cpa.CPAModelHammingWeightD,
+    "hd-input"      : scass.cpa.CPAModelHammingDistance,
+    "identity"      : scass.cpa.CPAModelIdentity,
+    "bit"           : scass.cpa.CPAModelBit,
+    "last-round-hw" : scass.cpa.CPAModelLastRoundHW,
+    "last-round-hd" : scass.cpa.CPAModelLastRoundHD,
+    "table"         : scass.cpa.CPAModelTable,
+}
+
+
+ENGINES = {
+    "cpa"           : scass.cpa.CorrolationAnalysis,
+    "dpa"           : scass.cpa.DPAAnalysis,
+    "mia"           : scass.cpa.MIAAnalysis,
+}
+
+
+def get_model(args):
+    """
+    Construct the leakage model selected by the command line arguments.
+    """
+    if(args.model is None):
+        args.model = "identity" if args.engine == "dpa" else "hw-sbox"
+
+    if(args.model == "bit"):
+        return scass.cpa.CPAModelBit(args.model_bit)
+
+    if(args.model == "table"):
+        if(args.model_table is None):
+            raise ValueError("--model table requires --model-table")
+        return scass.cpa.CPAModelTable(np.load(args.model_table))
+
+    return MODELS[args.model]()
+
+
+def get_ciphertexts(args, ts_set):
+    """
+    Return the DxN array of ciphertexts to attack with a last round
+    model, either loaded from the --ciphertexts output variable file or
+    computed by encrypting the key and message held in the aux data.
+    """
+    if(args.ciphertexts):
+        log.info("Loading ciphertexts: %s" % args.ciphertexts)
+        ciphertexts = scass.trace.loadTracesFromDisk(args.ciphertexts)
+        return ciphertexts[0:ts_set.num_traces]
+
+    log.info("Computing ciphertexts from aux data key and message...")
+
+    amat = ts_set.auxDataAs2dArray()
+    key  = amat[:, 0:args.key_bytes]
+    msg  = amat[:, args.key_bytes:args.key_bytes+args.message_bytes]
+
+    return scass.cpa.AES.encrypt(key, msg)
+
+
 def write_graphs(byte_guess, byte_R, save_path, b):
     fig = plt.figure()
     plt.clf()
@@ -82,12 +201,43 @@ def write_graphs(byte_guess, byte_R, save_path, b):
     fig.clf()
     plt.close(fig)
 
-def cpa_process_byte(b, cpa_byte, save_path, store_graphs, byteCallback):
+def get_store(args, cpa_byte, powermodel):
+    """
+    Return a CPAResultStore for --store, keyed on everything other than
+    the trace and input data which changes the results. The data itself
+    is fingerprinted by the store, once for all bytes.
+    """
+    parameters = {
+        "engine"    : args.engine,
+        "model"     : type(powermodel).__name__,
+        "table"     : hashlib.sha256(powermodel.table.tobytes()).hexdigest(),
+        "K"         : cpa_byte.K,
+        "samples"   : hashlib.sha256(cpa_byte.samples.tobytes()).hexdigest()
+    }
+
+    log.info("Storing results in %s" % args.store)
+
+    store = scass.cpa.CPAResultStore(args.store, parameters)
+
+    # Once here, rather than in every byte's worker process.
+    store.fingerprintData(cpa_byte.tmat[0:cpa_byte.D],
+        cpa_byte.msgmat[0:cpa_byte.D])
+
+    return store
+
+
+def cpa_process_byte(b, cpa_byte, save_path, store_graphs, byteCallback,
+                     store = None, store_every = 10000):
 
     #log.info("Computing Byte guess for byte %d" % b)
-    V                               = cpa_byte.computeV(b)
-    H                               = cpa_byte.computeH(V,b)
-    byte_guess, byte_conf, byte_R   = cpa_byte.computeR(H)
+    H                               = cpa_byte.computeHypotheses(b)
+
+    if(store is None):
+        byte_guess, byte_conf, byte_R   = cpa_byte.computeR(H)
+    else:
+        byte_guess, byte_conf, byte_R, _= cpa_byte.computeResumable(
+            H, b, store, chunk_size=store_every)
+    byte_scores                     = np.max(byte_R, axis=1)
 
 
     if(byteCallback != None):
@@ -104,13 +254,172 @@ def cpa_process_byte(b, cpa_byte, save_path, store_graphs, byteCallback):
         byte_conf
     ))
     
-    return (byte_guess, byte_conf)
+    return (byte_guess, byte_conf, byte_scores)
+
+
+def cpa_process_byte_evolution(b, cpa_byte, checkpoints, store = None,
+                               store_every = 10000):
+    """
+    As cpa_process_byte, but accumulates the correlation in trace order
+    and returns the max correlation of every guess at each checkpoint.
+    """
+    H                               = cpa_byte.computeHypotheses(b)
+
+    if(store is None):
+        byte_guess, byte_conf, byte_R, evolution = \
+            cpa_byte.computeEvolution(H, checkpoints)
+    else:
+        byte_guess, byte_conf, byte_R, evolution = \
+            cpa_byte.computeResumable(H, b, store, checkpoints, store_every)
+
+    del byte_R
+    
+    log.info("Computing guesses for byte %d - Byte: %s (%f)" %(
+        b,
+        hex(byte_guess),
+        byte_conf
+    ))
+
+    return (byte_guess, byte_conf, evolution)
+
+
+def get_checkpoints(args, num_traces):
+    """
+    Return the sorted list of trace counts at which to record the
+    key guess correlations, or None if no checkpoints were requested.
+    """
+    checkpoints = set()
+
+    if(args.checkpoints):
+        checkpoints.update([c for c in args.checkpoints if c <= num_traces])
+
+    if(args.checkpoint_every > 0):
+        checkpoints.update(range(args.checkpoint_every, num_traces+1,
+            args.checkpoint_every))
+
+    if(len(checkpoints) == 0):
+        return None
+
+    checkpoints.add(num_traces)
+
+    return sorted(checkpoints)
+
+
+def report_key_scores(args, cpa_byte, scores, expected_key, last_round):
+    """
+    Post-process the full matrix of key guess scores: estimate the rank
+    of the expected key and/or enumerate full keys against a known
+    plaintext / ciphertext pair.
+
+    scores - np.ndarray
+        (bytes, K) array of the max score of every key guess.
+    """
+    if(args.scores_dump):
+        log.info("Writing key guess scores to %s" % args.scores_dump)
+        np.save(args.scores_dump, scores)
+
+    if(scores.shape[0] != 16 or args.engine == "dpa"):
+        if(args.enumerate > 0 or expected_key != ""):
+            log.info("Key enumeration and rank estimation need all 16 "+
+                "bytes of correlation or mutual information scores.")
+        return
+
+    kind      = "mutual-information" if args.engine == "mia" else "correlation"
+    log_probs = scass.attacks.scoresToLogProbabilities(
+        scores, cpa_byte.D, kind=kind)
+
+    if(expected_key != ""):
+        low, est, high = scass.attacks.estimateRank(
+            log_probs, expected_key, num_bins=args.rank_bins)
+        log.info("Estimated log2 key rank: %.2f (%.2f <= rank <= %.2f)" % (
+            est, low, high))
+
+    if(args.enumerate > 0):
+
+        if(args.known_plaintext is None or args.known_ciphertext is None):
+            log.error("--enumerate needs --known-plaintext and --known-ciphertext")
+            return
+
+        log.info("Enumerating up to %d keys..." % args.enumerate)
+
+        found = scass.attacks.searchKey(
+            log_probs,
+            bytes.fromhex(args.known_plaintext.replace("0x","")),
+            bytes.fromhex(args.known_ciphertext.replace("0x","")),
+            max_keys    = args.enumerate,
+            last_round  = last_round
+        )
+
+        if(found is None):
+            log.info("Key not found in the first %d candidates" % args.enumerate)
+        else:
+            log.info("Found key %s after %d candidates" % (
+                found[0].hex(), found[1] + 1))
+
+
+def report_evolution(args, checkpoints, evolution, expected_key):
+    """
+    Log and optionally save the traces-to-disclosure, per byte ranks and
+    guessing entropy for the checkpointed correlations.
+
+    evolution - np.ndarray
+        (bytes, checkpoints, K) array of max correlation per key guess.
+    """
+    bytes_guessed = evolution.shape[0]
+    results       = {
+        "checkpoints": np.array(checkpoints),
+        "max_corr"   : evolution
+    }
+
+    if(expected_key != ""):
+
+        ranks = np.array([
+            scass.cpa.KeyRank.guessRanks(evolution[b], expected_key[b])
+            for b in range(0, bytes_guessed)
+        ])
+
+        ge    = scass.cpa.KeyRank.guessingEntropy(ranks)
+        cost  = scass.cpa.KeyRank.log2SearchCost(ranks)
+        ttd   = scass.cpa.KeyRank.tracesToDisclosure(checkpoints, ranks)
+
+        for i, n in enumerate(checkpoints):
+            log.info("%8d traces: GE %7.2f, log2 independent-enumeration "
+                "search cost %6.2f, ranks %s" % (
+                n, ge[i], cost[i], ranks[:,i].tolist()))
+
+        if(ttd is None):
+            log.info("Traces to disclosure: not reached")
+        else:
+            log.info("Traces to disclosure: %d" % ttd)
+
+        results["ranks"]            = ranks
+        results["guessing_entropy"] = ge
+        results["log2_search_cost"] = cost
+        results["ttd"]              = -1 if ttd is None else ttd
+
+        if(args.ttd_graph):
+            fig = plt.figure()
+            plt.clf()
+            plt.subplot(211)
+            plt.plot(checkpoints, ranks.transpose(), linewidth=0.5)
+            plt.ylabel("Byte rank")
+            plt.subplot(212)
+            plt.plot(checkpoints, ge)
+            plt.ylabel("Guessing entropy")
+            plt.xlabel("Traces")
+            fig.set_size_inches(10,8,forward=True)
+            plt.savefig(args.ttd_graph)
+            plt.close(fig)
+
+    if(args.ttd_dump):
+        log.info("Writing checkpoint results to %s" % args.ttd_dump)
+        np.savez(args.ttd_dump, **results)
 
 
 def main(
     args,
     analyser   = scass.cpa.CorrolationAnalysis,
-    powermodel = scass.cpa.CPAModelHammingWeightD,
+    powermodel = None,
     byteCallback = None
     ):
     """
@@ -140,21 +449,77 @@ def main(
         log.info("Convolving traces with %d-long filter..."%args.convolve_len)
         ts_set.convolveTracesUniform(args.convolve_len)
 
+    if(args.align_max_offset > 0):
+        assert(args.ciphertexts is None or args.align_min_corr is None), \
+            "--align-min-corr may drop traces, so cannot use --ciphertexts"
+        log.info("Aligning traces with max offset %d..."%args.align_max_offset)
+        ts_set.alignTraces(
+            args.align_max_offset,
+            window      = args.align_window,
+            min_corr    = args.align_min_corr,
+            num_threads = args.threads_corrolation
+        )
+        log.info("%d traces remain after alignment" % ts_set.num_traces)
+
     if(args.subsample_factor > 1):
         log.info("Subsampling traces with %d factor..."%args.subsample_factor)
         ts_set.subsampleTraces(args.subsample_factor)
 
+    if(powermodel is None):
+        powermodel = get_model(args)
+    elif(isinstance(powermodel, type)):
+        powermodel = powermodel()
+
+    log.info("Leakage model     : %s" % type(powermodel).__name__)
+
+    inputs = None
+
+    if(powermodel.attacks_last_round):
+        inputs = get_ciphertexts(args, ts_set)
+
+    if(args.engine != "cpa"):
+        analyser = ENGINES[args.engine]
+
+    log.info("Engine            : %s" % analyser.__name__)
+
     cpa_byte = analyser(
         ts_set,
         keyBytes=args.key_bytes,
-        messageBytes=args.message_bytes
+        messageBytes=args.message_bytes,
+        model=powermodel,
+        inputs=inputs
     )
+
+    if(args.engine == "mia"):
+        cpa_byte.num_bins = args.mia_bins
     
     cpa_byte.num_threads = args.threads_corrolation
 
+    assert(not (args.poi and args.projection)), \
+        "--poi cannot be combined with --projection. Pass --poi to "+\
+        "bin/fit-projection.py instead, so the projection selects them."
+
+    if(args.poi):
+        poi = scass.trace.loadTracesFromDisk(args.poi)
+        log.info("Restricting analysis to %d points of interest" % poi.size)
+        cpa_byte.selectSamples(poi)
+
+    if(args.projection):
+        projection = scass.trace.Projection.load(args.projection)
+        log.info("Projecting traces onto %d components" % (
+            projection.num_components))
+        cpa_byte.projectTraces(projection)
+
     if(args.max_traces):
         cpa_byte.max_traces = args.max_traces
 
+    if(args.second_order):
+        a0, a1, b0, b1 = args.second_order
+        log.info("Second order CPA on windows [%d,%d) x [%d,%d)" % (
+            a0, a1, b0, b1))
+        cpa_byte.second_order       = ((a0, a1), (b0, b1))
+        cpa_byte.second_order_tile  = args.second_order_tile
+
     total_threads = args.threads_byte * args.threads_corrolation
     
     log.info("Guessing upto %d bytes" % bytes_to_guess)
@@ -170,21 +535,76 @@ def main(
     byte_guesses    = [0] * bytes_to_guess
     
     byte_confidence = [0.0] * bytes_to_guess
-       
+
+    expected_key = ""
+
+    if(args.expected_key != ""):
+        hexstr = args.expected_key
+        if(hexstr.startswith("0x")):
+            hexstr = hexstr[2:]
+        expected_key = bytes.fromhex(hexstr)
+
+        if(powermodel.attacks_last_round):
+            log.info("Expected Cipher Key: %s" % expected_key.hex())
+            expected_key = bytes(
+                scass.cpa.AES.expandKey(expected_key)[0,10])
+
+    checkpoints  = get_checkpoints(args, cpa_byte.D)
+
+    store        = None
+
+    if(args.store):
+        assert(args.engine == "cpa" and args.second_order is None), \
+            "--store only supports first order CPA"
+        store = get_store(args, cpa_byte, powermodel)
+
     map_arguments = zip(
         range(0, bytes_to_guess),
         repeat(cpa_byte),
         repeat(args.save_path),
         repeat(args.graphs),
         repeat(byteCallback),
+        repeat(store),
+        repeat(args.store_every),
     )
 
-    if(args.threads_byte == 1):
+    if(checkpoints != None):
+
+        log.info("Recording %d checkpoints" % len(checkpoints))
+
+        evolution_arguments = zip(
+            range(0, bytes_to_guess),
+            repeat(cpa_byte),
+            repeat(checkpoints),
+            repeat(store),
+            repeat(args.store_every)
+        )
+        
+        if(args.threads_byte == 1):
+            results = [cpa_process_byte_evolution(*a)
+                for a in evolution_arguments]
+        else:
+            with Pool(args.threads_byte) as p:
+                results = p.starmap(cpa_process_byte_evolution,
+                    evolution_arguments)
+
+        for i in range(0, bytes_to_guess):
+            byte_guesses[i], byte_confidence[i], _ = results[i]
 
-        for b,c,s,g,cb in map_arguments:
-            guess,conf = cpa_process_byte(b,c,s,g,cb)
+        evolution = np.stack([r[2] for r in results])
+        scores    = evolution[:, -1]
+
+        report_evolution(args, checkpoints, evolution, expected_key)
+
+    elif(args.threads_byte == 1):
+
+        scores = np.zeros((bytes_to_guess, cpa_byte.K))
+
+        for b,c,s,g,cb,st,se in map_arguments:
+            guess,conf,byte_scores = cpa_process_byte(b,c,s,g,cb,st,se)
             byte_guesses[b] = guess
             byte_confidence[b] = conf
+            scores[b] = byte_scores
 
     else:
     
@@ -193,11 +613,13 @@ def main(
             results = p.starmap(cpa_process_byte, map_arguments)
 
             for i in range(0, bytes_to_guess):
-                bg, bc              = results[i]
+                bg, bc, _           = results[i]
                 byte_guesses[i]     = bg
                 byte_confidence[i]  = bc
 
-    byte_guess = array.array('B',byte_guesses).tostring().hex()
+            scores = np.stack([r[2] for r in results])
+
+    byte_guess = array.array('B',byte_guesses).tobytes().hex()
 
     log.info("Byte Confidence: %s" % str(byte_confidence))
     
@@ -205,14 +627,12 @@ def main(
     
     log.info("Byte Key Guess: %s" % byte_guess)
 
-    expected_key = ""
+    if(powermodel.attacks_last_round and bytes_to_guess == 16):
+        cipher_key = scass.cpa.AES.invertKeySchedule(byte_guesses)[0]
+        log.info("Cipher Key Guess: %s" % bytes(cipher_key).hex())
 
-    if(args.expected_key != ""):
-        hexstr = args.expected_key
-        if(hexstr.startswith("0x")):
-            hexstr = hexstr[2:]
-        expected_key = bytes.fromhex(hexstr)
-        log.info("Expected Key  : %s" % hexstr)
+    if(expected_key != ""):
+        log.info("Expected Key  : %s" % expected_key.hex())
 
         byte_distances = [0] * bytes_to_guess
 
@@ -225,6 +645,9 @@ def main(
 
         log.info("Score: Byte: %03f" % byte_score)
 
+    report_key_scores(args, cpa_byte, scores, expected_key,
+        powermodel.attacks_last_round)
+
     log.info("--- Finish ---")
     
 
@@ -4,4 +4,4 @@ from . import comms
 from . import trace
 from . import ttest
 from . import cpa
-
+from . import attacks
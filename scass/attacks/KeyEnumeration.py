@@ -0,0 +1,209 @@
+
+"""
+Post-processing of per-byte key guess scores: conversion to
+log-probabilities, optimal key enumeration and key rank estimation.
+
+All functions take a (bytes, K) matrix with one row of scores per key
+byte, e.g. the max absolute correlation of every guess from cpa.py.
+"""
+
+import heapq
+
+import numpy as np
+import pyaes
+
+from ..cpa import AES
+
+def scoresToLogProbabilities(scores, num_traces, kind = "correlation"):
+    """
+    Convert a (bytes, K) matrix of key guess scores into per-byte
+    normalised log-probabilities, so a given gap in score counts for
+    more with more traces.
+
+    kind - str
+        "correlation" for absolute correlation coefficients, which uses
+        the Gaussian linear model likelihood -num_traces/2 * log(1 - r^2).
+        "mutual-information" for mutual information in bits, which uses
+        the log-likelihood ratio num_traces * ln(2) * MI.
+    """
+    s   = np.asarray(scores, dtype=np.float64)
+
+    if(kind == "correlation"):
+        r   = np.clip(s, 0, 1 - 1e-12)
+        ll  = -0.5 * num_traces * np.log1p(-r * r)
+    elif(kind == "mutual-information"):
+        ll  = num_traces * np.log(2) * s
+    else:
+        raise ValueError("Unknown score kind: %s" % kind)
+
+    m   = np.max(ll, axis=1, keepdims=True)
+
+    return ll - m - np.log(np.sum(np.exp(ll - m), axis=1, keepdims=True))
+
+
+def enumerateKeys(log_probs, max_keys = None):
+    """
+    Yield (key bytes, log probability) tuples for every full key, in order of
+    decreasing probability, i.e. optimal key enumeration.
+
+    A key is a vector of indexes into each byte's candidates sorted by
+    decreasing probability. Starting from the all-zero vector, a key
+    with last non-zero position p generates successors by incrementing
+    any position >= p, so every vector is generated exactly once and
+    never before its parent. A priority queue then pops keys in order.
+
+    log_probs - np.ndarray
+        (bytes, K) matrix of log-probabilities, or any scores which add
+        across bytes.
+    max_keys - int or None
+        Stop after this many keys.
+    """
+    lp      = np.asarray(log_probs, dtype=np.float64)
+    nbytes  = lp.shape[0]
+    K       = lp.shape[1]
+
+    order   = np.argsort(-lp, axis=1, kind="stable")
+
+    # The inner loop runs once per key, so use plain lists rather than
+    # indexing numpy arrays element by element.
+    s_lp    = np.take_along_axis(lp, order, axis=1).tolist()
+    order   = order.tolist()
+
+    start   = (0,) * nbytes
+    heap    = [(-sum(r[0] for r in s_lp), start, 0)]
+    count   = 0
+
+    while(heap and (max_keys is None or count < max_keys)):
+
+        neg_lp, idx, last = heapq.heappop(heap)
+
+        yield (bytes([order[b][i] for b, i in enumerate(idx)]), -neg_lp)
+
+        count += 1
+
+        for j in range(last, nbytes):
+
+            i = idx[j]
+
+            if(i + 1 >= K):
+                continue
+
+            heapq.heappush(heap, (
+                neg_lp + s_lp[j][i] - s_lp[j][i + 1],
+                idx[:j] + (i + 1,) + idx[j+1:],
+                j
+            ))
+
+
+def searchKey(
+        log_probs,
+        plaintext,
+        ciphertext,
+        max_keys    = 1 << 20,
+        last_round  = False,
+        batch_size  = 4096
+    ):
+    """
+    Enumerate keys in order of decreasing probability until one encrypts
+    plaintext to ciphertext under AES-128. Candidates are tested in
+    batches with the vectorised AES, and a match is confirmed with pyaes.
+
+    plaintext, ciphertext - bytes
+        A known plaintext / ciphertext pair.
+    last_round - bool
+        If True, the scores are for the last round key, which is
+        converted to the cipher key before testing.
+    batch_size - int
+        Number of candidates tested with each vectorised encryption.
+
+    Returns (key, rank) where rank is the number of keys tried before it,
+    or None if no key was found within max_keys.
+    """
+    pt      = np.frombuffer(bytes(plaintext) , dtype=np.uint8)
+    ct      = np.frombuffer(bytes(ciphertext), dtype=np.uint8)
+    tried   = 0
+    batch   = []
+
+    def check(batch):
+        keys = np.frombuffer(b"".join(batch), dtype=np.uint8).reshape(
+            len(batch), -1)
+        if(last_round):
+            keys = AES.invertKeySchedule(keys)
+        match = np.all(AES.encrypt(keys, np.tile(pt, (len(batch),1))) == ct,
+            axis=1)
+        for h in np.nonzero(match)[0]:
+            key = bytes(keys[h])
+            if(bytes(pyaes.AES(key).encrypt(pt.tolist())) == ct.tobytes()):
+                return (key, int(h))
+        return None
+
+    for key, lp in enumerateKeys(log_probs, max_keys):
+
+        batch.append(key)
+
+        if(len(batch) == batch_size):
+            found = check(batch)
+            if(found):
+                return (found[0], tried + found[1])
+            tried += len(batch)
+            batch  = []
+
+    if(batch):
+        found = check(batch)
+        if(found):
+            return (found[0], tried + found[1])
+
+    return None
+
+
+def estimateRank(log_probs, key, num_bins = 2048):
+    """
+    Estimate the rank of a known key with histogram convolution. Each
+    byte's log-probabilities are put into histograms with a shared bin
+    width, and the histograms are convolved to give the distribution of
+    full key log-probabilities. Binning introduces an error of at most
+    one bin width per byte, which gives the bounds.
+
+    key - bytes or array
+        The correct key, one byte per row of log_probs.
+
+    Returns (low, estimate, high) as log2 of the number of keys more
+    probable than the correct key.
+    """
+    lp      = np.asarray(log_probs, dtype=np.float64)
+    key     = np.asarray(bytearray(key) if isinstance(key, bytes) else key,
+        dtype=np.intp)
+    nbytes  = lp.shape[0]
+
+    # Very unlikely guesses would stretch the bins, so clip them. They
+    # only ever add to the count of keys less likely than the correct one.
+    floor   = max(np.min(lp), np.max(lp) - 100.0)
+    lp      = np.maximum(lp, floor)
+
+    lo      = np.min(lp)
+    width   = (np.max(lp) - lo) / (num_bins - 1)
+    width   = width if width > 0 else 1.0
+
+    hist    = np.array([1.0])
+    key_bin = 0
+
+    for b in range(0, nbytes):
+        idx      = np.floor((lp[b] - lo) / width).astype(np.intp)
+        h        = np.bincount(idx, minlength=num_bins).astype(np.float64)
+        hist     = np.convolve(hist, h)
+        key_bin += idx[key[b]]
+
+    # Bin i of hist holds keys whose summed bin index is i. The correct
+    # key is in key_bin; each byte can be misplaced by up to one bin.
+    above   = np.cumsum(hist[::-1])[::-1]
+
+    def log2_rank(i):
+        i = min(max(i, 0), hist.size - 1)
+        n = above[i + 1] if i + 1 < hist.size else 0.0
+        return np.log2(n + 1)
+
+    return (
+        log2_rank(key_bin + nbytes),
+        log2_rank(key_bin),
+        log2_rank(key_bin - nbytes)
+    )
@@ -0,0 +1,339 @@
+
+import logging as log
+
+import numpy as np
+
+from scipy.linalg import cholesky
+from scipy.linalg import solve_triangular
+
+from ..trace import iterTracesFromDisk
+from ..cpa.CPAModel import CPAModelIdentity
+
+class TemplateBuilder(object):
+    """
+    Accumulates profiling traces with known class labels (e.g. the first
+    round S-box output byte) into per-class sums and a pooled scatter
+    matrix over a set of points of interest, one chunk at a time.
+    """
+
+    def __init__(self, samples, num_classes = 256):
+        """
+        Create a new, empty template builder.
+
+        samples - np.ndarray
+            Indexes of the points of interest to build templates over,
+            e.g. from scass.cpa.selectPointsOfInterest. The covariance
+            matrix is len(samples) squared, so keep this small.
+        num_classes - int
+            Number of possible class labels.
+        """
+        self.samples    = np.asarray(samples, dtype=np.int64)
+        self._classes   = num_classes
+        self._n         = 0
+
+        P               = self.samples.size
+
+        # Offset subtracted from every trace before it is accumulated,
+        # taken from the mean of the first chunk.
+        self._t_off     = None
+
+        self._count     = np.zeros(num_classes, dtype=np.int64)
+        self._sum       = np.zeros((num_classes, P))
+        self._sum_xx    = np.zeros((P, P))
+
+
+    def addTraces(self, labels, T):
+        """
+        Add a chunk of profiling traces and their class labels.
+
+        labels - np.ndarray
+            Length D array of integer class labels.
+        T - np.ndarray
+            A DxT matrix of full length traces, one trace per row. Only
+            the points of interest are used.
+        """
+        labels  = np.asarray(labels).reshape(-1)
+        D       = T.shape[0]
+
+        assert(labels.shape[0] == D), "%d labels but %d traces" % (
+            labels.shape[0], D)
+
+        if(D == 0):
+            return
+
+        X       = np.asarray(T[:, self.samples], dtype=np.float64)
+
+        if(self._n == 0):
+            self._t_off = np.mean(X, axis=0)
+
+        X      -= self._t_off
+
+        order   = np.argsort(labels, kind="stable")
+        labels  = labels[order]
+        X       = X[order]
+
+        classes, starts = np.unique(labels, return_index=True)
+
+        self._sum   [classes] += np.add.reduceat(X, starts, axis=0)
+        self._count [classes] += np.diff(np.append(starts, D))
+        self._sum_xx          += np.dot(X.T, X)
+
+        self._n    += D
+
+
+    def build(self):
+        """
+        Return the Templates for all traces added so far. Classes with no
+        profiling traces get a mean of NaN and can never be matched.
+        """
+        used    = self._count > 0
+
+        assert(np.count_nonzero(used) > 1), "Need at least two classes"
+
+        n       = self._count[used].astype(np.float64)
+
+        means   = np.full(self._sum.shape, np.nan)
+        means[used] = self._sum[used] / n[:,np.newaxis]
+
+        # Pooled scatter: sum over classes of sum (x - mu_c)(x - mu_c)^T
+        scatter = self._sum_xx - np.dot(
+            (means[used] * n[:,np.newaxis]).T, means[used])
+
+        cov     = scatter / (self._n - np.count_nonzero(used))
+
+        return Templates(
+            self.samples,
+            means + self._t_off,
+            cov,
+            self._count.copy()
+        )
+
+
+    @property
+    def num_traces(self):
+        """Number of profiling traces accumulated so far"""
+        return self._n
+
+    @property
+    def class_counts(self):
+        """Number of profiling traces accumulated for each class label"""
+        return self._count
+
+
+class Templates(object):
+    """
+    A set of Gaussian templates, one mean vector per class and a single
+    pooled covariance matrix, over a set of points of interest.
+    """
+
+    def __init__(self, samples, means, cov, counts = None):
+        """
+        samples - np.ndarray
+            Length P array of point of interest sample indexes.
+        means - np.ndarray
+            (num_classes, P) array of class means.
+        cov - np.ndarray
+            PxP pooled covariance matrix.
+        counts - np.ndarray
+            Optional number of profiling traces per class.
+        """
+        self.samples    = np.asarray(samples, dtype=np.int64)
+        self.means      = np.asarray(means, dtype=np.float64)
+        self.cov        = np.asarray(cov  , dtype=np.float64)
+        self.counts     = counts
+
+        P               = self.samples.size
+
+        assert(self.means.shape[1] == P and self.cov.shape == (P, P)), \
+            "Template shapes do not match %d points of interest" % P
+
+        # cov = L L^T. Whitening with L^-1 turns the Mahalanobis distance
+        # into a Euclidean one, so every trace can be matched against
+        # every class with a single matrix product.
+        self._chol      = cholesky(self.cov, lower=True)
+
+        valid           = ~np.isnan(self.means).any(axis=1)
+
+        self._w_means   = np.zeros(self.means.shape)
+        self._w_means[valid] = solve_triangular(
+            self._chol, self.means[valid].T, lower=True).T
+        self._w_sq      = np.einsum("ij,ij->i", self._w_means, self._w_means)
+        self._w_sq[~valid] = np.inf
+
+
+    @property
+    def num_classes(self):
+        """Number of classes"""
+        return self.means.shape[0]
+
+
+    def logLikelihoods(self, T):
+        """
+        Return the DxC matrix of log likelihoods of each of the D traces
+        in T (full length, one per row) belonging to each class. Terms
+        common to every class are dropped, so values are only comparable
+        between classes.
+        """
+        X   = np.asarray(T[:, self.samples], dtype=np.float64)
+        W   = solve_triangular(self._chol, X.T, lower=True).T
+
+        # -0.5 * |w - m|^2, expanded. |w|^2 is the same for every class
+        # so is left out.
+        return np.dot(W, self._w_means.T) - 0.5 * self._w_sq
+
+
+    def keyScores(self, T, d, model = None):
+        """
+        Return a length K array of summed log likelihoods for every key
+        guess, over the D traces in T.
+
+        d - np.ndarray
+            Length D array of input bytes, one per trace.
+        model - scass.cpa.CPAModel
+            Maps (input byte, key guess) to a class label. Defaults to
+            the first round S-box output, sbox[d ^ k].
+        """
+        if(model is None):
+            model = CPAModelIdentity()
+
+        ll      = self.logLikelihoods(T)
+        classes = model.hypotheses(d).astype(np.intp)
+
+        return np.sum(np.take_along_axis(ll, classes, axis=1), axis=0)
+
+
+    def save(self, filepath):
+        """
+        Save the templates to an .npz file.
+        """
+        np.savez(filepath,
+            samples = self.samples,
+            means   = self.means,
+            cov     = self.cov,
+            counts  = np.array([]) if self.counts is None else self.counts
+        )
+
+
+    @staticmethod
+    def load(filepath):
+        """
+        Load templates saved with Templates.save
+        """
+        data    = np.load(filepath)
+        counts  = data["counts"]
+
+        return Templates(
+            data["samples"],
+            data["means"],
+            data["cov"],
+            None if counts.size == 0 else counts
+        )
+
+
+def buildTemplatesFromDisk(
+        filepath,
+        labels,
+        samples,
+        num_classes     = 256,
+        chunk_size      = 10000,
+        select          = None,
+        preprocess      = None
+    ):
+    """
+    Stream the profiling traces stored at filepath through a
+    TemplateBuilder and return the built Templates. See
+    scass.cpa.accumulateFromDisk for the meaning of select and
+    preprocess.
+    """
+    builder = TemplateBuilder(samples, num_classes)
+    labels  = np.asarray(labels).reshape(-1)
+    first   = 0
+
+    for chunk in iterTracesFromDisk(filepath, chunk_size):
+
+        last    = first + chunk.shape[0]
+        l_chunk = labels[first:last]
+
+        if(select is not None):
+            sel     = select[first:last]
+            chunk   = chunk[sel]
+            l_chunk = l_chunk[sel]
+
+        first   = last
+
+        if(preprocess is not None):
+            chunk = preprocess(chunk)
+
+        builder.addTraces(l_chunk, chunk)
+
+    log.info("Built templates from %d profiling traces" % builder.num_traces)
+
+    return builder.build()
+
+
+def matchTemplatesFromDisk(
+        filepath,
+        templates,
+        d,
+        model           = None,
+        chunk_size      = 10000,
+        select          = None,
+        preprocess      = None,
+        checkpoints     = None
+    ):
+    """
+    Stream the attack traces stored at filepath and sum the log
+    likelihood of every key guess over them.
+
+    d - np.ndarray
+        Length D array of input bytes, one per trace in the file.
+    checkpoints - list of int or None
+        Optional sorted trace counts at which to record the scores.
+
+    Returns a tuple (scores, history) where scores is the length K
+    array of summed log likelihoods over all traces, and history is a
+    (len(checkpoints), K) array of the scores at each checkpoint.
+    """
+    d           = np.asarray(d).reshape(-1)
+    checkpoints = [] if checkpoints is None else list(checkpoints)
+    scores      = None
+    history     = []
+    first       = 0
+    used        = 0
+
+    for chunk in iterTracesFromDisk(filepath, chunk_size):
+
+        last    = first + chunk.shape[0]
+        d_chunk = d[first:last]
+
+        if(select is not None):
+            sel     = select[first:last]
+            chunk   = chunk[sel]
+            d_chunk = d_chunk[sel]
+
+        first   = last
+
+        if(preprocess is not None):
+            chunk = preprocess(chunk)
+
+        # Split the chunk at any checkpoints which fall inside it.
+        cuts    = [c - used for c in checkpoints
+            if c > used and c < used + chunk.shape[0]]
+
+        start   = 0
+
+        for end in cuts + [chunk.shape[0]]:
+
+            if(end > start):
+                s       = templates.keyScores(
+                    chunk[start:end], d_chunk[start:end], model)
+                scores  = s if scores is None else scores + s
+
+            if(used + end in checkpoints and scores is not None):
+                history.append(scores.copy())
+
+            start   = end
+
+        used   += chunk.shape[0]
+
+    return (scores, np.array(history))
@@ -0,0 +1,10 @@
+
+from .TemplateAttack      import TemplateBuilder
+from .TemplateAttack      import Templates
+from .TemplateAttack      import buildTemplatesFromDisk
+from .TemplateAttack      import matchTemplatesFromDisk
+
+from .KeyEnumeration      import scoresToLogProbabilities
+from .KeyEnumeration      import enumerateKeys
+from .KeyEnumeration      import searchKey
+from .KeyEnumeration      import estimateRank
@@ -0,0 +1,120 @@
+
+import asyncio
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .Target import Target
+from .Target import TargetCommandError
+
+class AsyncTarget(object):
+    """
+    asyncio interface to a Target, so one event loop can keep several
+    targets (and scopes, see scass.scope.AsyncScope) busy at once.
+
+    Responses are already read by the Target's background threads, so
+    waiting for a command never blocks the event loop: its completion
+    is handed to an asyncio future. Writes to the serial port, which
+    block until sent, happen on a writer thread owned by this object,
+    one at a time and in the order they were submitted.
+
+    Every Target command which takes a wait argument is available as a
+    coroutine of the same name, e.g. await atarget.doHelloWorld(). These
+    always raise a TargetCommandError on failure, whatever the Target's
+    exception_on_command_fail. Use send to pipeline commands.
+    """
+
+    # Target methods made available as coroutines.
+    COMMANDS = [
+        "doInitExperiment", "doRunRandomExperiment", "doRunFixedExperiment",
+        "doRunBurst", "doGetExperiementName", "doGetExperimentCycles",
+        "doGetExperimentInstrRet", "doGetVarNum", "doGetVarInfo",
+        "doGetVarValue", "doSetVarValue", "doGetVarFixedValue",
+        "doSetVarFixedValue", "doRandGetLen", "doRandGetRefreshRate",
+        "doRandSeed", "doPRNGSeed", "doGetSysClkInfo", "doSetSysClk",
+        "doHelloWorld", "doSetBaud", "doConfirmBaud", "doEcho",
+        "doGetBuildId"]
+
+    def __init__(self, target):
+        """
+        target - scass.comms.Target
+            An open target connection. Other code may keep using it
+            directly, e.g. for setup, but not while commands submitted
+            here are in flight.
+        """
+        assert(isinstance(target, Target))
+
+        self.target     = target
+
+        self._executor  = ThreadPoolExecutor(max_workers = 1,
+            thread_name_prefix = "scass-target")
+
+
+    def __getattr__(self, name):
+        if(name not in AsyncTarget.COMMANDS):
+            raise AttributeError("AsyncTarget has no attribute '%s'" % name)
+
+        method = getattr(self.target, name)
+
+        async def command(*args, **kwargs):
+            return await (await self.send(method, *args, **kwargs))
+
+        command.__name__ = name
+        command.__doc__  = method.__doc__
+
+        return command
+
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs), any blocking function which uses the
+        target, on the writer thread and return its result. E.g. the
+        setup steps of a capture.
+        """
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self._executor,
+            functools.partial(func, *args, **kwargs))
+
+
+    async def send(self, method, *args, **kwargs):
+        """
+        Send a command, where method is one of the Target's do*
+        methods, and return once it is written. Returns an asyncio
+        future for its result, so several commands can be in flight:
+
+            run = await atarget.send(target.doRunFixedExperiment)
+            ...
+            await run
+        """
+        cmd     = await self.call(method, *args, wait = False, **kwargs)
+
+        self.target.untrackCommand(cmd)
+
+        loop    = asyncio.get_running_loop()
+        future  = loop.create_future()
+
+        def finished(cmd):
+            loop.call_soon_threadsafe(AsyncTarget._resolve, future, cmd)
+
+        cmd.addDoneCallback(finished)
+
+        return future
+
+
+    @staticmethod
+    def _resolve(future, cmd):
+        """Complete future with the result or error of cmd."""
+        if(future.cancelled()):
+            return
+
+        try:
+            future.set_result(cmd.result(0))
+        except TargetCommandError as e:
+            future.set_exception(e)
+
+
+    async def close(self):
+        """Close the target connection and stop the writer thread."""
+        await self.call(self.target.close)
+        self._executor.shutdown()
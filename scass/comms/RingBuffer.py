@@ -0,0 +1,109 @@
+
+import threading
+import time
+
+class RingBuffer(object):
+    """
+    A fixed capacity, thread safe byte FIFO. One thread writes bytes in
+    as they arrive, while another reads them out, waiting up to a
+    timeout for enough to arrive.
+    """
+
+    def __init__(self, capacity = 1 << 20):
+        """
+        capacity - int
+            Maximum number of unread bytes held. Writers wait for space
+            once it is full.
+        """
+        self._data      = bytearray(capacity)
+        self._head      = 0
+        self._count     = 0
+        self._cond      = threading.Condition()
+
+
+    def __len__(self):
+        """Number of unread bytes."""
+        return self._count
+
+
+    @property
+    def capacity(self):
+        """Maximum number of unread bytes held"""
+        return len(self._data)
+
+
+    def write(self, data):
+        """
+        Append data, waiting for space if the buffer is full.
+        """
+        data    = memoryview(bytes(data))
+        cap     = self.capacity
+
+        while(len(data) > 0):
+
+            with self._cond:
+
+                while(self._count == cap):
+                    self._cond.wait()
+
+                n       = min(len(data), cap - self._count)
+                tail    = (self._head + self._count) % cap
+                first   = min(n, cap - tail)
+
+                self._data[tail:tail+first] = data[0:first]
+                self._data[0:n-first]       = data[first:n]
+
+                self._count += n
+                data         = data[n:]
+
+                self._cond.notify_all()
+
+
+    def read(self, n, timeout = None):
+        """
+        Remove and return n bytes, waiting up to timeout seconds (or
+        forever if None) for them to arrive. Returns fewer than n bytes
+        if the timeout expires first.
+        """
+        return self.__get(n, timeout, remove = True)
+
+
+    def peek(self, n, timeout = None):
+        """
+        As read, but leave the bytes in the buffer.
+        """
+        return self.__get(n, timeout, remove = False)
+
+
+    def __get(self, n, timeout, remove):
+        cap     = self.capacity
+        end     = None if timeout is None else time.monotonic() + timeout
+
+        with self._cond:
+
+            while(self._count < min(n, cap)):
+                left = None if end is None else end - time.monotonic()
+                if(left is not None and left <= 0):
+                    break
+                self._cond.wait(left)
+
+            n       = min(n, self._count)
+            first   = min(n, cap - self._head)
+
+            rsp     = bytes(self._data[self._head:self._head+first]) + \
+                      bytes(self._data[0:n-first])
+
+            if(remove):
+                self._head   = (self._head + n) % cap
+                self._count -= n
+                self._cond.notify_all()
+
+        return rsp
+
+
+    def clear(self):
+        """Discard all unread bytes."""
+        with self._cond:
+            self._head  = 0
+            self._count = 0
+            self._cond.notify_all()
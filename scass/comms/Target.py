@@ -1,13 +1,27 @@
-
 import logging as log
+import os
+import queue
+import threading
+import time
+
+from collections import deque
+from collections import namedtuple
+
+import numpy as np
 
 try:
     import serial
 except ModuleNotFoundError as m:
     log.warn("serial module not found. Target communication functionality will be unavailable")
 
+from .RingBuffer    import RingBuffer
 from .TargetVar     import TargetVar
 from .TargetClkInfo import *
+from .TargetFrame   import SCASS_FRAME_SOF
+from .TargetFrame   import SCASS_FRAME_MAX_LEN
+from .TargetFrame   import SCASS_RSP_NAK
+from .TargetFrame   import frameCRC
+from .TargetFrame   import encodeFrame
 
 SCASS_CMD_HELLOWORLD            = 'H'.encode("ascii")
 SCASS_CMD_INIT_EXPERIMENT       = 'I'.encode("ascii")
@@ -19,6 +33,7 @@ SCASS_CMD_GET_CYCLES            = 'C'.encode("ascii")
 SCASS_CMD_GET_INSTRRET          = 'E'.encode("ascii")
 SCASS_RSP_OKAY                  = '0'.encode("ascii")
 SCASS_RSP_ERROR                 = '!'.encode("ascii")
+SCASS_RSP_DEBUG                 = '?'.encode("ascii")
 SCASS_CMD_GET_VAR_NUM           = 'V'.encode("ascii")
 SCASS_CMD_GET_VAR_INFO          = 'D'.encode("ascii")
 SCASS_CMD_GET_VAR_VALUE         = '1'.encode("ascii")
@@ -28,23 +43,174 @@ SCASS_CMD_SET_VAR_FIXED         = '4'.encode("ascii")
 SCASS_CMD_RAND_GET_LEN          = 'L'.encode("ascii")
 SCASS_CMD_RAND_GET_INTERVAL     = 'l'.encode("ascii")
 SCASS_CMD_RAND_SEED             = 'S'.encode("ascii")
+SCASS_CMD_PRNG_SEED             = 'P'.encode("ascii")
+SCASS_CMD_RUN_BURST             = 'B'.encode("ascii")
 SCASS_CMD_GET_CLK_INFO          = 'c'.encode("ascii")
 SCASS_CMD_SET_SYS_CLK           = 'r'.encode("ascii")
+SCASS_CMD_SET_PROTOCOL          = 'X'.encode("ascii")
+SCASS_CMD_SET_BAUD              = 'b'.encode("ascii")
+SCASS_CMD_CONFIRM_BAUD          = 'k'.encode("ascii")
+SCASS_CMD_ECHO                  = 'e'.encode("ascii")
+SCASS_CMD_GET_BUILD_ID          = 'h'.encode("ascii")
 
 SCASS_FLAG_RANDOMISE            = (0x1 << 0)
 SCASS_FLAG_INPUT                = (0x1 << 1)
 SCASS_FLAG_OUTPUT               = (0x1 << 2)
 SCASS_FLAG_TTEST_VAR            = (0x1 << 3)
 
+# Commands which run experiment code, and so may send debug messages.
+SCASS_DEBUG_COMMANDS            = [
+    SCASS_CMD_INIT_EXPERIMENT, SCASS_CMD_RUN_RANDOM, SCASS_CMD_RUN_FIXED,
+    SCASS_CMD_RUN_BURST]
+
+# Baud rates tried by Target.negotiateBaud, fastest first.
+SCASS_BAUD_RATES                = [
+    3000000, 2000000, 1000000, 921600, 460800, 230400, 115200, 57600,
+    38400, 19200, 9600]
+
+
+# A debug message sent by scass_debug_str on the target, and the
+# time.time() at which it arrived.
+TargetDebugMessage = namedtuple("TargetDebugMessage", ["time", "message"])
+
+
+class TargetCommandError(Exception):
+    """
+    Raised when the target reports that a command failed, or when the
+    response to a command could not be read.
+    """
+
+    def __init__(self, command, message):
+        """
+        command - bytes
+            The opcode of the command which failed.
+        message - str
+            What went wrong.
+        """
+        self.command = command
+
+        Exception.__init__(self, "SCASS command %s failed: %s" % (
+            str(command), message))
+
+
+class TargetCommand(object):
+    """
+    A command which has been sent to the target, and whose response is
+    read and checked by the Target's reader thread.
+    """
+
+    def __init__(self, opcode, parse = None, timeout = None, framed = False):
+        """
+        opcode - bytes
+            The command opcode.
+        parse - callable or None
+            Reads the command's response data, before the response
+            code, and returns the command result. If None, the result is
+            True.
+        timeout - float or None
+            Serial read timeout while reading the response. Defaults to
+            the port's timeout.
+        framed - bool
+            True if the command was sent, and its response arrives, as a
+            protocol v2 frame.
+        """
+        self.opcode     = opcode
+        self.parse      = parse
+        self.timeout    = timeout
+        self.framed     = framed
+
+        self._done      = threading.Event()
+        self._result    = None
+        self._error     = None
+
+        self._callbacks = []
+        self._lock      = threading.Lock()
+
+
+    def _finish(self, result = None, error = None):
+        """Called by the reader thread once the response is read."""
+        self._result    = result
+        self._error     = error
+
+        with self._lock:
+            self._done.set()
+            callbacks       = self._callbacks
+            self._callbacks = []
+
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                log.error("Target command callback failed: %s" % str(e))
+
+
+    def addDoneCallback(self, callback):
+        """
+        Call callback(command) once the response has been read, from the
+        reader thread, or straight away if it already has.
+        """
+        with self._lock:
+            if(not self._done.is_set()):
+                self._callbacks.append(callback)
+                return
+
+        callback(self)
+
+
+    def done(self):
+        """Return True if the response has been read."""
+        return self._done.is_set()
+
+
+    def result(self, timeout = None):
+        """
+        Wait for the response and return the command result. Raises a
+        TargetCommandError if the command failed.
+        """
+        if(not self._done.wait(timeout)):
+            raise TargetCommandError(self.opcode, "no response after %ss" % (
+                str(timeout)))
+
+        if(self._error is not None):
+            raise self._error
+
+        return self._result
+
+
 class Target(object):
     """
     The communications bridge between the target device and the
     host PC.
+
+    Every command is sent immediately, and its response is read and
+    checked by a background reader thread in the order commands were
+    sent. The do* methods wait for the response by default. Passing
+    wait=False returns a TargetCommand instead, so several commands can
+    be in flight at once; waitForCommands then waits for all of them
+    and raises the first failure.
+
+    Commands start out using the raw protocol v1. doSetProtocol(2)
+    switches both ends to CRC checked frames (see encodeFrame), after
+    which negotiateBaud can raise the baud rate as far as it is
+    reliable. A corrupted frame fails only the command it belongs to:
+    both ends skip ahead to the start of the next frame.
+
+    A second background thread continuously drains the serial port into
+    a ring buffer, which the response reader reads from. Debug messages
+    from the target are split out into debug_messages as they arrive
+    with protocol v2, where they are frames of their own. With protocol
+    v1 a debug message can only be told apart from response data at the
+    start of a response which cannot begin with SCASS_RSP_DEBUG, so
+    they are split out at the start of SCASS_DEBUG_COMMANDS responses.
     """
 
-    def __init__(self, port, baud):
+    def __init__(self, port, baud, debug_queue_length = 1000):
         """
         Create and open a new connection to a target device.
+
+        debug_queue_length - int
+            Number of target debug messages to keep. Older ones are
+            dropped and counted in debug_messages_dropped.
         """
         assert type(port) is str, "Serial port name must be a string"
         assert type(baud) is int, "Serial baud rate must be an integer"
@@ -53,7 +219,7 @@ class Target(object):
         self.port.baudrate  = baud
         self.port.port      = port
         self.port.timeout   = 3
-        
+
         self.port.open()
 
         self.port.reset_input_buffer()
@@ -62,70 +228,188 @@ class Target(object):
         self.exception_on_command_fail = True
         self.port.read()
 
-        self.debug_messages = []
+        # Most recent TargetDebugMessages, oldest first.
+        self.debug_messages = deque(maxlen = debug_queue_length)
+        self.debug_messages_dropped = 0
+
+        # Protocol version used for new commands.
+        self.protocol       = 1
+
+        # Longest frame, opcode included, sent or accepted. Must match
+        # SCASS_FRAME_MAX_LEN on the target.
+        self.max_frame_length = SCASS_FRAME_MAX_LEN
+
+        # Unread part of the current response frame, while parsing one.
+        self._frame         = None
+
+        # Timeout for the response being read, and the default.
+        self._timeout       = self.port.timeout
+        self._read_timeout  = self._timeout
+
+        # Bytes received but not yet read as responses.
+        self._rx            = RingBuffer()
+
+        # Received bytes the drain thread holds back while deciding if
+        # they are a debug frame.
+        self._rx_held       = bytearray()
+        self._rx_lock       = threading.Lock()
+
+        self._closing       = False
+
+        # Short, so the drain thread notices close() promptly.
+        self.port.timeout   = 0.05
+
+        # Commands awaiting a response, in the order they were sent.
+        self._pending       = queue.Queue()
+
+        # Commands sent with wait=False which nobody has waited for yet.
+        self._outstanding   = deque()
+
+        self._write_lock    = threading.Lock()
+
+        self._reader        = threading.Thread(
+            target = self.__readerLoop, daemon = True)
+        self._reader.start()
+
+        self._drain         = threading.Thread(
+            target = self.__drainLoop, daemon = True)
+        self._drain.start()
+
+
+    def close(self):
+        """Stop the background threads and close the serial port."""
+        self._pending.put(None)
+        self._reader.join()
+        self._closing = True
+        self._drain.join()
+        self.port.close()
+
+
+    def untrackCommand(self, command):
+        """
+        Stop waitForCommands waiting for a command sent with wait=False,
+        e.g. because the caller waits for it some other way.
+        """
+        try:
+            self._outstanding.remove(command)
+        except ValueError:
+            pass
+
+
+    def popDebugMessages(self):
+        """
+        Remove and return all of the debug messages received so far, as
+        a list of TargetDebugMessage, oldest first.
+        """
+        messages = []
+
+        while(len(self.debug_messages) > 0):
+            messages.append(self.debug_messages.popleft())
+
+        return messages
 
 
-    def doInitExperiment(self):
+    def waitForCommands(self):
+        """
+        Wait for every command sent with wait=False to complete. Raises
+        the TargetCommandError of the first one which failed, if any.
+        """
+        error = None
+
+        while(len(self._outstanding) > 0):
+            cmd = self._outstanding.popleft()
+            try:
+                cmd.result()
+            except TargetCommandError as e:
+                error = e if error is None else error
+
+        if(error is not None):
+            raise error
+
+
+    def doInitExperiment(self, wait = True):
         """Do any one-time experiment initialisation needed"""
-        self.__sendByte(SCASS_CMD_INIT_EXPERIMENT)
-        return self.__cmdSuccess()
+        return self.__command(SCASS_CMD_INIT_EXPERIMENT, wait=wait)
 
 
-    def doRunRandomExperiment(self):
+    def doRunRandomExperiment(self, wait = True):
         """Run the experiment once"""
-        self.__sendByte(SCASS_CMD_RUN_RANDOM)
-        return self.__cmdSuccess()
-    
-    def doRunFixedExperiment(self):
+        return self.__command(SCASS_CMD_RUN_RANDOM, wait=wait)
+
+    def doRunFixedExperiment(self, wait = True):
         """Run the experiment once"""
-        self.__sendByte(SCASS_CMD_RUN_FIXED)
-        return self.__cmdSuccess()
+        return self.__command(SCASS_CMD_RUN_FIXED, wait=wait)
+
+
+    def doRunBurst(self, fixed_bits, timeout = None, wait = True):
+        """
+        Run the experiment len(fixed_bits) times back to back with a
+        single command. Each run triggers the scope as normal, so use
+        this with Scope.runSegmentedCapture. The run count is limited by
+        SCASS_BURST_MAX_RUNS on the target and, with protocol v2, by
+        the bitmap fitting in a frame of max_frame_length.
+
+        :param fixed_bits: Sequence with one entry per run, non-zero for a
+            fixed run and zero for a random one.
+        :param timeout: Serial read timeout in seconds while waiting for
+            the runs to finish. Defaults to the port's timeout.
+
+        :rtype: Tuple of (runs completed, runs failed, index of the first
+            failed run or None), or False if the command failed.
+        """
+        fixed_bits = np.asarray(fixed_bits) != 0
+        bitmap     = np.packbits(fixed_bits, bitorder="little").tobytes()
+
+        def parse():
+            completed = self.__recvInt32()
+            failures  = self.__recvInt32()
+            first     = self.__recvInt32()
+            return (completed, failures, None if failures == 0 else first)
 
+        return self.__command(
+            SCASS_CMD_RUN_BURST,
+            fixed_bits.size.to_bytes(4,byteorder="little") + bitmap,
+            parse   = parse,
+            timeout = timeout,
+            wait    = wait
+        )
 
-    def doGetExperiementName(self):
+
+    def doGetExperiementName(self, wait = True):
         """Return the name of the experiment currently running as a string
         if successful, otherwise return False"""
-        self.__sendByte(SCASS_CMD_EXPERIMENT_NAME)
-        slen = int.from_bytes(self.__recvByte(),byteorder="little")
+        def parse():
+            slen = int.from_bytes(self.__recvBytes(1),byteorder="little")
+            return str(self.__recvBytes(slen),encoding="ascii") \
+                if slen > 0 else ""
 
-        ename = ""
-        for i in range(0, slen):
-            ename += (str(self.__recvByte(),encoding="ascii"))
+        return self.__command(SCASS_CMD_EXPERIMENT_NAME, parse=parse,
+            wait=wait)
 
-        if(self.__cmdSuccess()):
-            return ename
-        else:
-            return False
 
+    def doGetBuildId(self, wait = True):
+        """Return the build ID string of the target firmware, which
+        changes whenever the firmware is rebuilt, or False on failure."""
+        def parse():
+            slen = int.from_bytes(self.__recvBytes(1),byteorder="little")
+            return str(self.__recvBytes(slen),encoding="ascii") \
+                if slen > 0 else ""
+
+        return self.__command(SCASS_CMD_GET_BUILD_ID, parse=parse, wait=wait)
 
-    def doGetExperimentCycles(self):
+
+    def doGetExperimentCycles(self, wait = True):
         """Return the number of cycles it takes to execute 1 experiment.
         You need to have run the experiment atleast once for this to work."""
-        self.__sendByte(SCASS_CMD_GET_CYCLES)
-        
-        bdata  = self.__recvBytes(4)
-        assert(len(bdata) == 4), "Expected 4 bytes, got %d"%len(bdata)
-        result = int.from_bytes(bdata,byteorder="big")
-
-        if(self.__cmdSuccess()):
-            return result
-        else:
-            return False
+        return self.__command(SCASS_CMD_GET_CYCLES, parse=self.__recvInt32,
+            wait=wait)
 
 
-    def doGetExperimentInstrRet(self):
+    def doGetExperimentInstrRet(self, wait = True):
         """Return the number instructions executeed by 1 experiment run.
         You need to have run the experiment atleast once for this to work."""
-        self.__sendByte(SCASS_CMD_GET_INSTRRET)
-        
-        bdata  = self.__recvBytes(4)
-        assert(len(bdata) == 4), "Expected 4 bytes, got %d"%len(bdata)
-        result = int.from_bytes(bdata,byteorder="big")
-
-        if(self.__cmdSuccess()):
-            return result
-        else:
-            return False
+        return self.__command(SCASS_CMD_GET_INSTRRET, parse=self.__recvInt32,
+            wait=wait)
 
 
     def doGoto(self, address):
@@ -141,58 +425,49 @@ class Target(object):
             address should observe *little endian* byte ordering.
         """
 
-        self.__sendByte(SCASS_CMD_GOTO)
-
-        self.port.write(address)
+        with self._write_lock:
+            self.port.write(encodeFrame(SCASS_CMD_GOTO, bytes(address))
+                if self.protocol >= 2 else SCASS_CMD_GOTO + bytes(address))
+            self.port.flush()
 
         return True
 
 
-    def doGetVarNum(self):
+    def doGetVarNum(self, wait = True):
         """
         Return the number of variables on the target which can be
         managed by the SCASS framework. Number will be between 0 and 255.
 
         :rtype: int or False if the command succeeds or fails respectivley.
         """
+        def parse():
+            return int.from_bytes(self.__recvBytes(1),byteorder="big")
 
-        self.__sendByte(SCASS_CMD_GET_VAR_NUM)
-        
-        bdata = self.__recvByte()
-        result= int.from_bytes(bdata,byteorder="big")
+        return self.__command(SCASS_CMD_GET_VAR_NUM, parse=parse, wait=wait)
 
-        if(self.__cmdSuccess()):
-            return result
-        else:
-            return False
 
-
-    def doGetVarInfo(self, varnum):
+    def doGetVarInfo(self, varnum, wait = True):
         """
         Return a tuple which describes a single variable under management
         on the target device or False if the requested variable was
         out of range.
-        
+
         :param varnum: Index of the variable to get information for.
 
         :rtype: TargetVar or False
         """
-
-        self.__sendByte(SCASS_CMD_GET_VAR_INFO)
-        self.__sendByte(bytes([varnum]))
-        
-        namelen = int.from_bytes(self.__recvBytes(4),byteorder="big")
-        varsize = int.from_bytes(self.__recvBytes(4),byteorder="big")
-        flags   = int.from_bytes(self.__recvBytes(4),byteorder="big")
-        name    = str(self.__recvBytes(namelen),encoding="ascii")
-
-        if(self.__cmdSuccess()):
+        def parse():
+            namelen = self.__recvInt32()
+            varsize = self.__recvInt32()
+            flags   = self.__recvInt32()
+            name    = str(self.__recvBytes(namelen),encoding="ascii")
             return TargetVar(varnum, name, varsize, flags)
-        else:
-            return False
 
+        return self.__command(SCASS_CMD_GET_VAR_INFO, bytes([varnum]),
+            parse=parse, wait=wait)
 
-    def doGetVarValue(self, varnum, length):
+
+    def doGetVarValue(self, varnum, length, wait = True):
         """
         Get the current value of the specified variable.
 
@@ -201,19 +476,12 @@ class Target(object):
 
         :rtype: bytes or False
         """
-        
-        self.__sendByte(SCASS_CMD_GET_VAR_VALUE)
-        self.__sendByte(bytes([varnum]))
-
-        rdata = self.__recvBytes(length)
-
-        if(self.__cmdSuccess()):
-            return rdata
-        else:
-            return False
+        return self.__command(SCASS_CMD_GET_VAR_VALUE, bytes([varnum]),
+            parse=lambda: self.__recvBytes(length), wait=wait,
+            response_len=length)
 
 
-    def doSetVarValue(self, varnum, data):
+    def doSetVarValue(self, varnum, data, wait = True):
         """
         Set the current value of the specified variable.
 
@@ -222,18 +490,11 @@ class Target(object):
 
         :rtype: bool
         """
-        
-        self.__sendByte(SCASS_CMD_SET_VAR_VALUE)
-        self.__sendByte(bytes([varnum]))
-        self.port.write(data)
+        return self.__command(SCASS_CMD_SET_VAR_VALUE,
+            bytes([varnum]) + bytes(data), wait=wait)
 
-        if(self.__cmdSuccess()):
-            return True 
-        else:
-            return False
 
-
-    def doGetVarFixedValue(self, varnum, length):
+    def doGetVarFixedValue(self, varnum, length, wait = True):
         """
         Get the current fixed value of the specified variable.
 
@@ -242,19 +503,12 @@ class Target(object):
 
         :rtype: bytes or False
         """
-        
-        self.__sendByte(SCASS_CMD_GET_VAR_FIXED)
-        self.__sendByte(bytes([varnum]))
-
-        rdata = self.__recvBytes(length)
-
-        if(self.__cmdSuccess()):
-            return rdata
-        else:
-            return False
+        return self.__command(SCASS_CMD_GET_VAR_FIXED, bytes([varnum]),
+            parse=lambda: self.__recvBytes(length), wait=wait,
+            response_len=length)
 
 
-    def doSetVarFixedValue(self, varnum, data):
+    def doSetVarFixedValue(self, varnum, data, wait = True):
         """
         Set the current Fixed value of the specified variable.
 
@@ -263,184 +517,531 @@ class Target(object):
 
         :rtype: bool
         """
-        
-        self.__sendByte(SCASS_CMD_SET_VAR_FIXED)
-        self.__sendByte(bytes([varnum]))
-        self.port.write(data)
+        return self.__command(SCASS_CMD_SET_VAR_FIXED,
+            bytes([varnum]) + bytes(data), wait=wait)
 
-        if(self.__cmdSuccess()):
-            return True 
-        else:
-            return False
-
-    def doRandGetLen(self):
+    def doRandGetLen(self, wait = True):
         """
         Get the length of the on-board randomness array.
 
         :rtype: int or False
         """
+        return self.__command(SCASS_CMD_RAND_GET_LEN, parse=self.__recvInt32,
+            wait=wait)
 
-        self.__sendByte(SCASS_CMD_RAND_GET_LEN)
-
-        bdata = self.__recvBytes(4)
-        result= int.from_bytes(bdata,byteorder="big")
 
-        if(self.__cmdSuccess()):
-            return result
-        else:
-            return False
-
-
-    def doRandGetRefreshRate(self):
+    def doRandGetRefreshRate(self, wait = True):
         """
         Get the number of traces afterwhich the SCASS framework should
         referesh the on-board randomness.
 
         :rtype: int or False
         """
-
-        self.__sendByte(SCASS_CMD_RAND_GET_INTERVAL)
-
-        bdata = self.__recvBytes(4)
-        result= int.from_bytes(bdata,byteorder="big")
-
-        if(self.__cmdSuccess()):
-            return result
-        else:
-            return False
+        return self.__command(SCASS_CMD_RAND_GET_INTERVAL,
+            parse=self.__recvInt32, wait=wait)
 
 
-    def doRandSeed(self, data):
+    def doRandSeed(self, data, wait = True):
         """
         Seed the onboard randomness array with the supplied data.
         Assumes that the supplied data bytes are of length "doRandGetLen"
 
         :rtype: bool
         """
-        self.__sendByte(SCASS_CMD_RAND_SEED)
+        return self.__command(SCASS_CMD_RAND_SEED, bytes(data), wait=wait)
 
-        self.port.write(data)
 
-        if(self.__cmdSuccess()):
-            return True
-        else:
-            return False
+    def doPRNGSeed(self, seed, enable = True, wait = True):
+        """
+        Seed the target's input PRNG and enable or disable it. While
+        enabled, the target generates the values of its randomisable
+        input variables itself before every run, so they need not be
+        uploaded. Use scass.comms.TargetPRNG to replay the values.
+
+        :param seed: 32-bit seed. The PRNG counter restarts from zero.
+        :param enable: Enable (True) or disable (False) the PRNG.
 
+        :rtype: bool
+        """
+        return self.__command(SCASS_CMD_PRNG_SEED,
+            bytes([1 if enable else 0]) +
+            (seed & 0xFFFFFFFF).to_bytes(4,byteorder="little"),
+            wait=wait)
 
-    def doGetSysClkInfo(self):
+
+    def doGetSysClkInfo(self, wait = True):
         """
         Return a TargetClkInfo object describing the current
         system clock configuration.
         """
-        self.__sendByte(SCASS_CMD_GET_CLK_INFO)
+        def parse():
+            tr = []
 
-        tr = []
+            num_cfgs = int.from_bytes(self.__recvBytes(1),byteorder="big")
+            current  = int.from_bytes(self.__recvBytes(1),byteorder="big")
 
-        num_cfgs = int.from_bytes(self.__recvByte(),byteorder="big")
-        current  = int.from_bytes(self.__recvByte(),byteorder="big")
+            for i in range(0,num_cfgs):
+                sys_clk_rate = self.__recvInt32()
+                sys_clk_src  = int.from_bytes(self.__recvBytes(1),
+                    byteorder="big")
+                sys_clk_src  = TargetClkSrc(sys_clk_src)
+                tr.append(TargetClkInfo(sys_clk_rate, sys_clk_src))
 
-        for i in range(0,num_cfgs):
-            sys_clk_rate = int.from_bytes(self.__recvBytes(4),byteorder="big")
-            sys_clk_src  = int.from_bytes(self.__recvByte()  ,byteorder="big")
-            sys_clk_src  = TargetClkSrc(sys_clk_src)
-            tr.append(TargetClkInfo(sys_clk_rate, sys_clk_src))
+            return (current,tr)
 
-        return (current,tr)
+        return self.__command(SCASS_CMD_GET_CLK_INFO, parse=parse, wait=wait)
 
 
-    def doSetSysClk(self, ext_clk_rate, desired_rate, desired_src):
+    def doSetSysClk(self, clk_cfg, wait = True):
         """
-        Try to set the system clock source and rate. Also update the
-        external clock rate.
+        Switch the target to one of the system clock configurations
+        listed by doGetSysClkInfo.
         To determine if the update was a success, use doGetSysClkInfo
-        to check the current_src and current_rate are as expected.
-        """
-        self.__sendByte(SCASS_CMD_SET_SYS_CLK)
-        
-        b_ext   = ext_clk_rate.to_bytes(4,byteorder="little")
-        b_rate  = desired_rate.to_bytes(4,byteorder="little")
-        b_src   = desired_src .to_bytes(1,byteorder="little")
+        to check the current configuration is as expected.
 
-        self.__sendBytes(b_ext)
-        self.__sendBytes(b_rate)
-        self.__sendBytes(b_src[0])
-        return self.__cmdSuccess()
+        :param clk_cfg: Index into the list of clock configurations.
+        """
+        return self.__command(SCASS_CMD_SET_SYS_CLK, bytes([clk_cfg]),
+            wait=wait)
 
 
-    def doHelloWorld(self):
+    def doHelloWorld(self, wait = True):
         """
         Run a hello world test of communications.
         Return True if everything worked. False otherwise.
         """
-        self.__sendByte(SCASS_CMD_HELLOWORLD)
-        return self.__cmdSuccess()
+        return self.__command(SCASS_CMD_HELLOWORLD, wait=wait)
 
-    def __sendBytes(self, by):
-        for b in by:
-            self.__sendByte(b)
 
-    def __sendByte(self, b):
-        #print("> %s"%(str(b)))
-        self.port.write(b)
-        self.port.flush()
+    def doSetProtocol(self, version):
+        """
+        Switch both ends of the link to protocol version 1 (raw) or 2
+        (framed). Waits for any commands still in flight first.
 
-    def __recvInt32(self):
-        return int.from_bytes(self.__recvBytes(4),byteorder="big")
+        :rtype: bool
+        """
+        self.waitForCommands()
 
-    def __recvByte(self):
-        rsp = self.__recvBytes(1)
-        return rsp
+        rsp = self.__command(SCASS_CMD_SET_PROTOCOL, bytes([version]))
+
+        if(rsp):
+            self.protocol = version
 
-    def __recvBytes(self, n):
-        assert(n>0)
-        b0 = self.__pollDebugMessages()
-        if(b0 == None):
-            rsp = self.port.read(n)
-        else:
-            if(n <= 1):
-                return b0
-            else:
-                rsp = b0 + self.port.read(n-1)
-        #print("< %s"%str(rsp))
         return rsp
 
-    def __pollDebugMessages(self):
+
+    def doSetBaud(self, baud, fallback, wait = True):
+        """
+        Ask the target to switch to a new baud rate once it has
+        responded. Until doConfirmBaud, any framing error makes the
+        target go back to the fallback rate. Needs protocol v2, and a
+        target which provides scass_io_set_baud. The host port's baud
+        rate is not changed: see negotiateBaud.
+
+        :rtype: bool
+        """
+        return self.__command(SCASS_CMD_SET_BAUD,
+            baud.to_bytes(4,byteorder="little") +
+            fallback.to_bytes(4,byteorder="little"),
+            wait=wait)
+
+
+    def doConfirmBaud(self, wait = True):
+        """
+        Tell the target the current baud rate works, so it stops falling
+        back on framing errors.
+
+        :rtype: bool
+        """
+        return self.__command(SCASS_CMD_CONFIRM_BAUD, wait=wait)
+
+
+    def doEcho(self, data, timeout = None, wait = True):
+        """
+        Send up to 255 bytes to the target and return them as it sends
+        them back.
+
+        :rtype: bytes or False
+        """
+        data = bytes(data)
+
+        return self.__command(SCASS_CMD_ECHO, bytes([len(data)]) + data,
+            parse=lambda: self.__recvBytes(len(data)) if data else b"",
+            timeout=timeout, wait=wait)
+
+
+    def negotiateBaud(self, rates = SCASS_BAUD_RATES, tests = 4,
+                      test_length = 200, settle = 0.05):
+        """
+        Switch both ends of the link to the fastest of rates at which
+        tests echo commands of test_length random bytes all come back
+        intact. Switches to protocol v2 first if needed.
+
+        Each rate faster than the current one is tried in turn. If the
+        target cannot change rate, or no rate works, the link stays at
+        the current rate.
+
+        :rtype: int - The baud rate in use afterwards.
+        """
+        if(self.protocol != 2):
+            self.doSetProtocol(2)
+
+        current = self.port.baudrate
+
+        for rate in sorted(set(rates), reverse=True):
+
+            if(rate <= current):
+                break
+
+            try:
+                accepted = self.doSetBaud(rate, current)
+            except TargetCommandError as e:
+                accepted = False
+
+            if(not accepted):
+                log.info("Target cannot change baud rate, staying at %d" % (
+                    current))
+                break
+
+            time.sleep(settle)
+            self.port.baudrate = rate
+
+            if(self.__echoTest(tests, test_length, timeout = 0.5)):
+                self.doConfirmBaud()
+                log.info("Switched target link to %d baud" % rate)
+                return rate
+
+            log.info("%d baud is unreliable" % rate)
+
+            # Back to the old rate. Bytes which are not the start of a
+            # frame make a target still on probation fall back too, and
+            # fill up any partial frame a target at the old rate is
+            # part way through.
+            self.port.baudrate = current
+
+            with self._write_lock:
+                self.port.write(bytes(self.max_frame_length + 4))
+                self.port.flush()
+
+            time.sleep(settle)
+            self.__flushInput()
+
+            self.doHelloWorld()
+
+        return current
+
+
+    def __echoTest(self, tests, length, timeout):
         """
-        Checks if a debug message has been recieved from the target
-        device. If so, append it to self.debug_messages
+        Return True if tests echo commands of length random bytes all
+        come back intact.
         """
-        if(self.port.out_waiting):
-            b0 = self.port.read(1)
-            if(str(b0,encoding="ascii") == '?'):
-                message = self.port.read_until()
-                self.debug_messages.append(messages)
-                print("TGT DEBUG: %s" % message)
-                return None
+        for i in range(0, tests):
+
+            data = os.urandom(length)
+
+            try:
+                if(self.doEcho(data, timeout=timeout) != data):
+                    return False
+            except TargetCommandError as e:
+                log.debug(str(e))
+                return False
+
+        return True
+
+
+    def __command(self, opcode, payload = b"", parse = None, timeout = None,
+                  wait = True, response_len = 0):
+        """
+        Send a command and queue it for the reader thread. If wait is
+        True, wait for and return its result, or False if it failed and
+        exception_on_command_fail is not set. Otherwise return the
+        TargetCommand.
+
+        response_len is the number of bytes of response data parse
+        reads. With protocol v2 the payload, and the response data plus
+        the response byte, must each fit in a frame after the opcode.
+        """
+        cmd = TargetCommand(opcode, parse, timeout,
+            framed = self.protocol >= 2)
+
+        if(cmd.framed and len(payload) + 1 > self.max_frame_length):
+            raise TargetCommandError(opcode, ("%d byte payload does not fit "+
+                "in a frame of at most %d bytes") % (
+                    len(payload), self.max_frame_length))
+
+        if(cmd.framed and response_len + 2 > self.max_frame_length):
+            raise TargetCommandError(opcode, ("%d byte response does not fit "+
+                "in a frame of at most %d bytes") % (
+                    response_len, self.max_frame_length))
+
+        with self._write_lock:
+            # Queue before writing, so the reader is waiting for the
+            # response by the time it arrives.
+            self._pending.put(cmd)
+            self.port.write(encodeFrame(opcode, payload) if cmd.framed
+                else opcode + payload)
+            self.port.flush()
+
+        if(not wait):
+            self._outstanding.append(cmd)
+            return cmd
+
+        try:
+            return cmd.result()
+        except TargetCommandError as e:
+            if(self.exception_on_command_fail):
+                raise
+            log.error(str(e))
+            return False
+
+
+    def __readerLoop(self):
+        """
+        Reader thread body. Reads the response of each pending command
+        in turn and completes it.
+        """
+        while(True):
+
+            cmd = self._pending.get()
+
+            if(cmd is None):
+                return
+
+            try:
+                if(cmd.timeout is not None):
+                    self._read_timeout = cmd.timeout
+
+                if(cmd.framed):
+                    self._frame = self.__recvFrame(cmd.opcode)
+
+                    if(self._frame == SCASS_RSP_ERROR + cmd.opcode):
+                        raise TargetCommandError(cmd.opcode,
+                            "target reported failure of %s" % str(cmd.opcode))
+                elif(cmd.opcode in SCASS_DEBUG_COMMANDS):
+                    self.__recvDebugLines()
+
+                result = True if cmd.parse is None else cmd.parse()
+                result = self.__cmdSuccess(cmd.opcode, result)
+
+                if(cmd.framed and len(self._frame) > 0):
+                    raise TargetCommandError(cmd.opcode,
+                        "%d unexpected bytes at the end of the response" % (
+                        len(self._frame)))
+
+                cmd._finish(result = result)
+
+            except TargetCommandError as e:
+                cmd._finish(error = e)
+
+            except Exception as e:
+                cmd._finish(error = TargetCommandError(cmd.opcode, str(e)))
+
+            finally:
+                self._read_timeout = self._timeout
+                self._frame        = None
+
+
+    def __drainLoop(self):
+        """
+        Drain thread body. Moves everything received into self._rx, less
+        any protocol v2 debug frames, which go to debug_messages.
+        """
+        while(not self._closing):
+
+            try:
+                data = self.port.read(max(1, self.port.in_waiting))
+            except Exception as e:
+                if(not self._closing):
+                    log.error("Target serial port read failed: %s" % str(e))
+                return
+
+            with self._rx_lock:
+
+                if(len(data) == 0):
+                    # Frames are sent back to back, so a pause part way
+                    # through one means it was corrupted. Let the
+                    # response reader deal with it.
+                    if(len(self._rx_held) > 0):
+                        self._rx.write(self._rx_held)
+                        self._rx_held.clear()
+
+                elif(self.protocol < 2 and len(self._rx_held) == 0):
+                    self._rx.write(data)
+
+                else:
+                    self._rx_held += data
+                    self._rx.write(self.__splitDebugFrames(self._rx_held))
+
+
+    def __splitDebugFrames(self, held):
+        """
+        Remove everything up to the last incomplete frame from held, and
+        return it less any valid debug frames, which are added to
+        debug_messages.
+        """
+        out = bytearray()
+
+        while(len(held) > 0):
+
+            sof = held.find(SCASS_FRAME_SOF)
+
+            if(sof != 0):
+                n = len(held) if sof < 0 else sof
+                out += held[0:n]
+                del held[0:n]
+                continue
+
+            if(len(held) < 3):
+                break
+
+            length = int.from_bytes(held[1:3], byteorder="little")
+
+            if(length == 0 or length > self.max_frame_length):
+                out += held[0:1]
+                del held[0:1]
+                continue
+
+            if(len(held) < length + 5):
+                break
+
+            frame = bytes(held[0:length+5])
+            del held[0:length+5]
+
+            if(frame[3:4] == SCASS_RSP_DEBUG and frameCRC(frame[1:-2]) == \
+               int.from_bytes(frame[-2:], byteorder="little")):
+                self.__addDebugMessage(frame[4:-2])
             else:
-                return b0
-        else:
-            return None
+                out += frame
+
+        return out
+
+
+    def __recvDebugLines(self):
+        """
+        Move any protocol v1 debug messages at the start of a response,
+        each a SCASS_RSP_DEBUG byte and a line of text, to
+        debug_messages.
+        """
+        while(self._rx.peek(1, self._read_timeout) == SCASS_RSP_DEBUG):
+
+            self._rx.read(1)
+            line = bytearray()
+
+            while(True):
+                c = self.__readPort(1)
+                if(c == b"\n"):
+                    break
+                line += c
 
+            self.__addDebugMessage(line)
 
-    def __getRsp(self):
-        """Get the response code from the target"""
-        return self.__recvByte()
 
+    def __addDebugMessage(self, message):
+        """Add a received debug message to debug_messages."""
+        message = str(bytes(message), encoding="ascii", errors="replace")
 
-    def __cmdSuccess(self):
-        """Return true if the next byte read is SCASS_RSP_OKAY, else
-            return false"""
-        return True # TODO: Make this configurable!!
-        rsp_code = self.__getRsp()
+        if(len(self.debug_messages) == self.debug_messages.maxlen):
+            self.debug_messages_dropped += 1
+
+        self.debug_messages.append(TargetDebugMessage(time.time(), message))
+
+        log.debug("TGT DEBUG: %s" % message)
+
+
+    def __flushInput(self):
+        """Discard everything received but not yet read."""
+        self.port.reset_input_buffer()
+
+        with self._rx_lock:
+            self._rx_held.clear()
+            self._rx.clear()
+
+
+    def __recvFrame(self, opcode):
+        """
+        Read the next response frame, which should be for opcode, and
+        return its payload as a bytearray. Anything before the start of
+        the frame is skipped.
+        """
+        skipped = 0
+
+        while(True):
+            b0 = self._rx.read(1, self._read_timeout)
+            if(len(b0) == 0):
+                raise IOError("timed out waiting for a response frame")
+            elif(b0 == SCASS_FRAME_SOF):
+                break
+            skipped += 1
+
+        if(skipped > 0):
+            log.warning("Skipped %d bytes before response frame" % skipped)
+
+        header  = self.__readPort(2)
+        length  = int.from_bytes(header, byteorder="little")
+
+        if(length == 0 or length > self.max_frame_length):
+            raise TargetCommandError(opcode,
+                "bad response frame length %d" % length)
+
+        body    = self.__readPort(length + 2)
+
+        if(frameCRC(header + body[:-2]) != \
+           int.from_bytes(body[-2:], byteorder="little")):
+            raise TargetCommandError(opcode, "response frame CRC mismatch")
+
+        if(body[0:1] == SCASS_RSP_NAK):
+            raise TargetCommandError(opcode,
+                "target received a corrupted command frame")
+
+        if(body[0:1] != opcode):
+            raise TargetCommandError(opcode,
+                "got a response frame for command %s" % str(body[0:1]))
+
+        return bytearray(body[1:-2])
+
+
+    def __readPort(self, n):
+        """Read exactly n received bytes, or raise an IOError."""
+        rsp = self._rx.read(n, self._read_timeout)
+        if(len(rsp) < n):
+            # Whatever did arrive can't be trusted to line up with the
+            # next response, so drop it.
+            self.__flushInput()
+            raise IOError("timed out after %d of %d response bytes" % (
+                len(rsp), n))
+        return rsp
+
+
+    def __recvInt32(self):
+        # Protocol v2 is little endian throughout.
+        return int.from_bytes(self.__recvBytes(4),
+            byteorder="big" if self._frame is None else "little")
+
+    def __recvBytes(self, n):
+        assert(n>0)
+        if(self._frame is not None):
+            if(len(self._frame) < n):
+                raise IOError("response frame ended after %d of %d bytes" % (
+                    len(self._frame), n))
+            rsp = bytes(self._frame[0:n])
+            del self._frame[0:n]
+            return rsp
+        return self.__readPort(n)
+
+
+    def __cmdSuccess(self, opcode, result):
+        """Read the response code for opcode from the target. Return
+            result if it is SCASS_RSP_OKAY, else raise a TargetCommandError"""
+        rsp_code = self.__recvBytes(1)
         if(rsp_code == SCASS_RSP_OKAY):
-            return True
+            return result
         elif(rsp_code == SCASS_RSP_ERROR):
-            bad_cmd = self.port.read()
-            if(self.exception_on_command_fail):
-                raise Exception("Failed SCASS code: %s" %str(bad_cmd))
-            return False
+            bad_cmd = self.__recvBytes(1)
+            raise TargetCommandError(opcode,
+                "target reported failure of %s" % str(bad_cmd))
         else:
-            if(self.exception_on_command_fail):
-                raise Exception("Unknown SCASS code: %s" %str(rsp_code))
-            return False
-
+            if(self._frame is None):
+                self.__flushInput()
+            raise TargetCommandError(opcode,
+                "unknown response code %s" % str(rsp_code))
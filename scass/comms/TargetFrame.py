@@ -0,0 +1,57 @@
+
+import binascii
+
+# First byte of every protocol v2 frame.
+SCASS_FRAME_SOF                 = bytes([0x7E])
+
+# Opcode of the frame the target sends back for a corrupted command frame.
+SCASS_RSP_NAK                   = bytes([0x00])
+
+# Default SCASS_FRAME_MAX_LEN of scass_target.h.
+SCASS_FRAME_MAX_LEN             = (4096 + 7) // 8 + 16
+
+def frameCRC(data):
+    """
+    Return the CRC16-CCITT (polynomial 0x1021, initial value 0xFFFF, not
+    reflected) of data, as computed by crc16_update in scass_target.c.
+    """
+    return binascii.crc_hqx(bytes(data), 0xFFFF)
+
+
+def encodeFrame(opcode, payload = b""):
+    """
+    Return the protocol v2 frame for a command or response.
+
+    A frame is SCASS_FRAME_SOF, the little endian 16-bit length of the
+    opcode and payload, the opcode, the payload, and the little endian
+    frameCRC of everything after SCASS_FRAME_SOF.
+    """
+    body = (len(payload) + 1).to_bytes(2, byteorder="little") + \
+        bytes(opcode) + bytes(payload)
+
+    return SCASS_FRAME_SOF + body + \
+        frameCRC(body).to_bytes(2, byteorder="little")
+
+
+def checkKnownAnswers():
+    """
+    Check frameCRC and encodeFrame against frames produced by
+    crc16_update and send_frame in scass_target.c, so the host and
+    target agree. Raises an AssertionError if not.
+    """
+    assert(frameCRC(b"123456789") == 0x29B1), "frameCRC check value"
+
+    assert(encodeFrame(b"H") == bytes.fromhex("7e0100486032")), \
+        "encodeFrame without payload"
+
+    assert(encodeFrame(b"B", bytes.fromhex("05000000a5")) ==
+        bytes.fromhex("7e06004205000000a5bd96")), "encodeFrame with payload"
+
+    # The largest response serve_framed_command sends: frame_wr_char
+    # keeps SCASS_FRAME_MAX_LEN - 2 bytes of data, then the response byte.
+    data    = bytes([i & 0xFF for i in range(0, SCASS_FRAME_MAX_LEN - 2)])
+    frame   = encodeFrame(b"1", data + b"0")
+
+    assert(len(frame) == SCASS_FRAME_MAX_LEN + 5 and
+        frame[1:3] == bytes.fromhex("1002") and
+        frame[-2:] == bytes.fromhex("b8c9")), "encodeFrame at maximum length"
@@ -0,0 +1,239 @@
+
+import hashlib
+import json
+import logging as log
+import os
+import time
+
+from .TargetVar     import TargetVar
+from .TargetClkInfo import TargetClkInfo
+from .TargetClkInfo import TargetClkSrc
+
+class TargetMetadata(object):
+    """
+    Everything a capture needs to know about the experiment on a target
+    which only changes when its firmware does: its variables, randomness
+    configuration, clock configurations and trigger windows measured
+    with it.
+    """
+
+    def __init__(self, experiment_name, build_id):
+        """
+        experiment_name - str
+            As reported by Target.doGetExperiementName.
+        build_id - str
+            As reported by Target.doGetBuildId.
+        """
+        self.experiment_name    = experiment_name
+        self.build_id           = build_id
+
+        # (vid, name, size, flags) tuple for each variable.
+        self.variables          = []
+
+        self.randomness_len     = 0
+        self.randomness_rate    = 0
+
+        # List of TargetClkInfo, and the index of the current one. The
+        # current one is not cached, see TargetMetadataCache.lookup.
+        self.clk_configs        = []
+        self.current_clk_cfg    = None
+
+        # Measured trigger window sizes, keyed by a string describing
+        # the bench setup they were measured with.
+        self.trigger_windows    = {}
+
+    @property
+    def key(self):
+        """Key of the metadata in a TargetMetadataCache."""
+        return TargetMetadata.makeKey(self.experiment_name, self.build_id)
+
+    @staticmethod
+    def makeKey(experiment_name, build_id):
+        return "%s|%s" % (experiment_name, build_id)
+
+    @staticmethod
+    def windowKey(scope_config, power_channel, clk_cfg, sample_freq):
+        """
+        Return the trigger_windows key for a window measured with the
+        target on clock configuration clk_cfg, sampled on channel
+        power_channel of a scope set up from the file scope_config and
+        sampling at sample_freq.
+        """
+        with open(scope_config, "rb") as fh:
+            digest = hashlib.sha256(fh.read()).hexdigest()
+
+        return "%s|%s|%d|%d" % (digest, power_channel, clk_cfg,
+            int(sample_freq))
+
+    @staticmethod
+    def fromTarget(target):
+        """
+        Query the metadata from a connected target. The queries are
+        pipelined, so this takes two round trips however many variables
+        there are.
+
+        target - scass.comms.Target
+        """
+        first = [
+            target.doGetExperiementName(wait=False),
+            target.doGetBuildId(wait=False),
+            target.doGetVarNum(wait=False),
+            target.doRandGetLen(wait=False),
+            target.doRandGetRefreshRate(wait=False),
+            target.doGetSysClkInfo(wait=False)
+        ]
+
+        name, build_id, var_num, rand_len, rand_rate, clk_info = \
+            _results(target, first)
+
+        tr = TargetMetadata(name, build_id)
+
+        tr.randomness_len       = rand_len
+        tr.randomness_rate      = rand_rate
+        tr.current_clk_cfg, tr.clk_configs = clk_info
+
+        infos = _results(target,
+            [target.doGetVarInfo(i, wait=False) for i in range(0, var_num)])
+
+        tr.variables = [(v.vid, v.name, v.size, v.flags) for v in infos]
+
+        return tr
+
+    def targetVars(self):
+        """
+        Return a new list of TargetVar objects describing the variables.
+        """
+        return [TargetVar(*v) for v in self.variables]
+
+    def toDict(self):
+        """Return the metadata as a JSON serialisable dict."""
+        return {
+            "experiment_name"   : self.experiment_name,
+            "build_id"          : self.build_id,
+            "variables"         : [list(v) for v in self.variables],
+            "randomness_len"    : self.randomness_len,
+            "randomness_rate"   : self.randomness_rate,
+            "clk_configs"       : [[c.sys_clk_rate, c.sys_clk_src.value]
+                for c in self.clk_configs],
+            "trigger_windows"   : dict(self.trigger_windows)
+        }
+
+    @staticmethod
+    def fromDict(d):
+        """Inverse of toDict."""
+        tr = TargetMetadata(d["experiment_name"], d["build_id"])
+
+        tr.variables            = [tuple(v) for v in d["variables"]]
+        tr.randomness_len       = d["randomness_len"]
+        tr.randomness_rate      = d["randomness_rate"]
+        tr.clk_configs          = [TargetClkInfo(rate, TargetClkSrc(src))
+            for rate, src in d["clk_configs"]]
+        tr.trigger_windows      = dict(d["trigger_windows"])
+
+        return tr
+
+
+class TargetMetadataCache(object):
+    """
+    A JSON file of TargetMetadata, keyed by experiment name and firmware
+    build ID, so repeated captures with the same firmware can skip
+    querying the target for it.
+    """
+
+    def __init__(self, path):
+        """
+        path - str
+            Cache file. Need not exist yet.
+        """
+        self.path       = path
+        self.entries    = {}
+
+        if(os.path.isfile(path)):
+            with open(path, "r") as fh:
+                for key, d in json.load(fh).items():
+                    self.entries[key] = TargetMetadata.fromDict(d)
+
+    def lookup(self, target):
+        """
+        Return the TargetMetadata of the firmware on a connected target.
+
+        The name, build ID and clock information are fetched in a
+        single pipelined round trip. Metadata cached for that name and
+        build ID is used if the target's clock configurations still
+        match it; the build ID is trusted to change with the firmware.
+        If none is cached, or it is out of date, the metadata is queried
+        from the target and added to the cache, which is then saved.
+
+        Firmware which reports an empty build ID cannot be told apart
+        from other builds, so its metadata is always queried afresh.
+
+        target - scass.comms.Target
+        """
+        start = time.time()
+
+        name, build_id, clk_info = _results(target, [
+            target.doGetExperiementName(wait=False),
+            target.doGetBuildId(wait=False),
+            target.doGetSysClkInfo(wait=False)
+        ])
+
+        current, clk_configs = clk_info
+
+        if(build_id == ""):
+            log.warning(("Target firmware '%s' reports no build ID, so its "+
+                "metadata cannot be cached. Set SCASS_BUILD_ID, e.g. with "+
+                "target/scass/scass_build_id.mk.") % name)
+            return TargetMetadata.fromTarget(target)
+
+        key         = TargetMetadata.makeKey(name, build_id)
+        metadata    = self.entries.get(key, None)
+
+        if(metadata is not None and
+           [(c.sys_clk_rate, c.sys_clk_src) for c in clk_configs] !=
+           [(c.sys_clk_rate, c.sys_clk_src) for c in metadata.clk_configs]):
+            log.warning("Cached target metadata for '%s' is out of date" % (
+                key))
+            metadata = None
+
+        if(metadata is not None):
+            log.info("Cached target metadata for '%s' valid (%.3fs)" % (
+                key, time.time() - start))
+
+        else:
+            log.info("Querying target metadata for '%s'" % key)
+            metadata = TargetMetadata.fromTarget(target)
+            self.entries[metadata.key] = metadata
+            self.save()
+
+        metadata.current_clk_cfg = current
+
+        return metadata
+
+    def save(self):
+        """
+        Write the cache file. Written to a temporary file first, so an
+        interrupted write never leaves a corrupt cache.
+        """
+        tmp = self.path + ".tmp"
+
+        with open(tmp, "w") as fh:
+            json.dump(dict([(k, m.toDict()) for k, m in self.entries.items()]),
+                fh, indent = 2, sort_keys = True)
+
+        os.replace(tmp, self.path)
+
+
+def _results(target, commands):
+    """
+    Wait for the results of commands sent with wait=False, in order.
+    Raises the TargetCommandError of the first to fail.
+    """
+    tr = []
+
+    for cmd in commands:
+        target.untrackCommand(cmd)
+
+    for cmd in commands:
+        tr.append(cmd.result())
+
+    return tr
@@ -0,0 +1,165 @@
+
+import numpy as np
+
+from .TargetVar import SCASS_FLAG_RANDOMISE
+from .TargetVar import SCASS_FLAG_INPUT
+from .TargetVar import SCASS_FLAG_TTEST_VAR
+from .TargetVar import TargetVar
+
+def lowbias32(x):
+    """
+    Vectorised lowbias32 integer hash, identical to the one in
+    scass_target.c. A bijection on 32-bit words.
+    """
+    x = np.asarray(x, dtype=np.uint32).copy()
+
+    x ^= x >> np.uint32(16)
+    x *= np.uint32(0x7feb352d)
+    x ^= x >> np.uint32(15)
+    x *= np.uint32(0x846ca68b)
+    x ^= x >> np.uint32(16)
+
+    return x
+
+
+def isPRNGVariable(flags, fixed):
+    """
+    Return True if the target PRNG fills in a variable with these flags
+    before a fixed (True) or random (False) experiment run. Randomisable
+    inputs are filled in, except TTest variables on fixed runs.
+    """
+    if(not (flags & SCASS_FLAG_RANDOMISE) or not (flags & SCASS_FLAG_INPUT)):
+        return False
+
+    return not (fixed and (flags & SCASS_FLAG_TTEST_VAR))
+
+
+class TargetPRNG(object):
+    """
+    Host side replay of the counter based PRNG the target uses to
+    generate its own randomisable inputs, after Target.doPRNGSeed.
+
+    Word n of the stream is lowbias32(lowbias32(seed) + n). Before each
+    run the target fills every PRNG variable (see isPRNGVariable), in
+    variable index order, with whole little endian words, discarding
+    any unused bytes of the last word.
+    """
+
+    def __init__(self, seed):
+        """
+        seed - int
+            The 32-bit seed sent to the target.
+        """
+        self.seed   = seed & 0xFFFFFFFF
+        self._key   = lowbias32(self.seed)
+
+        # Index of the next word the target will generate.
+        self.counter= 0
+
+
+    def words(self, counters):
+        """
+        Return the PRNG words at the given stream positions.
+        """
+        c = np.asarray(counters, dtype=np.uint64) & np.uint64(0xFFFFFFFF)
+
+        return lowbias32((c.astype(np.uint32) + self._key).astype(np.uint32))
+
+
+    def replay(self, variables, fixed_bits, batch_size = 100000):
+        """
+        Reconstruct the values the target generated for a sequence of
+        runs, and advance the counter past them.
+
+        variables - list of TargetVar
+            Every variable on the target, in index order.
+        fixed_bits - np.ndarray
+            One entry per run, non-zero for a fixed run.
+        batch_size - int
+            Runs reconstructed at once, bounding temporary memory.
+
+        Returns a dict, keyed by variable name, of (runs x size) uint8
+        arrays. Only PRNG variables are included, and rows for runs where
+        the variable was not generated are zero.
+        """
+        fixed_bits  = np.asarray(fixed_bits) != 0
+        runs        = fixed_bits.size
+
+        # Word offset of each variable within a run, and words per run,
+        # for random (0) and fixed (1) runs.
+        offsets     = [{}, {}]
+        run_words   = [0, 0]
+
+        for f in (0, 1):
+            for var in variables:
+                if(isPRNGVariable(var.flags, f)):
+                    offsets[f][var.name] = run_words[f]
+                    run_words[f]        += (var.size + 3) // 4
+
+        values      = dict([(v.name, np.zeros((runs, v.size), dtype=np.uint8))
+            for v in variables
+            if isPRNGVariable(v.flags, 0) or isPRNGVariable(v.flags, 1)])
+
+        for first in range(0, runs, batch_size):
+
+            last    = min(first + batch_size, runs)
+            fb      = fixed_bits[first:last]
+            per_run = np.where(fb, run_words[1], run_words[0]).astype(np.uint64)
+            start   = self.counter + np.cumsum(per_run) - per_run
+
+            for var in variables:
+
+                if(var.name not in values):
+                    continue
+
+                nwords  = (var.size + 3) // 4
+
+                for f in (0, 1):
+
+                    if(var.name not in offsets[f]):
+                        continue
+
+                    rows    = np.nonzero(fb == f)[0]
+                    pos     = start[rows] + np.uint64(offsets[f][var.name])
+                    w       = self.words(pos[:,np.newaxis] +
+                        np.arange(nwords, dtype=np.uint64))
+                    b       = w.astype("<u4").view(np.uint8).reshape(
+                        rows.size, nwords * 4)
+
+                    values[var.name][first + rows] = b[:, 0:var.size]
+
+            self.counter += int(np.sum(per_run))
+
+        return values
+
+
+def checkKnownAnswers():
+    """
+    Check lowbias32 and TargetPRNG against values generated by lowbias32
+    and prng_randomise_inputs in scass_target.c, so the host replays the
+    same stream as the target. Raises an AssertionError if not.
+    """
+    assert(lowbias32([0, 1, 0x12345678, 0xFFFFFFFF]).tolist() ==
+        [0x00000000, 0x688990C0, 0xF5E71C96, 0x6768824A]), "lowbias32"
+
+    variables = [
+        TargetVar(0, "key" , 16, SCASS_FLAG_RANDOMISE | SCASS_FLAG_INPUT |
+            SCASS_FLAG_TTEST_VAR),
+        TargetVar(1, "mask",  6, SCASS_FLAG_RANDOMISE | SCASS_FLAG_INPUT),
+        TargetVar(2, "pt"  ,  3, SCASS_FLAG_INPUT)
+    ]
+
+    prng    = TargetPRNG(0xC0FFEE)
+    values  = prng.replay(variables, [0, 1, 1, 0])
+
+    assert(sorted(values.keys()) == ["key", "mask"]), "PRNG variables"
+
+    assert([r.tobytes().hex() for r in values["key"]] == [
+        "ecd26be9683dcaf7a944ba595821a35d", "00" * 16, "00" * 16,
+        "e374774712b90d44d892c3e84fb857c0"]), "TTest variable values"
+
+    assert([r.tobytes().hex() for r in values["mask"]] == [
+        "00c30a5a9c69", "cd71f0356d0b", "46e0c621fef1", "1b256d75d26f"]), \
+        "non-TTest variable values"
+
+    assert(prng.counter == 16), "PRNG words consumed"
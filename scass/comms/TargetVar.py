@@ -41,6 +41,16 @@ class TargetVar:
         """
         self._current_value = secrets.token_bytes(self.size)
 
+    def setCurrentValue(self, v):
+        """
+        Set the current value of the variable, e.g. after reading back
+        an output variable from the target.
+        """
+        assert(isinstance(v,bytes))
+        assert(len(v) == self.size)
+
+        self._current_value = v
+
     def takeFixedValue(self):
         """
         Set the current value of the variable to it's TTest "fixed" value.
@@ -1,3 +1,12 @@
 
 from .Target        import Target
+from .Target        import TargetCommand
+from .Target        import TargetCommandError
+from .Target        import TargetDebugMessage
+from .AsyncTarget   import AsyncTarget
 from .TargetClkInfo import *
+from .TargetFrame   import encodeFrame
+from .TargetFrame   import frameCRC
+from .TargetMetadata import TargetMetadata
+from .TargetMetadata import TargetMetadataCache
+from .TargetPRNG    import TargetPRNG
@@ -1,4 +1,7 @@
 
+import numpy as np
+
+
 sbox = [
 0x63,0x7c,0x77,0x7b,0xf2,0x6b,0x6f,0xc5,0x30,0x01,0x67,0x2b,0xfe,0xd7,0xab,0x76,
 0xca,0x82,0xc9,0x7d,0xfa,0x59,0x47,0xf0,0xad,0xd4,0xa2,0xaf,0x9c,0xa4,0x72,0xc0,
@@ -18,3 +21,117 @@ sbox = [
 0x8c,0xa1,0x89,0x0d,0xbf,0xe6,0x42,0x68,0x41,0x99,0x2d,0x0f,0xb0,0x54,0xbb,0x16
 ]
 
+inv_sbox = [0] * 256
+
+for _i, _v in enumerate(sbox):
+    inv_sbox[_v] = _i
+
+#: Round constants for the AES-128 key schedule.
+rcon = [0x01,0x02,0x04,0x08,0x10,0x20,0x40,0x80,0x1b,0x36]
+
+#: Byte index of the state before ShiftRows which ends up at each index
+#: of the state after ShiftRows. Column major, as in FIPS-197.
+shift_rows = [0,5,10,15,4,9,14,3,8,13,2,7,12,1,6,11]
+
+#: Inverse of shift_rows.
+inv_shift_rows = [shift_rows.index(i) for i in range(16)]
+
+_SBOX     = np.array(sbox    , dtype=np.uint8)
+_INV_SBOX = np.array(inv_sbox, dtype=np.uint8)
+
+
+def _asKeyArray(keys):
+    """
+    Return keys as a Dx16 uint8 array, accepting bytes or a single key.
+    """
+    if(isinstance(keys, (bytes, bytearray))):
+        keys = np.frombuffer(keys, dtype=np.uint8)
+
+    keys = np.asarray(keys, dtype=np.uint8)
+
+    if(keys.ndim == 1):
+        keys = keys[np.newaxis,:]
+
+    assert(keys.shape[1] == 16), "Only AES-128 (16 byte) keys are supported"
+
+    return keys
+
+
+def expandKey(keys):
+    """
+    AES-128 key expansion for every row of the Dx16 array keys.
+    Returns a Dx11x16 array of round keys.
+    """
+    keys = _asKeyArray(keys)
+
+    rk   = np.zeros((keys.shape[0], 11, 16), dtype=np.uint8)
+    rk[:,0] = keys
+
+    for r in range(1, 11):
+        prev = rk[:,r-1]
+        t    = _SBOX[prev[:,[13,14,15,12]]]
+        t[:,0] ^= rcon[r-1]
+
+        for w in range(4):
+            t = t ^ prev[:,4*w:4*w+4]
+            rk[:,r,4*w:4*w+4] = t
+
+    return rk
+
+
+def invertKeySchedule(last_round_keys):
+    """
+    Recover the AES-128 cipher key from the last (10th) round key, for
+    every row of the Dx16 array last_round_keys.
+    Returns a Dx16 array of cipher keys.
+    """
+    rk = _asKeyArray(last_round_keys).copy()
+
+    for r in range(10, 0, -1):
+        prev = np.zeros_like(rk)
+
+        for w in range(3, 0, -1):
+            prev[:,4*w:4*w+4] = rk[:,4*w:4*w+4] ^ rk[:,4*w-4:4*w]
+
+        t = _SBOX[prev[:,[13,14,15,12]]]
+        t[:,0] ^= rcon[r-1]
+
+        prev[:,0:4] = rk[:,0:4] ^ t
+        rk          = prev
+
+    return rk
+
+
+def _xtime(x):
+    """Multiply every byte of x by 2 in GF(2^8)"""
+    return ((x << 1) ^ (((x >> 7) & 1) * 0x1b)).astype(np.uint8)
+
+
+def encrypt(keys, plaintexts):
+    """
+    Vectorised AES-128 encryption of every row of the Dx16 array
+    plaintexts. keys is either a single key, used for every plaintext,
+    or a Dx16 array with one key per plaintext.
+    Returns a Dx16 array of ciphertexts.
+    """
+    rk    = expandKey(keys)
+    state = np.array(plaintexts, dtype=np.uint8, ndmin=2) ^ rk[:,0]
+
+    for r in range(1, 11):
+        state = _SBOX[state][:,shift_rows]
+
+        if(r < 10):
+            cols  = state.reshape(-1, 4, 4)
+            a0, a1, a2, a3 = [cols[:,:,i] for i in range(4)]
+            t     = a0 ^ a1 ^ a2 ^ a3
+            mixed = np.stack([
+                a0 ^ t ^ _xtime(a0 ^ a1),
+                a1 ^ t ^ _xtime(a1 ^ a2),
+                a2 ^ t ^ _xtime(a2 ^ a3),
+                a3 ^ t ^ _xtime(a3 ^ a0),
+            ], axis=2)
+            state = mixed.reshape(-1, 16)
+
+        state = state ^ rk[:,r]
+
+    return state
@@ -0,0 +1,106 @@
+
+"""
+Vectorised bit-level kernels used to build hypothesis matrices.
+
+All functions accept numpy arrays of any integer width. Signed values are
+treated as their two's complement bit patterns.
+"""
+
+import numpy as np
+
+#: Number of set bits in every possible byte value.
+POPCOUNT_LUT = np.array([bin(i).count("1") for i in range(256)],
+    dtype=np.uint8)
+
+def _asUnsigned(x):
+    """
+    Return x as a contiguous numpy array of an unsigned integer type with
+    the same width.
+    """
+    x = np.asarray(x)
+
+    if(not x.flags.c_contiguous):
+        x = x.copy()
+
+    if(x.dtype == np.bool_):
+        return x.view(np.uint8)
+
+    if(not np.issubdtype(x.dtype, np.integer)):
+        raise TypeError("Expected an integer array, got %s" % x.dtype)
+
+    if(np.issubdtype(x.dtype, np.signedinteger)):
+        x = x.view(np.dtype("u%d" % x.dtype.itemsize))
+
+    return x
+
+
+def _byteView(x):
+    """
+    Return the bytes of the unsigned array x as a uint8 array with an
+    extra trailing axis of length x.itemsize.
+    """
+    return x.view(np.uint8).reshape(x.shape + (x.dtype.itemsize,))
+
+
+def hammingWeight(x):
+    """
+    Element-wise hamming weight. For a (D, nbytes) uint8 array this is the
+    per-byte weight, for wider types it is the per-word weight.
+    Returns a uint8 array the same shape as x.
+    """
+    u = _asUnsigned(x)
+
+    if(u.dtype.itemsize == 1):
+        return POPCOUNT_LUT[u]
+
+    b = _byteView(u.reshape(u.shape or (1,)))
+
+    return POPCOUNT_LUT[b].sum(axis=-1, dtype=np.uint8).reshape(u.shape)
+
+
+def hammingWeightWords(x, word_bytes):
+    """
+    Hamming weight of consecutive groups of word_bytes elements along the
+    last axis of x. E.g. for a (D, 16) uint8 array and word_bytes=4, this
+    returns a (D, 4) array of 32-bit word weights.
+    """
+    u = _asUnsigned(x)
+    n = u.shape[-1]
+
+    assert(n % word_bytes == 0), \
+        "Last axis (%d) must be a multiple of word_bytes (%d)" % (
+            n, word_bytes)
+
+    w = hammingWeight(u).reshape(u.shape[:-1] + (n//word_bytes, word_bytes))
+
+    return w.sum(axis=-1, dtype=np.uint32)
+
+
+def hammingWeightVector(x):
+    """
+    Hamming weight of each row of x, i.e. the sum over every axis but
+    the first. A 1d array is treated as one value per row.
+    Returns a 1d uint32 array with one element per row.
+    """
+    w = hammingWeight(x)
+
+    if(w.ndim <= 1):
+        return w.astype(np.uint32)
+
+    return w.reshape(w.shape[0], -1).sum(axis=1, dtype=np.uint32)
+
+
+def hammingDistance(x, y):
+    """Element-wise hamming distance between x and y."""
+    return hammingWeight(np.bitwise_xor(_asUnsigned(x), _asUnsigned(y)))
+
+
+def hammingDistanceWords(x, y, word_bytes):
+    """Per-word hamming distance between x and y. See hammingWeightWords."""
+    return hammingWeightWords(
+        np.bitwise_xor(_asUnsigned(x), _asUnsigned(y)), word_bytes)
+
+
+def hammingDistanceVector(x, y):
+    """Per-row hamming distance between x and y. See hammingWeightVector."""
+    return hammingWeightVector(np.bitwise_xor(_asUnsigned(x),_asUnsigned(y)))
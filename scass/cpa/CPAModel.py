@@ -1,20 +1,81 @@
 
+import numpy as np
+
+from .AES        import sbox     as aes_sbox
+from .AES        import inv_sbox as aes_inv_sbox
+from .AES        import shift_rows
+from .BitKernels import hammingWeight
+
+SBOX        = np.array(aes_sbox    , dtype=np.uint8)
+INV_SBOX    = np.array(aes_inv_sbox, dtype=np.uint8)
 
 class CPAModel(object):
     """
     A abstract class for describing power models.
+
+    A model maps an array of D input bytes to a DxK matrix of
+    hypothesised power values, one column per key guess. Every model is
+    defined by a 256xK table of leakage values for each (input, guess)
+    pair, which is computed once and cached.
     """
 
-    def __init__(self):
+    #: True if the model targets the last AES round, so the input bytes
+    #: are ciphertext bytes and the guesses are last round key bytes.
+    attacks_last_round = False
+
+    def __init__(self, K = 256):
         """
         Create the model.
+
+        K - int
+            Number of key guesses.
+        """
+        self._k     = K
+        self._table = None
+    
+    def _leakage(self, d, k):
+        """
+        Return the power estimate for input bytes d and key guesses k.
+        Called once with broadcastable arrays d (256x1) and k (1xK) to
+        build the model's table. Inheriting classes should overwrite this.
+        """
+        raise NotImplementedError("_leakage not implemented")
+
+    @property
+    def K(self):
+        """Number of key guesses"""
+        return self._k
+
+    @property
+    def table(self):
+        """The cached 256xK table of leakage values"""
+        if(self._table is None):
+            d = np.arange(256   , dtype=np.uint8)[:,np.newaxis]
+            k = np.arange(self.K, dtype=np.uint8)[np.newaxis,:]
+            t = np.broadcast_to(self._leakage(d, k), (256, self.K))
+            self._table = np.ascontiguousarray(t)
+        return self._table
+
+    def hypotheses(self, d):
+        """
+        Return the DxK matrix of power estimates for every input byte in
+        the length D array d and every key guess.
+        """
+        return self.table[np.asarray(d, dtype=np.uint8)]
+
+    def inputHypotheses(self, inputs, b):
         """
+        Return the DxK matrix of power estimates for byte b of the DxN
+        array of input bytes. Models which depend on more than one byte
+        of the input should overwrite this.
+        """
+        return self.hypotheses(inputs[:,b])
     
     def getEstimate(self,d,k):
         """
         Get a power estimate for the input data
         """
-        return 0.0
+        return float(self.table[d,k])
 
 class CPAModelHammingWeightD(CPAModel):
     """
@@ -22,17 +83,11 @@ class CPAModelHammingWeightD(CPAModel):
     of the input data array.
     """
 
-    def getEstimate(self,d,k):
+    def _leakage(self, d, k):
         """
-        Get a power estimate for the input data.
-        - Uses only the `d` parameters, and returns it's hamming weight.
+        Uses only the `d` parameters, and returns it's hamming weight.
         """
-        count = 0.0
-        
-        for i in range(0,8):
-            count += float((d >> i) & 0x1)
-
-        return count
+        return hammingWeight(d)
 
 class CPAModelHammingDistance(CPAModel):
     """
@@ -40,15 +95,124 @@ class CPAModelHammingDistance(CPAModel):
     between the input d and k arrays.
     """
 
-    def getEstimate(self,d,k):
+    def _leakage(self, d, k):
+        """
+        Returns the hamming distance between d and k.
+        """
+        return hammingWeight(d ^ k)
+
+class CPAModelHammingWeightSbox(CPAModel):
+    """
+    Hamming weight of the first round AES S-box output, sbox[d ^ k].
+    """
+
+    def _leakage(self, d, k):
+        return hammingWeight(SBOX[d ^ k])
+
+class CPAModelHammingDistanceSbox(CPAModel):
+    """
+    Hamming distance between the first round AES S-box input and output,
+    i.e. a register holding d ^ k being overwritten with sbox[d ^ k].
+    """
+
+    def _leakage(self, d, k):
+        return hammingWeight((d ^ k) ^ SBOX[d ^ k])
+
+class CPAModelIdentity(CPAModel):
+    """
+    The value of the first round AES S-box output, sbox[d ^ k].
+    """
+
+    def _leakage(self, d, k):
+        return SBOX[d ^ k]
+
+class CPAModelBit(CPAModel):
+    """
+    A single bit of the first round AES S-box output, sbox[d ^ k].
+    """
+
+    def __init__(self, bit, K = 256):
+        """
+        bit - int
+            Index of the S-box output bit to use, 0 being the LSB.
+        """
+        CPAModel.__init__(self, K)
+        assert(bit >= 0 and bit < 8)
+        self.bit = bit
+
+    def _leakage(self, d, k):
+        return (SBOX[d ^ k] >> self.bit) & 0x1
+
+class CPAModelLastRoundHW(CPAModel):
+    """
+    Last round AES model. d is a ciphertext byte and k a guess of the
+    corresponding last round key byte. Returns the hamming weight of the
+    last S-box input, inv_sbox[d ^ k].
+    """
+
+    attacks_last_round = True
+
+    def _leakage(self, d, k):
+        return hammingWeight(INV_SBOX[d ^ k])
+
+class CPAModelLastRoundHD(CPAModel):
+    """
+    Last round AES model. d is a ciphertext byte and k a guess of the
+    corresponding last round key byte. Returns the hamming distance
+    between the last S-box input, inv_sbox[d ^ k], and the ciphertext
+    byte which overwrites it in the state.
+    """
+
+    attacks_last_round = True
+
+    def __init__(self, shifted = True, K = 256):
+        """
+        shifted - bool
+            If True, the S-box input for ciphertext byte b is assumed to
+            be overwritten by ciphertext byte shift_rows[b], as for an
+            in-place state where ShiftRows moves bytes between the last
+            S-box and the output. If False, by ciphertext byte b.
+        """
+        CPAModel.__init__(self, K)
+        self.shifted = shifted
+
+    def _leakage(self, d, k):
+        return hammingWeight(INV_SBOX[d ^ k] ^ d)
+
+    def inputHypotheses(self, inputs, b):
+        if(not self.shifted):
+            return self.hypotheses(inputs[:,b])
+
+        d       = np.asarray(inputs[:,b], dtype=np.uint8)[:,np.newaxis]
+        prev    = np.asarray(inputs[:,shift_rows[b]], dtype=np.uint8)
+        k       = np.arange(self.K, dtype=np.uint8)[np.newaxis,:]
+
+        return hammingWeight(INV_SBOX[d ^ k] ^ prev[:,np.newaxis])
+
+class CPAModelTable(CPAModel):
+    """
+    A user supplied leakage model. The power estimate is
+    table[sbox[d ^ k]], or table[d ^ k] if apply_sbox is False.
+    """
+
+    def __init__(self, table, apply_sbox = True, K = 256):
         """
-        Get a power estimate for the input data.
-        - Returns the hamming distance between d and k.
+        table - array like
+            256 entries, giving the leakage of each intermediate value.
+        apply_sbox - bool
+            Index the table with the S-box output if True, or with the
+            S-box input (d ^ k) if False.
         """
-        count = 0.0
-        
-        axb = d ^ k
-        for i in range(0,8):
-            count += float((axb >> i) & 0x1)
+        CPAModel.__init__(self, K)
+        self.leakage_table  = np.asarray(table)
+        self.apply_sbox     = apply_sbox
+        assert(self.leakage_table.shape == (256,)), \
+            "Leakage table must have 256 entries"
+        assert(self.leakage_table.dtype.kind in "buif"), \
+            "Leakage table must be numeric, not %s" % (
+                str(self.leakage_table.dtype))
 
-        return count
+    def _leakage(self, d, k):
+        if(self.apply_sbox):
+            return self.leakage_table[SBOX[d ^ k]]
+        return self.leakage_table[d ^ k]
@@ -11,6 +11,7 @@ import numpy as np
 from tqdm    import tqdm
 
 from ..comms import Target
+from ..comms import TargetPRNG
 from ..scope.Scope import Scope
 from ..scope.ScopeChannel import ScopeChannel
 
@@ -85,6 +86,19 @@ class CollectTraces(object):
         self.tgt_randomness_size = 0
         self.tgt_randomness_rate = 0
         self.tgt_randomness_count= 0
+
+        # If set, read back every output variable after each trace.
+        self.read_output_vars    = False
+
+        # If set, the target generates randomisable input values itself
+        # with its seeded PRNG, and the host replays it to recover them.
+        self.target_prng         = False
+        self.prng                = None
+
+        # If > 0, capture traces in bursts of this many runs, each from a
+        # single Target.doRunBurst command and a segmented scope capture.
+        self.burst_size          = 0
+        self.burst_timeout       = 30
     
     def getVariableValuesForTraces(self, varname):
         return self.tgt_vars_values[varname]
@@ -179,22 +193,28 @@ class CollectTraces(object):
         Randomise all of the variable values which need it, and
         update the target randomness pool.
         """
+        if(self.target_prng):
+            return
+
         for var in self.tgt_vars:
             if(var.is_input and var.is_randomisable):
                 var.randomiseValue()
                 var.setFixedValue(var.current_value)
-                self.target.doSetVarValue(var.vid, var.current_value)
+                self.target.doSetVarValue(var.vid, var.current_value, wait=False)
 
     def _gatherTrace(self, i):
         """
         Collect a single trace.
         """
         self.scope.runCapture()
-        self.target.doRunRandomExperiment()
+        self.target.doRunRandomExperiment(wait=False)
 
         while(not self.scope.dataReady()):
             pass
 
+        # Check the variable uploads and run all succeeded.
+        self.target.waitForCommands()
+
         new_trace = self.scope.getRawChannelData (
             self.signal_channel,
             numSamples = self.num_samples
@@ -205,9 +225,50 @@ class CollectTraces(object):
         
         # Capture the variable values
         for var in self.tgt_vars:
-            for i in range(0,var.size):
-                self.tgt_vars_values[var.name][self.trace_count][i] = \
-                    var.current_value[i]
+            if(var.is_output and self.read_output_vars):
+                value = self.target.doGetVarValue(var.vid, var.size)
+                assert(value != False), \
+                    "Failed to read output variable %s" % var.name
+                var.setCurrentValue(value)
+
+            self.tgt_vars_values[var.name][self.trace_count] = \
+                np.frombuffer(var.current_value, dtype=np.uint8)
+
+
+    def _gatherBurst(self, count):
+        """
+        Collect count traces with a single burst command and segmented
+        scope capture.
+        """
+        self.scope.runSegmentedCapture(count)
+
+        status = self.target.doRunBurst(
+            np.zeros(count, dtype=np.int8), timeout=self.burst_timeout)
+
+        assert(status != False), "Burst of %d runs failed" % count
+
+        if(status[1] > 0):
+            log.warning("%d of %d burst runs failed, first at run %d" % (
+                status[1], status[0], status[2]))
+
+        while(not self.scope.dataReady()):
+            pass
+
+        new_traces = self.scope.getRawSegmentedChannelData(
+            self.signal_channel, count, numSamples = self.num_samples)
+
+        for new_trace in new_traces:
+
+            self.traces[self.trace_count] = new_trace
+
+            for var in self.tgt_vars:
+                self.tgt_vars_values[var.name][self.trace_count] = \
+                    np.frombuffer(var.current_value, dtype=np.uint8)
+
+            self.trace_count += 1
+
+        # The target randomness cannot change during a burst.
+        self._useTargetRandomness(len(new_traces))
 
 
     def _postGatherTrace(self, i):
@@ -215,13 +276,23 @@ class CollectTraces(object):
         Called after _gatherTrace. Update the target randomness pool
         if needed.
         """
-        self.tgt_randomness_count += 1
+        self._useTargetRandomness(1)
+        
+        self.trace_count += 1
+
+
+    def _useTargetRandomness(self, runs):
+        """
+        Count runs more experiment runs against the target randomness,
+        and refresh it once it has been used for more than
+        tgt_randomness_rate runs.
+        """
+        self.tgt_randomness_count += runs
 
         if(self.tgt_randomness_count > self.tgt_randomness_rate):
             if(self.tgt_randomness_rate > 0):
-                self._update_target_randomness()
-        
-        self.trace_count += 1
+                self._updateTargetRandomness()
+                self.tgt_randomness_count = 0
 
 
     def gatherTraces(self):
@@ -231,9 +302,36 @@ class CollectTraces(object):
 
         self._setupVariableValues()
 
+        if(self.target_prng):
+            seed = secrets.randbits(32)
+            log.info("Seeding target input PRNG with %s" % hex(seed))
+            self.target.doPRNGSeed(seed)
+            self.prng = TargetPRNG(seed)
+
         log.info("Gathering Traces...")
 
-        for i in tqdm(range(0,self.num_traces)):
-            self._preGatherTrace(i)
-            self._gatherTrace(i)
-            self._postGatherTrace(i)
+        if(self.burst_size > 0):
+
+            assert(self.target_prng or not any([v.is_input and \
+                v.is_randomisable for v in self.tgt_vars])), \
+                "Burst capture needs target_prng to randomise input variables"
+            assert(not self.read_output_vars), \
+                "Output variables cannot be read back during burst capture"
+
+            for first in tqdm(range(0, self.num_traces, self.burst_size)):
+                self._gatherBurst(
+                    min(self.burst_size, self.num_traces - first))
+
+        else:
+
+            for i in tqdm(range(0,self.num_traces)):
+                self._preGatherTrace(i)
+                self._gatherTrace(i)
+                self._postGatherTrace(i)
+
+        if(self.prng is not None):
+            log.info("Replaying target PRNG for input variable values")
+            values = self.prng.replay(self.tgt_vars,
+                np.zeros(self.trace_count, dtype=np.int8))
+            for name in values:
+                self.tgt_vars_values[name][0:self.trace_count] = values[name]
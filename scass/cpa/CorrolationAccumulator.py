@@ -0,0 +1,246 @@
+
+import logging as log
+
+import numpy as np
+
+from ..trace import iterTracesFromDisk
+
+class CorrolationAccumulator(object):
+    """
+    Accumulates running sums over chunks of traces and hypotheses, so
+    that the correlation between them can be computed without ever
+    holding all of the traces in memory at once.
+    """
+
+    def __init__(self):
+        """
+        Create a new, empty accumulator. The number of hypotheses and
+        samples per trace are taken from the first chunk added.
+        """
+
+        self._n         = 0
+
+        # Offsets subtracted from every value before it is accumulated.
+        # Taken from the mean of the first chunk, they keep the sums
+        # small and the final variances numerically stable.
+        self._h_off     = None
+        self._t_off     = None
+
+        self._sum_h     = None
+        self._sum_hh    = None
+        self._sum_t     = None
+        self._sum_tt    = None
+        self._sum_ht    = None
+
+
+    def addTraces(self, H, T):
+        """
+        Add a chunk of traces and their hypothesised values.
+
+        H - np.ndarray
+            A DxK matrix of hypotheses, or a length D vector.
+        T - np.ndarray
+            A DxT matrix of traces, one trace per row.
+        """
+        H   = np.asarray(H, dtype=np.float64)
+
+        if(H.ndim == 1):
+            H = H[:,np.newaxis]
+
+        D   = T.shape[0]
+
+        assert(H.shape[0] == D), "H has %d rows but T has %d" % (
+            H.shape[0], D)
+
+        if(D == 0):
+            return
+
+        if(self._n == 0):
+            self._h_off     = np.mean(H, axis=0)
+            self._t_off     = np.mean(T, axis=0, dtype=np.float64)
+
+            K, S            = H.shape[1], T.shape[1]
+
+            self._sum_h     = np.zeros(K)
+            self._sum_hh    = np.zeros(K)
+            self._sum_t     = np.zeros(S)
+            self._sum_tt    = np.zeros(S)
+            self._sum_ht    = np.zeros((K, S))
+
+        H_d = H - self._h_off
+        T_d = T - self._t_off
+
+        self._sum_h    += np.sum(H_d, axis=0)
+        self._sum_hh   += np.einsum("ij,ij->j", H_d, H_d)
+        self._sum_t    += np.sum(T_d, axis=0)
+        self._sum_tt   += np.einsum("ij,ij->j", T_d, T_d)
+        self._sum_ht   += np.dot(H_d.T, T_d)
+
+        self._n        += D
+
+
+    def corrolation(self, absolute = True):
+        """
+        Return the KxT matrix of correlation coefficients over all traces
+        added so far. Can be called after any number of chunks.
+        """
+        assert(self._n > 0), "No traces have been added yet"
+
+        n   = self._n
+
+        top = n * self._sum_ht - np.outer(self._sum_h, self._sum_t)
+
+        var_h = np.maximum(n * self._sum_hh - self._sum_h * self._sum_h, 0)
+        var_t = np.maximum(n * self._sum_tt - self._sum_t * self._sum_t, 0)
+
+        bot = np.sqrt(np.outer(var_h, var_t))
+        bot[bot == 0] = np.inf
+
+        R   = top / bot
+
+        if(absolute):
+            np.abs(R, out=R)
+
+        return R
+
+
+    def state(self):
+        """
+        Return the running sums as a dict of arrays, e.g. for np.savez.
+        An accumulator restored with fromState carries on exactly where
+        this one left off.
+        """
+        assert(self._n > 0), "No traces have been added yet"
+
+        return {
+            "n"         : np.array(self._n),
+            "h_off"     : self._h_off,
+            "t_off"     : self._t_off,
+            "sum_h"     : self._sum_h,
+            "sum_hh"    : self._sum_hh,
+            "sum_t"     : self._sum_t,
+            "sum_tt"    : self._sum_tt,
+            "sum_ht"    : self._sum_ht
+        }
+
+
+    @staticmethod
+    def fromState(state):
+        """
+        Create an accumulator from a dict returned by state.
+        """
+        acc             = CorrolationAccumulator()
+
+        acc._n          = int(state["n"])
+        acc._h_off      = np.asarray(state["h_off"])
+        acc._t_off      = np.asarray(state["t_off"])
+        acc._sum_h      = np.array(state["sum_h"])
+        acc._sum_hh     = np.array(state["sum_hh"])
+        acc._sum_t      = np.array(state["sum_t"])
+        acc._sum_tt     = np.array(state["sum_tt"])
+        acc._sum_ht     = np.array(state["sum_ht"])
+
+        return acc
+
+
+    @property
+    def num_traces(self):
+        """Number of traces accumulated so far"""
+        return self._n
+
+    @property
+    def num_hypotheses(self):
+        """Number of hypothesis columns, or None if empty"""
+        return None if self._sum_h is None else self._sum_h.size
+
+    @property
+    def trace_length(self):
+        """Number of samples per trace, or None if empty"""
+        return None if self._sum_t is None else self._sum_t.size
+
+
+def accumulateFromDisk(
+        filepath,
+        H,
+        chunk_size      = 10000,
+        select          = None,
+        preprocess      = None,
+        report_every    = 0,
+        accumulator     = None
+    ):
+    """
+    Stream the traces stored at filepath through a CorrolationAccumulator
+    in chunks of chunk_size traces, so peak memory is independent of the
+    number of traces.
+
+    filepath - str
+        Trace file, as accepted by scass.trace.iterTracesFromDisk
+    H - np.ndarray
+        DxK matrix (or length D vector) of hypotheses, one row per trace
+        in the file.
+    select - np.ndarray or None
+        Optional boolean mask over the traces in the file. Only traces
+        where select is True are used.
+    preprocess - callable or None
+        Optional function applied to each (selected) chunk of traces
+        before accumulation, e.g. a filter. Must act on each trace
+        independently.
+    report_every - int
+        If > 0, record the correlation every report_every chunks.
+    accumulator - CorrolationAccumulator or None
+        Accumulator to add to. A new one is created if None.
+
+    Returns a tuple (accumulator, history), where history is a list of
+    (traces processed, max |R| per hypothesis) tuples, one per report
+    point plus one after the final chunk.
+    """
+    if(accumulator is None):
+        accumulator = CorrolationAccumulator()
+
+    H       = np.asarray(H)
+    if(H.ndim == 1):
+        H = H[:,np.newaxis]
+
+    history = []
+    first   = 0
+
+    for i, chunk in enumerate(iterTracesFromDisk(filepath, chunk_size)):
+
+        last    = first + chunk.shape[0]
+        H_chunk = H[first:last]
+
+        if(select is not None):
+            sel     = select[first:last]
+            chunk   = chunk[sel]
+            H_chunk = H_chunk[sel]
+
+        first   = last
+
+        if(preprocess is not None):
+            chunk = preprocess(chunk)
+
+        accumulator.addTraces(H_chunk, chunk)
+
+        if(report_every > 0 and (i+1) % report_every == 0 and \
+           accumulator.num_traces > 0):
+            R_max = np.max(accumulator.corrolation(), axis=1)
+            history.append((accumulator.num_traces, R_max))
+            log.info("%8d traces: max corrolation %s" % (
+                accumulator.num_traces, str(R_max)))
+
+    if(accumulator.num_traces > 0 and \
+       (len(history) == 0 or history[-1][0] != accumulator.num_traces)):
+        history.append((accumulator.num_traces,
+            np.max(accumulator.corrolation(), axis=1)))
+
+    return (accumulator, history)
+
+
+def saveConvergenceHistory(filepath, history):
+    """
+    Save a history list from accumulateFromDisk as an .npy file of
+    shape (checkpoints, 1+K) where column 0 is the number of traces and
+    the remaining columns are the max |R| of each hypothesis.
+    """
+    rows = [np.concatenate([[n], r]) for n, r in history]
+    np.save(filepath, np.array(rows))
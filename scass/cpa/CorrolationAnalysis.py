@@ -7,45 +7,25 @@ from multiprocessing import Pool
 
 import numpy as np
 
-from tqdm import tqdm
-
 from ..trace.TraceSet import TraceSet
 
-from .AES import sbox as aes_sbox
-
-
-def parallel_compute_R(H, T, tlen, H_avgs, T_avgs, i,numtraces):
-
-    R_shape = (1, tlen)
-    R       = np.empty(R_shape, dtype = np.float32, order='C')
-
-    H_avg   = H_avgs[i]
-    H_col   = H[:,i]
-    H_col_d = H_col - H_avg
-    H_col_sq_sum = np.dot(H_col_d,H_col_d)
-
-    #log.info("H_col    Shape: %s" % str(H_col   .shape))
-    #log.info("H_col_d  Shape: %s" % str(H_col_d .shape))
-
-    for j in range(0,tlen):
-
-        T_avg   = T_avgs[j]
-        T_col   = T[:numtraces,j]
-        T_col_d = T_col - T_avg
-        T_col_sq_sum = np.dot(T_col_d, T_col_d)
-    
-        #log.info("T_col    Shape: %s" % str(T_col   .shape))
-        #log.info("T_col_d  Shape: %s" % str(T_col_d .shape))
+from .AES        import sbox as aes_sbox
+from .BitKernels import hammingWeight
 
-        top = np.dot(H_col_d, T_col_d)
+from .CPAModel   import CPAModelHammingWeightSbox
 
-        bot = np.sqrt(H_col_sq_sum * T_col_sq_sum)
-        if(bot == 0):
-            bot = 1
+from .CorrolationKernel      import corrolationMatrix
+from .CorrolationAccumulator import CorrolationAccumulator
+from .SecondOrder            import secondOrderCorrolation
+from .SecondOrder            import SecondOrderAccumulator
 
-        R[0,j] = np.abs(top/bot)
 
-    return R
+def parallel_compute_R(H, T_block):
+    """
+    Compute the correlation coefficients between all hypotheses in H and
+    a block of sample columns of T.
+    """
+    return corrolationMatrix(H, T_block).astype(np.float32)
 
 
 class CorrolationAnalysis(object):
@@ -54,7 +34,8 @@ class CorrolationAnalysis(object):
     traces.
     """
 
-    def __init__(self, traces, K = 256, keyBytes = 16, messageBytes=16):
+    def __init__(self, traces, K = 256, keyBytes = 16, messageBytes=16,
+                 model = None, inputs = None):
         """
         Create a new CorrolationAnalysis object which will operate
         on the supplied traces.
@@ -69,6 +50,13 @@ class CorrolationAnalysis(object):
             Number of bytes per key
         messageBytes - int
             Number of bytes per message
+        model - CPAModel
+            Leakage model used to compute hypotheses from message bytes.
+            Defaults to the hamming weight of the first round S-box output.
+        inputs - np.ndarray
+            Optional DxN array of bytes to attack instead of the message
+            bytes in the aux data, e.g. ciphertexts for a last round
+            model.
         """
 
         self.tmat   = traces.tracesAs2dArray().transpose()
@@ -78,29 +66,70 @@ class CorrolationAnalysis(object):
 
         self.max_traces = self._tnum
 
+        # Indexes of the original trace samples in tmat. See selectSamples
+        self.samples    = np.arange(self._tlen)
+
+        # If set to a pair of (start, end) sample windows, computeR does a
+        # second order CPA on centered products of the two windows.
+        self.second_order       = None
+        self.second_order_tile  = 32
+
         self._num_threads = 1
 
         # split key and message into two different chunks
         self.keymat = self.amat[:, 0:keyBytes]
         self.msgmat = self.amat[:,keyBytes:keyBytes+messageBytes]
 
+        if(inputs is not None):
+            assert(inputs.shape[0] == self._tnum), \
+                "%d rows of inputs for %d traces" % (
+                    inputs.shape[0], self._tnum)
+            self.msgmat = np.asarray(inputs, dtype=np.uint8)
+
         self.type_V = np.uint32
         self.type_H = np.uint32
 
         self._k     = K
 
+        if(model is None):
+            model = CPAModelHammingWeightSbox(K)
 
-    def _computeV(self, d, k_guess, V,i,j):
+        assert(model.K == K), "Model has %d guesses, expected %d" % (
+            model.K, K)
+
+        self.model  = model
+
+
+    def selectSamples(self, samples):
         """
-        Computes the intermedate value for a given message byte d
-        and key byte guess k_guess.
+        Restrict the analysis to a subset of the samples in each trace,
+        e.g. points of interest picked by selectPointsOfInterest. Columns
+        of R from computeR then correspond to self.samples.
+
+        samples - np.ndarray
+            Indexes of the samples to keep.
         """
-        try:
-            return aes_sbox[d^k_guess]
-        except:
-            print(hex(d  ))
-            print(hex(k_guess  ))
-            print(hex(d^k_guess))
+        samples         = np.asarray(samples, dtype=np.int64)
+
+        self.tmat       = np.ascontiguousarray(self.tmat[:, samples])
+        self.samples    = self.samples[samples]
+        self._tlen      = samples.size
+
+    def projectTraces(self, projection):
+        """
+        Replace the traces with their projection onto a few components,
+        e.g. from scass.trace.fitPCA. Columns of R from computeR then
+        correspond to components rather than samples.
+
+        projection - scass.trace.Projection
+        """
+        assert(np.array_equal(self.samples, np.arange(self.samples.size))), \
+            "Project traces before selecting samples, or select them in "+\
+            "the projection"
+
+        self.tmat       = projection.project(self.tmat)
+        self.samples    = np.arange(projection.num_components)
+        self._tlen      = projection.num_components
 
     def computeV(self, msgbyte):
         """
@@ -110,23 +139,18 @@ class CorrolationAnalysis(object):
         Returns:
             A DxK matrix of values.
         """
-        V_shape = (self.D, self.K)
-        V       = np.empty(V_shape, dtype=self.type_V, order='C')
+        msgb    = self.msgmat[0:self.D, msgbyte].astype(self.type_V)
+        guesses = np.arange(self.K, dtype=self.type_V)
+
+        sbox    = np.array(aes_sbox, dtype=self.type_V)
 
-        for i in tqdm(range(0,self.D)):
-            for j in range(0,self.K):
-                msgb   = self.msgmat[i,msgbyte]
-                V[i,j] = self._computeV(msgb,j,V,i,msgbyte)
+        V       = sbox[np.bitwise_xor.outer(msgb, guesses)]
 
-        return V
+        return np.ascontiguousarray(V, dtype=self.type_V)
 
     def hw(self, x):
         """Return hamming weight of x"""
-        c = 0
-        while x > 0:
-            c  = c + 1
-            x &= x-1
-        return c
+        return int(hammingWeight(np.asarray(x)))
 
     def hd(self, x, y):
         """Return hamming distance between x and y"""
@@ -137,56 +161,64 @@ class CorrolationAnalysis(object):
         Compute the hypothesised power consumption values from
         the V matrix.
         """
-        H_shape = (self.D, self.K)
-        H       = np.empty(H_shape, dtype=self.type_H, order='C')
-        
-        for i in tqdm(range(0,self.D)):
-            for j in range(0,self.K):
-                ib = V[i,j]
-                
-                # Just do hamming weight for now.
-                H[i,j] = self.hw(ib)
+        # Just do hamming weight for now.
+        H = hammingWeight(V).astype(self.type_H)
 
         return H
 
+    def computeHypotheses(self, msgbyte):
+        """
+        Compute the DxK matrix of hypothesised power consumption values
+        for a given message byte using the analysis' leakage model.
+        Equivalent to computeH(computeV(msgbyte)) for the default model.
+        """
+        inputs  = self.msgmat[0:self.D]
+        H       = np.asarray(self.model.inputHypotheses(inputs, msgbyte))
+
+        # Only unsigned leakage values fit type_H. Others, e.g. from a
+        # CPAModelTable of floats, would be truncated or wrap.
+        if(H.dtype.kind in "bu"):
+            return H.astype(self.type_H)
+
+        return H.astype(np.float64)
+
     def computeR(self, H):
         """
         Compute the matrix of correlation coefficients for each
-        hypothesis.
+        hypothesis. If second_order is set, the columns of R are the
+        window sample pairs, as for secondOrderCorrolation.
         """
 
-        R_shape = (self.K, self.T)
-        R       = np.empty(R_shape, dtype = np.float32, order='C')
+        T       = self.tmat[0:self.D]
 
-        T       = self.tmat
+        start = time.time()
 
-        H_avgs  = np.mean(H, axis=0)
-        T_avgs  = np.mean(T, axis=0)
+        if(self.second_order is not None):
 
-        #log.info("H_avgs Shape: %s" % str(H_avgs.shape))
-        #log.info("T_avgs Shape: %s" % str(T_avgs.shape))
-        #log.info("T      Shape: %s" % str(     T.shape))
+            window_a, window_b = self.second_order
 
-        best_k  = 0.0
-        ind_k   = 0
-    
-        map_arguments = zip(
-            repeat(H),
-            repeat(T),
-            repeat(self._tlen),
-            repeat(H_avgs),
-            repeat(T_avgs),
-            range(0, self.K),
-            repeat(self.D)
-        )
-        
-        start = time.time()
+            R = secondOrderCorrolation(
+                H, T, window_a, window_b, self.second_order_tile
+            ).astype(np.float32)
 
-        with Pool(self.num_threads) as p:
-            results = p.starmap(parallel_compute_R, map_arguments)
+        elif(self.num_threads > 1):
 
-            for i in range(0, self.K):
-                R[i,:] = results[i]
+            # Split the sample axis into one block per thread.
+            blocks = np.array_split(np.arange(self.T), self.num_threads)
+
+            map_arguments = zip(
+                repeat(H),
+                [T[:,b[0]:b[-1]+1] for b in blocks if b.size > 0]
+            )
+
+            with Pool(self.num_threads) as p:
+                results = p.starmap(parallel_compute_R, map_arguments)
+
+            R = np.concatenate(results, axis=1)
+
+        else:
+
+            R = parallel_compute_R(H, T)
         
         log.info("Finished in: %03fS" % (time.time()-start))
 
@@ -195,6 +227,120 @@ class CorrolationAnalysis(object):
 
         return (ind_k,best_k,R)
     
+    def computeEvolution(self, H, checkpoints):
+        """
+        Accumulate the correlation between H and the traces in trace
+        order, recording the maximum absolute correlation of every key
+        guess each time the number of traces reaches a checkpoint.
+        All checkpoints are computed in a single pass over the traces.
+
+        Returns a tuple (ind_k, best_k, R, evolution) where the first
+        three items are as for computeR over all self.D traces, and
+        evolution is a (len(checkpoints), K) matrix.
+        """
+        T           = self.tmat
+        acc         = CorrolationAccumulator()
+
+        if(self.second_order is not None):
+            (a0, a1), (b0, b1) = self.second_order
+            acc = SecondOrderAccumulator(
+                (a0, a1), (b0, b1),
+                np.mean(T[0:self.D, a0:a1], axis=0, dtype=np.float64),
+                np.mean(T[0:self.D, b0:b1], axis=0, dtype=np.float64),
+                self.second_order_tile
+            )
+        evolution   = np.zeros((len(checkpoints), self.K), dtype=np.float32)
+        done        = 0
+
+        for i, n in enumerate(checkpoints):
+
+            n = min(n, self.D)
+
+            if(n > done):
+                acc.addTraces(H[done:n], T[done:n])
+                done = n
+
+            if(acc.num_traces > 0):
+                evolution[i] = np.max(acc.corrolation(), axis=1)
+
+        if(done < self.D):
+            acc.addTraces(H[done:self.D], T[done:self.D])
+
+        R       = acc.corrolation().astype(np.float32)
+
+        best_k  = R.max() 
+        ind_k   = np.where(R==R.max())[0][0]
+
+        return (ind_k, best_k, R, evolution)
+
+    def computeResumable(self, H, msgbyte, store, checkpoints = None,
+                         chunk_size = 10000):
+        """
+        As computeEvolution, but starting from whatever store (a
+        CPAResultStore) holds for msgbyte, and saving the accumulator
+        back to it after every chunk_size traces. Only the traces after
+        those already stored are processed.
+
+        If checkpoints is None, the returned evolution is None.
+        """
+        assert(self.second_order is None), \
+            "Second order CPA results cannot be stored and resumed"
+
+        T           = self.tmat[0:self.D]
+        inputs      = self.msgmat[0:self.D]
+        checkpoints = [] if checkpoints is None else checkpoints
+        evolution   = np.zeros((len(checkpoints), self.K), dtype=np.float32)
+        stored      = store.load(msgbyte, T, inputs)
+        acc         = CorrolationAccumulator()
+
+        if(stored is not None):
+            acc     = stored["accumulator"]
+            rows    = dict(zip(stored["checkpoints"], stored["evolution"]))
+            for i, n in enumerate(checkpoints):
+                if(n > acc.num_traces):
+                    continue
+                if(n in rows):
+                    evolution[i] = rows[n]
+                else:
+                    log.warning("Byte %d: checkpoint %d was not stored" % (
+                        msgbyte, n))
+            log.info("Byte %d: resuming from %d stored traces" % (
+                msgbyte, acc.num_traces))
+
+        pending = sorted(set([n for n in checkpoints if n > acc.num_traces]))
+
+        while(acc.num_traces < self.D):
+
+            done    = acc.num_traces
+            end     = min(done + chunk_size, self.D)
+
+            # Stop at each checkpoint within the chunk.
+            if(pending and pending[0] < end):
+                end = pending[0]
+
+            acc.addTraces(H[done:end], T[done:end])
+
+            if(pending and pending[0] == end):
+                pending.pop(0)
+
+            for i, n in enumerate(checkpoints):
+                if(n == end):
+                    evolution[i] = np.max(acc.corrolation(), axis=1)
+
+            done_idx = [i for i, n in enumerate(checkpoints) if n <= end]
+
+            store.save(msgbyte, acc, T, inputs,
+                checkpoints = [checkpoints[i] for i in done_idx],
+                evolution   = evolution[done_idx],
+                samples     = self.samples)
+
+        R       = acc.corrolation().astype(np.float32)
+
+        best_k  = R.max()
+        ind_k   = np.where(R==R.max())[0][0]
+
+        return (ind_k, best_k, R, evolution if checkpoints else None)
+
     @property
     def num_threads(self):
         """
@@ -0,0 +1,49 @@
+
+import numpy as np
+
+def corrolationMatrix(H, T, absolute = True):
+    """
+    Compute the Pearson correlation coefficient between every hypothesis
+    column of H and every sample column of T, using one centered matrix
+    product.
+
+    H - np.ndarray
+        A DxK matrix of hypothesised power values, or a length D vector
+        for a single hypothesis.
+    T - np.ndarray
+        A DxT matrix of traces, one trace per row.
+    absolute - bool
+        If True, return the absolute value of the coefficients.
+
+    Returns a KxT matrix R of correlation coefficients. Where either
+    column has zero variance, the coefficient is zero.
+    """
+    H       = np.asarray(H, dtype=np.float64)
+
+    if(H.ndim == 1):
+        H = H[:,np.newaxis]
+
+    D       = T.shape[0]
+
+    assert(H.shape[0] == D), "H has %d rows but T has %d" % (H.shape[0], D)
+
+    H_d     = H - np.mean(H, axis=0)
+    H_sq    = np.einsum("ij,ij->j", H_d, H_d)
+
+    # Since each column of H_d sums to zero, H_d.T @ (T - mean(T)) is
+    # just H_d.T @ T, so T never needs a centered copy.
+    top     = np.dot(H_d.T, T)
+
+    T_sum   = np.sum(T, axis=0, dtype=np.float64)
+    T_sq    = np.einsum("ij,ij->j", T, T, dtype=np.float64)
+    T_sq    = np.maximum(T_sq - T_sum * T_sum / D, 0)
+
+    bot     = np.sqrt(np.outer(H_sq, T_sq))
+    bot[bot == 0] = np.inf
+
+    R       = top / bot
+
+    if(absolute):
+        np.abs(R, out=R)
+
+    return R
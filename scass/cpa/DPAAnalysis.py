@@ -0,0 +1,204 @@
+
+import logging as log
+import time
+
+import numpy as np
+
+from .CPAModel            import CPAModelIdentity
+from .CorrolationAnalysis import CorrolationAnalysis
+
+def selectionBits(V, num_bits = 8):
+    """
+    Expand a DxK matrix of intermediate values into the Dx(K*num_bits)
+    matrix of their bits, where column k*num_bits+j is bit j of V[:,k].
+    """
+    V       = np.asarray(V, dtype=np.uint32)
+    shifts  = np.arange(num_bits, dtype=np.uint32)
+
+    B       = (V[:,:,np.newaxis] >> shifts) & 1
+
+    return B.reshape(V.shape[0], -1).astype(np.float32)
+
+
+class DPAAccumulator(object):
+    """
+    Accumulates bit-partitioned running sums for difference of means DPA.
+    For every selection bit column of B, the traces are split into those
+    where the bit is one and those where it is zero. A single matrix
+    product sums the "one" partition for every column at once; the
+    "zero" partition is the total minus that.
+    """
+
+    def __init__(self):
+        """
+        Create a new, empty accumulator.
+        """
+        self._n     = 0
+        self._t_off = None
+        self._sum_t = None
+        self._sum_bt= None
+        self._n_b   = None
+
+
+    def addTraces(self, B, T):
+        """
+        Add a chunk of traces and their selection bits.
+
+        B - np.ndarray
+            A DxM matrix of 0/1 selection bits.
+        T - np.ndarray
+            A DxT matrix of traces, one trace per row.
+        """
+        D   = T.shape[0]
+
+        assert(B.shape[0] == D), "B has %d rows but T has %d" % (
+            B.shape[0], D)
+
+        if(D == 0):
+            return
+
+        if(self._n == 0):
+            self._t_off = np.mean(T, axis=0, dtype=np.float64)
+            self._sum_t = np.zeros(T.shape[1])
+            self._sum_bt= np.zeros((B.shape[1], T.shape[1]))
+            self._n_b   = np.zeros(B.shape[1])
+
+        T_d = T - self._t_off
+
+        self._sum_t    += np.sum(T_d, axis=0)
+        self._sum_bt   += np.dot(B.T, T_d)
+        self._n_b      += np.sum(B, axis=0, dtype=np.float64)
+        self._n        += D
+
+
+    def differenceOfMeans(self, absolute = True):
+        """
+        Return the MxT matrix of mean(traces | bit = 1) minus
+        mean(traces | bit = 0). Columns where either partition is empty
+        are zero.
+        """
+        n1  = self._n_b[:,np.newaxis]
+        n0  = self._n - n1
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dom = self._sum_bt / n1 - (self._sum_t - self._sum_bt) / n0
+
+        dom[np.logical_or(n1 == 0, n0 == 0).reshape(-1)] = 0
+
+        if(absolute):
+            np.abs(dom, out=dom)
+
+        return dom
+
+
+    @property
+    def num_traces(self):
+        """Number of traces accumulated so far"""
+        return self._n
+
+
+class DPAAnalysis(CorrolationAnalysis):
+    """
+    Single bit difference of means DPA. Each of the model's hypotheses
+    is treated as an intermediate value and every one of its bits is
+    used as a selection function. The score of a key guess at a sample
+    is the largest absolute difference of means over its bits.
+
+    Uses the same inputs, models and sample selection as
+    CorrolationAnalysis, so can be swapped for it in cpa.py.
+    """
+
+    def __init__(self, traces, K = 256, keyBytes = 16, messageBytes=16,
+                 model = None, inputs = None, num_bits = 8):
+        """
+        See CorrolationAnalysis. The default model is the first round
+        S-box output value.
+
+        num_bits - int
+            Number of low bits of each intermediate value to select on.
+        """
+        if(model is None):
+            model = CPAModelIdentity(K)
+
+        CorrolationAnalysis.__init__(self, traces, K, keyBytes, messageBytes,
+            model = model, inputs = inputs)
+
+        self.num_bits   = num_bits
+
+        # Traces per matrix product, bounding the size of the bit matrix.
+        self.chunk_size = 4096
+
+
+    def _accumulate(self, H, first, last, acc):
+        """
+        Add traces [first, last) to acc, chunk_size traces at a time.
+        """
+        for i in range(first, last, self.chunk_size):
+            j = min(i + self.chunk_size, last)
+            acc.addTraces(selectionBits(H[i:j], self.num_bits),
+                self.tmat[i:j])
+
+
+    def _score(self, acc):
+        """
+        Return the KxT matrix of scores from an accumulator.
+        """
+        dom = acc.differenceOfMeans()
+        return np.max(dom.reshape(self.K, self.num_bits, -1), axis=1)
+
+
+    def computeR(self, H):
+        """
+        Compute the KxT matrix of DPA scores for each key guess.
+        Returns (best guess, best score, scores) as for
+        CorrolationAnalysis.computeR.
+        """
+        assert(self.second_order is None), \
+            "Second order is only supported by CorrolationAnalysis"
+
+        start   = time.time()
+
+        acc     = DPAAccumulator()
+        self._accumulate(H, 0, self.D, acc)
+
+        R       = self._score(acc).astype(np.float32)
+
+        log.info("Finished in: %03fS" % (time.time()-start))
+
+        best_k  = R.max()
+        ind_k   = np.where(R==R.max())[0][0]
+
+        return (ind_k, best_k, R)
+
+
+    def computeEvolution(self, H, checkpoints):
+        """
+        As CorrolationAnalysis.computeEvolution, with DPA scores.
+        """
+        assert(self.second_order is None), \
+            "Second order is only supported by CorrolationAnalysis"
+
+        acc         = DPAAccumulator()
+        evolution   = np.zeros((len(checkpoints), self.K), dtype=np.float32)
+        done        = 0
+
+        for i, n in enumerate(checkpoints):
+
+            n = min(n, self.D)
+
+            if(n > done):
+                self._accumulate(H, done, n, acc)
+                done = n
+
+            if(acc.num_traces > 0):
+                evolution[i] = np.max(self._score(acc), axis=1)
+
+        if(done < self.D):
+            self._accumulate(H, done, self.D, acc)
+
+        R       = self._score(acc).astype(np.float32)
+
+        best_k  = R.max()
+        ind_k   = np.where(R==R.max())[0][0]
+
+        return (ind_k, best_k, R, evolution)
@@ -1,21 +1,19 @@
 
 import numpy as np
 
+from .BitKernels import hammingWeight
+from .BitKernels import hammingDistance
+from .BitKernels import hammingDistanceVector
+
+from .CorrolationKernel import corrolationMatrix
+
 def hw(x):
     """Return hamming weight of x"""
-    c = 0
-    while x > 0:
-        c  = c + 1
-        x &= x-1
-    return c
+    return int(hammingWeight(np.asarray(x)))
 
 def hd(x,y):
-    total = 0
-    for i,j in zip(x,y):
-        dist   = i ^ j
-        weight = hw(dist)
-        total += weight
-    return total
+    """Return the hamming distance between the arrays x and y"""
+    return int(np.sum(hammingDistance(x, y), dtype=np.uint64))
 
 def hammingDistanceCorrolation(traces,inputsA, inputsB):
     """
@@ -39,36 +37,10 @@ def hammingDistanceCorrolation(traces,inputsA, inputsB):
 
     H = np.zeros((D_trace_count, K_guesses))
 
-    for i in range(0, D_trace_count):
-        H[i,0] = hd(inputsA[i] , inputsB[i])
-
-    H_avgs = np.mean(H,axis=0)
-    T_avgs = np.mean(T,axis=0)
-
-    R = np.zeros((K_guesses, T_trace_len))
-
-    for i in range(0,K_guesses):
-
-        H_avg   = H_avgs[i]
-        H_col   = H[:,i]
-        H_col_d = H_col - H_avg
-    
-        H_col_sq_sum = np.dot(H_col_d,H_col_d)
-
-        for j in range(0, T_trace_len):
-
-            T_avg   = T_avgs[j]
-            T_col   = traces[:D_trace_count,j]
-            T_col_d = T_col - T_avg
-            T_col_sq_sum = np.dot(T_col_d, T_col_d)
-
-            top = np.dot(H_col_d, T_col_d)
-
-            bot = np.sqrt(H_col_sq_sum * T_col_sq_sum)
-            if(bot == 0):
-                bot = 1
+    H[:,0] = hammingDistanceVector(
+        inputsA[:D_trace_count], inputsB[:D_trace_count])
 
-            R[i,j] = np.abs(top/bot)
+    R = corrolationMatrix(H, T)
 
     return R.transpose()
 
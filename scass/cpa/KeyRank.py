@@ -0,0 +1,61 @@
+
+import numpy as np
+
+def guessRanks(scores, expected):
+    """
+    Return the rank of the expected key guess given a score for every
+    guess. Rank 0 means the expected guess has the highest score.
+
+    scores - np.ndarray
+        (..., K) array of scores, e.g. the max correlation of each guess.
+    expected - int
+        Index of the correct key guess.
+    """
+    scores = np.asarray(scores)
+    target = scores[..., expected][..., np.newaxis]
+    return np.sum(scores > target, axis=-1)
+
+
+def guessingEntropy(ranks):
+    """
+    Return the partial guessing entropy, i.e. the average number of
+    guesses (1-based rank) needed per key byte.
+
+    ranks - np.ndarray
+        (bytes, checkpoints) array of ranks from guessRanks.
+    """
+    return np.mean(np.asarray(ranks) + 1, axis=0)
+
+
+def log2SearchCost(ranks):
+    """
+    Return log2 of the product of per-byte (1-based) ranks, the
+    independent-enumeration search cost: the number of full keys tried
+    by enumerating every byte's guesses in rank order independently
+    until each reaches the correct one. This is not a bound on the full
+    key rank, which an optimal enumeration over the combined scores
+    can put lower or higher; see scass.attacks.KeyEnumeration.
+    """
+    return np.sum(np.log2(np.asarray(ranks) + 1), axis=0)
+
+
+def tracesToDisclosure(checkpoints, ranks):
+    """
+    Return the smallest checkpoint from which every key byte is ranked
+    first for all later checkpoints, or None if that never happens.
+
+    checkpoints - list of int
+        Number of traces at each checkpoint, in increasing order.
+    ranks - np.ndarray
+        (bytes, checkpoints) array of ranks from guessRanks.
+    """
+    solved = np.all(np.asarray(ranks) == 0, axis=0)
+
+    ttd    = None
+
+    for n, ok in zip(reversed(list(checkpoints)), reversed(list(solved))):
+        if(not ok):
+            break
+        ttd = n
+
+    return ttd
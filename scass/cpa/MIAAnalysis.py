@@ -0,0 +1,275 @@
+
+import logging as log
+import time
+
+import numpy as np
+
+from .CorrolationAnalysis import CorrolationAnalysis
+
+def binTraces(T, lo, hi, num_bins):
+    """
+    Vectorised equal width binning of every sample of the DxT traces T,
+    with per-sample ranges [lo, hi]. Returns a DxT array of bin indexes
+    in [0, num_bins). Values outside the range go in the end bins.
+    """
+    width   = (np.asarray(hi, dtype=np.float64) - lo) / num_bins
+    width[width == 0] = 1
+
+    b       = np.floor((T - lo) / width)
+
+    return np.clip(b, 0, num_bins - 1).astype(np.intp)
+
+
+def _oneHot(x, n):
+    """
+    Return the one-hot encoding of the DxC integer array x, as a
+    Dx(C*n) float32 matrix where column c*n+v is 1 where x[:,c] == v.
+    """
+    D, C    = x.shape
+    O       = np.zeros((D, C * n), dtype=np.float32)
+    cols    = x + np.arange(C) * n
+    O[np.arange(D)[:,np.newaxis], cols] = 1
+
+    return O
+
+
+class MIAAccumulator(object):
+    """
+    Accumulates joint histograms of hypothesis value and binned sample
+    value, for every key guess and sample, over chunks of traces. All
+    guesses are histogrammed at once with a single product of one-hot
+    matrices.
+
+    Memory is K * num_values * T * num_bins counts, so restrict T (e.g.
+    with points of interest) or accumulate one block of samples at a
+    time.
+    """
+
+    def __init__(self, num_values, lo, hi, num_bins = 16):
+        """
+        num_values - int
+            Number of possible hypothesis values, e.g. 9 for the hamming
+            weight of a byte.
+        lo, hi - np.ndarray
+            Per sample ranges used for binning, fixed for every chunk.
+        num_bins - int
+            Number of bins per sample.
+        """
+        self.num_values = num_values
+        self.num_bins   = num_bins
+        self.lo         = np.asarray(lo, dtype=np.float64)
+        self.hi         = np.asarray(hi, dtype=np.float64)
+
+        self._n         = 0
+        self._counts    = None
+
+
+    def addTraces(self, H, T):
+        """
+        Add a chunk of traces and their hypotheses.
+
+        H - np.ndarray
+            DxK matrix of integer hypothesis values in [0, num_values).
+        T - np.ndarray
+            DxT matrix of traces.
+        """
+        D, K    = H.shape
+
+        if(D == 0):
+            return
+
+        S       = T.shape[1]
+
+        if(self._counts is None):
+            self._counts = np.zeros(
+                (K, self.num_values, S, self.num_bins), dtype=np.float64)
+
+        O_h     = _oneHot(np.asarray(H, dtype=np.intp), self.num_values)
+        O_t     = _oneHot(binTraces(T, self.lo, self.hi, self.num_bins),
+            self.num_bins)
+
+        self._counts += np.dot(O_h.T, O_t).reshape(self._counts.shape)
+        self._n      += D
+
+
+    def mutualInformation(self):
+        """
+        Return the KxT matrix of mutual information, in bits, between the
+        hypothesis of each guess and each binned sample.
+        """
+        c       = self._counts
+        n       = float(self._n)
+
+        c_h     = np.sum(c, axis=3, keepdims=True)
+        c_t     = np.sum(c, axis=1, keepdims=True)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            terms = c * np.log2(c * n / (c_h * c_t))
+
+        terms[c == 0] = 0
+
+        return np.sum(terms, axis=(1,3)) / n
+
+
+    @property
+    def num_traces(self):
+        """Number of traces accumulated so far"""
+        return self._n
+
+
+class MIAAnalysis(CorrolationAnalysis):
+    """
+    Mutual information analysis. The score of a key guess at a sample is
+    the mutual information between the model's hypothesis for that guess
+    and the sample value, estimated with equal width histograms. Unlike
+    CPA this needs no assumption that the leakage is linear in the
+    model.
+
+    Uses the same inputs, models and sample selection as
+    CorrolationAnalysis, so can be swapped for it in cpa.py.
+    """
+
+    def __init__(self, traces, K = 256, keyBytes = 16, messageBytes=16,
+                 model = None, inputs = None, num_bins = 16):
+        """
+        See CorrolationAnalysis.
+
+        num_bins - int
+            Number of histogram bins per sample.
+        """
+        CorrolationAnalysis.__init__(self, traces, K, keyBytes, messageBytes,
+            model = model, inputs = inputs)
+
+        self.num_bins   = num_bins
+
+        # Samples histogrammed at once, bounding the size of the counts
+        # held in memory. Reduced as needed so the counts for a tile fit
+        # in max_tile_bytes. mutualInformation takes a few times more.
+        self.sample_tile    = 64
+        self.max_tile_bytes = 1 << 27
+
+
+    def _hypothesisClasses(self, H):
+        """
+        Map the DxK hypotheses H to dense class ids, one per distinct
+        value in the model's table, so that float, negative or sparse
+        leakage values can be histogrammed. Returns (ids, num_classes).
+        """
+        values  = np.unique(self.model.table)
+        ids     = np.searchsorted(values, H)
+        ids     = np.minimum(ids, values.size - 1)
+
+        assert(np.array_equal(values[ids], H)), \
+            "Hypotheses take values missing from the model's table"
+
+        return (ids.astype(np.intp), values.size)
+
+
+    def _tiles(self, num_classes):
+        """
+        Yield (start, end) blocks of sample columns, sized so the counts
+        for num_classes hypothesis classes fit in max_tile_bytes.
+        """
+        per_sample  = self.K * num_classes * self.num_bins * 8
+        tile        = max(1, min(self.sample_tile,
+            self.max_tile_bytes // per_sample))
+
+        for s in range(0, self.T, tile):
+            yield (s, min(s + tile, self.T))
+
+
+    def _accumulate(self, H, first, last, s0, s1, acc):
+        """
+        Add traces [first, last) for samples [s0, s1) to acc, in chunks
+        sized so the one-hot hypothesis matrix stays around 64MB.
+        """
+        step = max(256, (1 << 24) // (self.K * acc.num_values))
+
+        for i in range(first, last, step):
+            j = min(i + step, last)
+            acc.addTraces(H[i:j], self.tmat[i:j, s0:s1])
+
+
+    def _newAccumulator(self, s0, s1, num_classes):
+        """
+        Return an empty accumulator for num_classes hypothesis classes and
+        sample columns [s0, s1), binned over the range of those samples
+        in the first D traces.
+        """
+        T   = self.tmat[0:self.D, s0:s1]
+
+        return MIAAccumulator(
+            num_classes,
+            np.min(T, axis=0),
+            np.max(T, axis=0),
+            self.num_bins
+        )
+
+
+    def computeR(self, H):
+        """
+        Compute the KxT matrix of mutual information for each key guess.
+        Returns (best guess, best score, scores) as for
+        CorrolationAnalysis.computeR.
+        """
+        assert(self.second_order is None), \
+            "Second order is only supported by CorrolationAnalysis"
+
+        start   = time.time()
+
+        R       = np.zeros((self.K, self.T), dtype=np.float32)
+
+        H, num_classes = self._hypothesisClasses(H)
+
+        for s0, s1 in self._tiles(num_classes):
+            acc = self._newAccumulator(s0, s1, num_classes)
+            self._accumulate(H, 0, self.D, s0, s1, acc)
+            R[:, s0:s1] = acc.mutualInformation()
+
+        log.info("Finished in: %03fS" % (time.time()-start))
+
+        best_k  = R.max()
+        ind_k   = np.where(R==R.max())[0][0]
+
+        return (ind_k, best_k, R)
+
+
+    def computeEvolution(self, H, checkpoints):
+        """
+        As CorrolationAnalysis.computeEvolution, with MIA scores. The
+        histogram ranges are taken from all self.D traces.
+        """
+        assert(self.second_order is None), \
+            "Second order is only supported by CorrolationAnalysis"
+
+        evolution   = np.zeros((len(checkpoints), self.K), dtype=np.float32)
+        R           = np.zeros((self.K, self.T), dtype=np.float32)
+
+        H, num_classes = self._hypothesisClasses(H)
+
+        for s0, s1 in self._tiles(num_classes):
+
+            acc     = self._newAccumulator(s0, s1, num_classes)
+            done    = 0
+
+            for i, n in enumerate(checkpoints):
+
+                n = min(n, self.D)
+
+                if(n > done):
+                    self._accumulate(H, done, n, s0, s1, acc)
+                    done = n
+
+                if(acc.num_traces > 0):
+                    evolution[i] = np.maximum(evolution[i],
+                        np.max(acc.mutualInformation(), axis=1))
+
+            if(done < self.D):
+                self._accumulate(H, done, self.D, s0, s1, acc)
+
+            R[:, s0:s1] = acc.mutualInformation()
+
+        best_k  = R.max()
+        ind_k   = np.where(R==R.max())[0][0]
+
+        return (ind_k, best_k, R, evolution)
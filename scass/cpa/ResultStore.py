@@ -0,0 +1,197 @@
+
+import os
+import json
+import hashlib
+import logging as log
+
+import numpy as np
+
+from .CorrolationAccumulator import CorrolationAccumulator
+
+def _chunkDigest(traces, inputs, i, j):
+    """
+    Return a hex digest of rows [i, j) of the DxT traces and DxN inputs
+    matrices.
+    """
+    h = hashlib.sha256()
+
+    h.update(np.array([j - i, traces.shape[1], inputs.shape[1]]).tobytes())
+    h.update(np.ascontiguousarray(traces[i:j]).tobytes())
+    h.update(np.ascontiguousarray(inputs[i:j]).tobytes())
+
+    return h.hexdigest()
+
+
+class DataFingerprint(object):
+    """
+    Fingerprint of the leading rows of a DxT traces and DxN inputs
+    matrix pair, as a list of digests of consecutive chunk_size row
+    chunks, the last of which may be partial. Traces appended later do
+    not change the digests of a prefix, so a stored result can be
+    checked against an extended trace set.
+
+    The digests of whole chunks are kept, so fingerprinting a longer
+    prefix only hashes the new rows. An instance is only valid for one
+    trace set.
+    """
+
+    def __init__(self, chunk_size = 4096):
+        self.chunk_size = chunk_size
+
+        # Digest of each whole chunk hashed so far, in order.
+        self.chunks     = []
+
+        # (n, digest) of the partial chunk last hashed.
+        self.partial    = (0, None)
+
+    def digests(self, traces, inputs, n):
+        """
+        Return the list of chunk digests of the first n rows of traces
+        and inputs.
+        """
+        whole = n // self.chunk_size
+
+        while(len(self.chunks) < whole):
+            i = len(self.chunks) * self.chunk_size
+            self.chunks.append(
+                _chunkDigest(traces, inputs, i, i + self.chunk_size))
+
+        tr = self.chunks[0:whole]
+
+        if(n > whole * self.chunk_size):
+            if(self.partial[0] != n):
+                self.partial = (n, _chunkDigest(traces, inputs,
+                    whole * self.chunk_size, n))
+            tr = tr + [self.partial[1]]
+
+        return tr
+
+
+class CPAResultStore(object):
+    """
+    Per key byte on-disk store of CPA accumulators and results, so an
+    interrupted attack can be resumed and an attack on a trace set which
+    has since been extended only has to process the new traces.
+
+    Each byte is one .npz file in the store directory, holding the
+    accumulator running sums, the number of traces they cover and the
+    chunk digests of those traces, the checkpoint history and the per
+    guess max correlation and its sample. A stored byte is only reused
+    if the analysis parameters match and the fingerprint matches the
+    same number of leading traces of the current trace set.
+
+    A store is used with one trace set per run. Its chunk digests are
+    shared by every key byte, so the traces are only hashed once; call
+    fingerprintData before handing the store to worker processes.
+    """
+
+    def __init__(self, directory, parameters):
+        """
+        directory - str
+            Directory to keep the per byte files in. Created if needed.
+        parameters - dict
+            JSON serialisable description of everything, other than the
+            traces and inputs themselves, which affects the results,
+            e.g. the leakage model and engine.
+        """
+        self.directory  = directory
+        self.parameters = json.dumps(parameters, sort_keys=True)
+        self.fingerprint= DataFingerprint()
+
+        os.makedirs(directory, exist_ok=True)
+
+
+    def fingerprintData(self, traces, inputs):
+        """
+        Hash every whole chunk of the DxT traces and DxN inputs up
+        front, rather than in the first load or save.
+        """
+        self.fingerprint.digests(traces, inputs, traces.shape[0])
+
+
+    def path(self, b):
+        """Return the file path for key byte b"""
+        return os.path.join(self.directory, "byte_%02d.npz" % b)
+
+
+    def load(self, b, traces, inputs):
+        """
+        Load the stored results for key byte b, if they are compatible
+        with the given DxT traces and DxN inputs.
+
+        Returns a dict with keys "accumulator", "num_traces",
+        "checkpoints" and "evolution", or None if there is nothing
+        usable stored.
+        """
+        path = self.path(b)
+
+        if(not os.path.exists(path)):
+            return None
+
+        data = np.load(path)
+
+        if(str(data["parameters"]) != self.parameters):
+            log.info("Byte %d: stored parameters differ, recomputing" % b)
+            return None
+
+        n = int(data["num_traces"])
+
+        if("chunk_size" not in data.files or
+           int(data["chunk_size"]) != self.fingerprint.chunk_size or
+           n > traces.shape[0] or
+           self.fingerprint.digests(traces, inputs, n) !=
+                [str(d) for d in data["fingerprint"]]):
+            log.info("Byte %d: stored traces differ, recomputing" % b)
+            return None
+
+        state = dict([(k[4:], data[k]) for k in data.files
+            if k.startswith("acc_")])
+
+        return {
+            "accumulator"   : CorrolationAccumulator.fromState(state),
+            "num_traces"    : n,
+            "checkpoints"   : list(data["checkpoints"]),
+            "evolution"     : data["evolution"]
+        }
+
+
+    def save(self, b, accumulator, traces, inputs, checkpoints = None,
+             evolution = None, samples = None):
+        """
+        Store the accumulator for key byte b, which covers the first
+        accumulator.num_traces rows of traces and inputs, along with the
+        checkpoint history so far and a summary of the current result.
+        The file is replaced atomically, so an interrupted save leaves
+        the previous one intact.
+
+        samples - np.ndarray or None
+            Original sample index of each trace column, used to record
+            where each guess's max correlation was.
+        """
+        n       = accumulator.num_traces
+        R       = accumulator.corrolation()
+        best    = np.argmax(R, axis=1)
+
+        if(samples is not None):
+            best = np.asarray(samples)[best]
+
+        arrays  = dict([("acc_" + k, v) for k, v in accumulator.state().items()])
+
+        tmp     = self.path(b) + ".tmp.npz"
+
+        np.savez(tmp,
+            parameters  = np.array(self.parameters),
+            num_traces  = np.array(n),
+            chunk_size  = np.array(self.fingerprint.chunk_size),
+            fingerprint = np.array(
+                self.fingerprint.digests(traces, inputs, n), dtype=str),
+            checkpoints = np.array([] if checkpoints is None else checkpoints,
+                dtype=np.int64),
+            evolution   = np.zeros((0, R.shape[0])) if evolution is None \
+                else evolution,
+            max_corr    = np.max(R, axis=1),
+            max_sample  = best,
+            **arrays
+        )
+
+        os.replace(tmp, self.path(b))
@@ -0,0 +1,243 @@
+
+import logging as log
+
+import numpy as np
+
+from ..trace import iterTracesFromDisk
+
+class SNRAccumulator(object):
+    """
+    Accumulates per-class running sums over chunks of labelled traces, so
+    that the signal-to-noise ratio of every sample can be computed without
+    holding all of the traces in memory at once.
+
+    Traces are grouped into classes by an intermediate value, e.g. the
+    first round S-box output byte. The SNR of a sample is the variance of
+    the class means divided by the mean of the class variances.
+    """
+
+    def __init__(self, num_classes = 256):
+        """
+        Create a new, empty accumulator.
+
+        num_classes - int
+            Number of possible class labels. Labels must be in the range
+            [0, num_classes).
+        """
+
+        self._classes   = num_classes
+        self._n         = 0
+
+        # Offset subtracted from every sample before it is accumulated,
+        # taken from the mean of the first chunk. See
+        # CorrolationAccumulator.
+        self._t_off     = None
+
+        self._count     = np.zeros(num_classes, dtype=np.int64)
+        self._sum       = None
+        self._sum_sq    = None
+
+
+    def addTraces(self, labels, T):
+        """
+        Add a chunk of traces and their class labels.
+
+        labels - np.ndarray
+            Length D array of integer class labels.
+        T - np.ndarray
+            A DxT matrix of traces, one trace per row.
+        """
+        labels  = np.asarray(labels).reshape(-1)
+        D       = T.shape[0]
+
+        assert(labels.shape[0] == D), "%d labels but %d traces" % (
+            labels.shape[0], D)
+
+        if(D == 0):
+            return
+
+        assert(labels.min() >= 0 and labels.max() < self._classes), \
+            "Labels must be in the range [0, %d)" % self._classes
+
+        if(self._n == 0):
+            self._t_off     = np.mean(T, axis=0, dtype=np.float64)
+            self._sum       = np.zeros((self._classes, T.shape[1]))
+            self._sum_sq    = np.zeros((self._classes, T.shape[1]))
+
+        # Sort the chunk by label so each class is one contiguous block,
+        # which can be summed with a single reduceat call.
+        order   = np.argsort(labels, kind="stable")
+        labels  = labels[order]
+        T_d     = T[order] - self._t_off
+
+        classes, starts = np.unique(labels, return_index=True)
+
+        self._sum   [classes] += np.add.reduceat(T_d      , starts, axis=0)
+        self._sum_sq[classes] += np.add.reduceat(T_d * T_d, starts, axis=0)
+        self._count [classes] += np.diff(np.append(starts, D))
+
+        self._n    += D
+
+
+    def classMeans(self):
+        """
+        Return the (num_classes, T) matrix of per-class mean traces.
+        Rows for classes with no traces are NaN.
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._sum / self._count[:,np.newaxis] + self._t_off
+
+
+    def classVariances(self):
+        """
+        Return the (num_classes, T) matrix of per-class sample variances.
+        Rows for classes with fewer than two traces are NaN.
+        """
+        n   = self._count[:,np.newaxis].astype(np.float64)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            var = (self._sum_sq - self._sum * self._sum / n) / (n - 1)
+
+        var[self._count < 2] = np.nan
+
+        return np.maximum(var, 0)
+
+
+    def snr(self):
+        """
+        Return the length T signal-to-noise ratio of every sample over all
+        traces added so far. Only classes with at least two traces are
+        used. Samples with no noise have an SNR of zero.
+        """
+        use     = self._count >= 2
+
+        assert(np.count_nonzero(use) > 1), \
+            "Need at least two classes with two or more traces each"
+
+        signal  = np.var (self.classMeans()    [use], axis=0)
+        noise   = np.mean(self.classVariances()[use], axis=0)
+
+        noise[noise == 0] = np.inf
+
+        return signal / noise
+
+
+    @property
+    def num_traces(self):
+        """Number of traces accumulated so far"""
+        return self._n
+
+    @property
+    def num_classes(self):
+        """Number of possible class labels"""
+        return self._classes
+
+    @property
+    def class_counts(self):
+        """Number of traces accumulated for each class label"""
+        return self._count
+
+    @property
+    def trace_length(self):
+        """Number of samples per trace, or None if empty"""
+        return None if self._sum is None else self._sum.shape[1]
+
+
+def snrFromDisk(
+        filepath,
+        labels,
+        num_classes     = 256,
+        chunk_size      = 10000,
+        select          = None,
+        preprocess      = None,
+        accumulator     = None
+    ):
+    """
+    Stream the traces stored at filepath through an SNRAccumulator in
+    chunks of chunk_size traces. See accumulateFromDisk for the meaning
+    of select and preprocess.
+
+    labels - np.ndarray
+        Length D array of class labels, one per trace in the file.
+
+    Returns the accumulator.
+    """
+    if(accumulator is None):
+        accumulator = SNRAccumulator(num_classes)
+
+    labels  = np.asarray(labels).reshape(-1)
+    first   = 0
+
+    for chunk in iterTracesFromDisk(filepath, chunk_size):
+
+        last    = first + chunk.shape[0]
+        l_chunk = labels[first:last]
+
+        if(select is not None):
+            sel     = select[first:last]
+            chunk   = chunk[sel]
+            l_chunk = l_chunk[sel]
+
+        first   = last
+
+        if(preprocess is not None):
+            chunk = preprocess(chunk)
+
+        accumulator.addTraces(l_chunk, chunk)
+
+    log.info("SNR accumulated over %d traces" % accumulator.num_traces)
+
+    return accumulator
+
+
+def selectPointsOfInterest(
+        scores,
+        num         = None,
+        threshold   = None,
+        min_spacing = 0
+    ):
+    """
+    Pick points of interest (POI) from a per-sample leakage score, such
+    as an SNR trace, a t-statistic trace or a correlation trace.
+
+    scores - np.ndarray
+        Length T array of scores. Higher means more leakage.
+    num - int or None
+        Maximum number of points to select.
+    threshold - float or None
+        Only select samples whose score is at least this value.
+    min_spacing - int
+        Once a sample is selected, no other sample within this many
+        samples of it is selected. Stops one wide peak using up all of
+        the points.
+
+    Returns a sorted array of sample indexes, for use with e.g.
+    CorrolationAnalysis.selectSamples or TTest(samples=...).
+    """
+    scores  = np.nan_to_num(np.asarray(scores, dtype=np.float64).reshape(-1),
+        nan=-np.inf)
+
+    order   = np.argsort(scores)[::-1]
+
+    if(threshold is not None):
+        order = order[scores[order] >= threshold]
+
+    if(min_spacing <= 0):
+        selected = order if num is None else order[0:num]
+        return np.sort(selected)
+
+    blocked  = np.zeros(scores.size, dtype=bool)
+    selected = []
+
+    for i in order:
+
+        if(num is not None and len(selected) >= num):
+            break
+
+        if(blocked[i]):
+            continue
+
+        selected.append(i)
+        blocked[max(0, i-min_spacing):i+min_spacing+1] = True
+
+    return np.sort(np.array(selected, dtype=np.int64))
@@ -0,0 +1,196 @@
+
+import logging as log
+
+import numpy as np
+
+from ..trace import iterTracesFromDisk
+
+from .CorrolationKernel      import corrolationMatrix
+from .CorrolationAccumulator import CorrolationAccumulator
+
+def centeredProducts(TA, TB, mean_a, mean_b):
+    """
+    Combine two windows of samples into second order traces.
+
+    TA, TB - np.ndarray
+        DxA and DxB matrices of samples from the two windows.
+    mean_a, mean_b - np.ndarray
+        Mean of each sample in the two windows over the whole trace set.
+
+    Returns a Dx(A*B) matrix where column a*B+b is the centered product
+    (TA[:,a] - mean_a[a]) * (TB[:,b] - mean_b[b]).
+    """
+    A_c = np.asarray(TA, dtype=np.float64) - mean_a
+    B_c = np.asarray(TB, dtype=np.float64) - mean_b
+
+    return (A_c[:,:,np.newaxis] * B_c[:,np.newaxis,:]).reshape(
+        A_c.shape[0], -1)
+
+
+def _tiles(window_a, tile):
+    """
+    Split window_a into (start, end) sample ranges of at most tile samples.
+    """
+    return [(s, min(s + tile, window_a[1]))
+        for s in range(window_a[0], window_a[1], tile)]
+
+
+def secondOrderCorrolation(H, T, window_a, window_b, tile = 32):
+    """
+    Second order CPA over every pair of samples (a, b) with a in window_a
+    and b in window_b, for traces held in memory.
+
+    H - np.ndarray
+        DxK matrix of hypotheses.
+    T - np.ndarray
+        DxT matrix of traces.
+    window_a, window_b - (int, int)
+        (start, end) sample ranges of the two windows.
+    tile - int
+        Number of window_a samples combined at once. Only D*tile*B
+        combined samples are held in memory at any time.
+
+    Returns a Kx(A*B) matrix of absolute correlation coefficients, where
+    column a*B+b is the pair (window_a[0]+a, window_b[0]+b).
+    """
+    TB      = T[:, window_b[0]:window_b[1]]
+    mean_b  = np.mean(TB, axis=0, dtype=np.float64)
+
+    R       = []
+
+    for start, end in _tiles(window_a, tile):
+
+        TA      = T[:, start:end]
+        mean_a  = np.mean(TA, axis=0, dtype=np.float64)
+
+        R.append(corrolationMatrix(H, centeredProducts(TA,TB,mean_a,mean_b)))
+
+    return np.concatenate(R, axis=1)
+
+
+class SecondOrderAccumulator(object):
+    """
+    Accumulates the correlation between hypotheses and centered product
+    combined traces over chunks of traces. The combined traces are built
+    one tile of window_a at a time, so the full DxAxB product space is
+    never held in memory.
+
+    The per-sample means used for centering must be known before any
+    traces are added, e.g. from a first pass over the trace set.
+    """
+
+    def __init__(self, window_a, window_b, mean_a, mean_b, tile = 32):
+        """
+        window_a, window_b - (int, int)
+            (start, end) sample ranges of the two windows.
+        mean_a, mean_b - np.ndarray
+            Mean of each sample in the two windows over all traces.
+        tile - int
+            Number of window_a samples combined at once.
+        """
+        self.window_a   = tuple(window_a)
+        self.window_b   = tuple(window_b)
+        self.mean_a     = np.asarray(mean_a, dtype=np.float64)
+        self.mean_b     = np.asarray(mean_b, dtype=np.float64)
+
+        assert(self.mean_a.size == window_a[1] - window_a[0])
+        assert(self.mean_b.size == window_b[1] - window_b[0])
+
+        self._tiles     = _tiles(window_a, tile)
+        self._accs      = [CorrolationAccumulator() for t in self._tiles]
+
+
+    def addTraces(self, H, T):
+        """
+        Add a chunk of full length traces and their hypotheses.
+        """
+        TB = T[:, self.window_b[0]:self.window_b[1]]
+
+        for (start, end), acc in zip(self._tiles, self._accs):
+
+            a0  = start - self.window_a[0]
+            a1  = end   - self.window_a[0]
+
+            acc.addTraces(H, centeredProducts(
+                T[:, start:end], TB, self.mean_a[a0:a1], self.mean_b))
+
+
+    def corrolation(self, absolute = True):
+        """
+        Return the Kx(A*B) correlation matrix, laid out as for
+        secondOrderCorrolation.
+        """
+        return np.concatenate(
+            [acc.corrolation(absolute) for acc in self._accs], axis=1)
+
+
+    @property
+    def num_traces(self):
+        """Number of traces accumulated so far"""
+        return self._accs[0].num_traces
+
+    @property
+    def shape(self):
+        """(A, B) size of the window pair grid"""
+        return (self.window_a[1] - self.window_a[0],
+                self.window_b[1] - self.window_b[0])
+
+
+def secondOrderFromDisk(
+        filepath,
+        H,
+        window_a,
+        window_b,
+        tile            = 32,
+        chunk_size      = 10000,
+        select          = None,
+        preprocess      = None
+    ):
+    """
+    Stream the traces stored at filepath through a SecondOrderAccumulator.
+    Makes two passes over the file: one for the window means and one to
+    accumulate the centered products. See accumulateFromDisk for the
+    meaning of select and preprocess.
+
+    Returns the accumulator.
+    """
+    def chunks():
+        first = 0
+        for chunk in iterTracesFromDisk(filepath, chunk_size):
+            last    = first + chunk.shape[0]
+            sel     = slice(first, last)
+            first   = last
+            if(select is not None):
+                chunk   = chunk[select[sel]]
+                sel     = np.nonzero(select[sel])[0] + sel.start
+            if(preprocess is not None):
+                chunk   = preprocess(chunk)
+            yield sel, chunk
+
+    H       = np.asarray(H)
+    if(H.ndim == 1):
+        H = H[:,np.newaxis]
+
+    n       = 0
+    sum_a   = 0
+    sum_b   = 0
+
+    log.info("Second order pass 1: window means")
+
+    for sel, chunk in chunks():
+        n      += chunk.shape[0]
+        sum_a   = sum_a + np.sum(chunk[:, window_a[0]:window_a[1]],
+            axis=0, dtype=np.float64)
+        sum_b   = sum_b + np.sum(chunk[:, window_b[0]:window_b[1]],
+            axis=0, dtype=np.float64)
+
+    acc     = SecondOrderAccumulator(
+        window_a, window_b, sum_a / n, sum_b / n, tile)
+
+    log.info("Second order pass 2: centered products, %d x %d pairs" % (
+        acc.shape))
+
+    for sel, chunk in chunks():
+        acc.addTraces(H[sel], chunk)
+
+    return acc
@@ -1,9 +1,39 @@
 
 from .CorrolationAnalysis import CorrolationAnalysis
+from .DPAAnalysis         import DPAAnalysis
+from .DPAAnalysis         import DPAAccumulator
+from .MIAAnalysis         import MIAAnalysis
+from .MIAAnalysis         import MIAAccumulator
 from .CPAModel            import CPAModel
 from .CPAModel            import CPAModelHammingWeightD
 from .CPAModel            import CPAModelHammingDistance
+from .CPAModel            import CPAModelHammingWeightSbox
+from .CPAModel            import CPAModelHammingDistanceSbox
+from .CPAModel            import CPAModelIdentity
+from .CPAModel            import CPAModelBit
+from .CPAModel            import CPAModelLastRoundHW
+from .CPAModel            import CPAModelLastRoundHD
+from .CPAModel            import CPAModelTable
 from .                    import AES
 from .HammingWeight       import hammingWeightCorrolation
 from .HammingDistance     import hammingDistanceCorrolation
 from .CollectTraces       import CollectTraces
+from .BitKernels          import hammingWeight
+from .BitKernels          import hammingWeightWords
+from .BitKernels          import hammingWeightVector
+from .BitKernels          import hammingDistance
+from .BitKernels          import hammingDistanceWords
+from .BitKernels          import hammingDistanceVector
+from .CorrolationKernel   import corrolationMatrix
+from .CorrolationAccumulator import CorrolationAccumulator
+from .CorrolationAccumulator import accumulateFromDisk
+from .ResultStore         import CPAResultStore
+from .ResultStore         import DataFingerprint
+from .SNRAccumulator      import SNRAccumulator
+from .SNRAccumulator      import snrFromDisk
+from .SNRAccumulator      import selectPointsOfInterest
+from .SecondOrder         import centeredProducts
+from .SecondOrder         import secondOrderCorrolation
+from .SecondOrder         import SecondOrderAccumulator
+from .SecondOrder         import secondOrderFromDisk
+from .                    import KeyRank
@@ -0,0 +1,99 @@
+
+import asyncio
+import functools
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .Scope import Scope
+
+class AsyncScope(object):
+    """
+    asyncio interface to a Scope. Scope drivers block, so every call is
+    made on a worker thread owned by this object, one at a time and in
+    the order they were made, leaving the event loop free to drive
+    other scopes and targets meanwhile.
+
+    Settings and properties are read and written on self.scope directly,
+    before any capture starts.
+    """
+
+    def __init__(self, scope, poll_interval = 0.0002):
+        """
+        scope - scass.scope.Scope
+            An open, configured scope.
+        poll_interval - float
+            Seconds between dataReady checks in waitForData.
+        """
+        assert(isinstance(scope, Scope))
+
+        self.scope          = scope
+        self.poll_interval  = poll_interval
+
+        self._executor      = ThreadPoolExecutor(max_workers = 1,
+            thread_name_prefix = "scass-scope")
+
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs), any blocking function which uses the
+        scope, on the worker thread and return its result.
+        """
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self._executor,
+            functools.partial(func, *args, **kwargs))
+
+
+    async def runCapture(self):
+        """Arm the scope for a single capture. See Scope.runCapture"""
+        return await self.call(self.scope.runCapture)
+
+
+    async def runSegmentedCapture(self, num_segments):
+        """Arm the scope for a segmented capture. See
+        Scope.runSegmentedCapture"""
+        return await self.call(self.scope.runSegmentedCapture, num_segments)
+
+
+    async def dataReady(self):
+        """Return True if captured data is ready to be collected."""
+        return await self.call(self.scope.dataReady)
+
+
+    async def waitForData(self, timeout = None):
+        """
+        Wait until captured data is ready to be collected. Raises an
+        asyncio.TimeoutError after timeout seconds, if not None.
+        """
+        def wait():
+            end = None if timeout is None else time.monotonic() + timeout
+            while(not self.scope.dataReady()):
+                if(end is not None and time.monotonic() > end):
+                    return False
+                time.sleep(self.poll_interval)
+            return True
+
+        if(not await self.call(wait)):
+            raise asyncio.TimeoutError(
+                "No scope data after %ss" % str(timeout))
+
+
+    async def getRawChannelData(self, channel, numSamples = None):
+        """Return the most recently captured data for channel. See
+        Scope.getRawChannelData"""
+        return await self.call(self.scope.getRawChannelData,
+            channel, numSamples)
+
+
+    async def getRawSegmentedChannelData(self, channel, num_segments,
+                                         numSamples = None):
+        """Return the data for channel from the most recent segmented
+        capture. See Scope.getRawSegmentedChannelData"""
+        return await self.call(self.scope.getRawSegmentedChannelData,
+            channel, num_segments, numSamples)
+
+
+    async def close(self):
+        """Stop the worker thread."""
+        self._executor.shutdown()
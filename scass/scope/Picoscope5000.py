@@ -142,6 +142,47 @@ class Picoscope5000(Scope):
         self.__scope.runBlock()
 
     
+    def runSegmentedCapture(self, num_segments):
+        """Split the scope memory into num_segments segments and arm it
+        to capture one trigger into each. Use getRawSegmentedChannelData
+        to return the data."""
+        max_samples = self.__scope.memorySegments(num_segments)
+
+        assert(self._num_samples <= max_samples), \
+            "%d samples per trace, but only %d fit in each of %d segments"%(
+                self._num_samples, max_samples, num_segments)
+
+        self.__scope.setNoOfCaptures(num_segments)
+        self.__scope.runBlock()
+
+
+    def getRawSegmentedChannelData(self, channel, num_segments,
+                                   numSamples = None):
+        """
+        Return the raw signal data for the supplied channel from the
+        most recent segmented capture, as a (num_segments, numSamples)
+        numpy array, read out of the scope with a single bulk transfer.
+        """
+        assert(isinstance(channel,ScopeChannel))
+        assert(channel.channel_id in self._channels)
+
+        if(numSamples == None):
+            numSamples = self._num_samples
+
+        data, nsamples, overflow = self.__scope.getDataRawBulk(
+            channel     = channel.channel_id,
+            numSamples  = numSamples,
+            fromSegment = 0,
+            toSegment   = num_segments - 1
+        )
+
+        # Return the scope to a single segment for runCapture.
+        self.__scope.memorySegments(1)
+        self.__scope.setNoOfCaptures(1)
+
+        return data
+
+
     @property
     def scope_information(self):
         """Returns a device specific string detailing it. Usually a
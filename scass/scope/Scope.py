@@ -156,6 +156,26 @@ class Scope(object):
         raise NotImplementedError("Function should be implemented by inheriting classes")
 
 
+    def runSegmentedCapture(self, num_segments):
+        """Arm the scope to capture num_segments consecutive triggers,
+        each into its own memory segment, e.g. one per run of a
+        Target.doRunBurst. Use getRawSegmentedChannelData to return
+        the data once dataReady."""
+        raise NotImplementedError("Function should be implemented by inheriting classes")
+
+
+    def getRawSegmentedChannelData(self, channel, num_segments,
+                                   numSamples = None):
+        """
+        Return the raw signal data for the supplied channel from the
+        most recent segmented capture, as a (num_segments, numSamples)
+        numpy array. If numSamples is None, then self.num_samples are
+        returned.
+        """
+        assert(isinstance(channel,ScopeChannel))
+        raise NotImplementedError("Function should be implemented by inheriting classes")
+
+
     def findTriggerWindowSize(self, trigger_signal):
         """
         First finds the mean value of a trigger signal trace, then
@@ -5,6 +5,7 @@ from .Picoscope5000 import Picoscope5000
 from .ScopeChannel  import ScopeChannel
 from .ScopeTrigger  import ScopeTrigger
 from .Scope         import fromConfig
+from .AsyncScope    import AsyncScope
 
 def findTriggerWindowSize(scope, target, power_channel,max_retries = 10):
     """
@@ -17,7 +18,10 @@ def findTriggerWindowSize(scope, target, power_channel,max_retries = 10):
     window_size = 0
     retries     = 0
     while(window_size <= 10 and retries < max_retries):
-    
+
+        if(retries > 0):
+            time.sleep(1)
+
         scope.runCapture()
         target.doRunFixedExperiment()
 
@@ -31,8 +35,6 @@ def findTriggerWindowSize(scope, target, power_channel,max_retries = 10):
 
         window_size = scope.findTriggerWindowSize(sig_trigger)
         retries += 1
-    
-        time.sleep(1)
 
     return window_size
 
@@ -0,0 +1,164 @@
+
+import logging as log
+
+from itertools       import repeat
+from multiprocessing import Pool
+
+import numpy as np
+
+def _padEdges(traces, start, stop):
+    """
+    Return columns [start,stop) of the 2d `traces` array, where columns
+    outside the array take the value of the nearest edge sample.
+    """
+    T   = traces.shape[1]
+    idx = np.clip(np.arange(start, stop), 0, T-1)
+    return traces[:, idx]
+
+
+def findTraceShifts(traces, reference, max_offset, window = None):
+    """
+    Find the shift which best aligns each trace with the reference
+    trace, using FFT based cross-correlation over a window of samples.
+
+    traces - np.ndarray
+        2d array, one trace per row.
+    reference - np.ndarray
+        The 1d reference trace, e.g. TraceSet.averageTrace().
+    max_offset - int
+        Only consider shifts in the range [-max_offset, max_offset].
+    window - (int,int) or None
+        (start, stop) sample indices of the reference to correlate
+        against. If None, the whole reference is used.
+
+    Returns a tuple (shifts, corr) of 1d arrays, where shifts[i] is the
+    offset such that traces[i][t+shifts[i]] lines up with reference[t],
+    and corr[i] is the Pearson correlation coefficient at that shift.
+    """
+    traces      = np.asarray(traces)
+    reference   = np.asarray(reference, dtype=np.float64)
+
+    if(window is None):
+        window = (0, reference.size)
+
+    ws, we      = window
+    W           = we - ws
+    M           = max_offset
+
+    assert(W > 1), "Alignment window must be more than one sample long"
+    assert(M >= 0)
+
+    ref_c       = reference[ws:we] - np.mean(reference[ws:we])
+    ref_norm    = np.sqrt(np.dot(ref_c, ref_c))
+
+    seg         = _padEdges(traces, ws-M, we+M).astype(np.float64)
+    S           = seg.shape[1]
+
+    # xcorr[:,s] = sum_j seg[:,j+s] * ref_c[j] for s in [0, 2M]
+    nfft        = 1 << int(np.ceil(np.log2(S + W)))
+    f_seg       = np.fft.rfft(seg, n=nfft, axis=1)
+    f_ref       = np.conj(np.fft.rfft(ref_c, n=nfft))
+    xcorr       = np.fft.irfft(f_seg * f_ref, n=nfft, axis=1)[:, 0:2*M+1]
+
+    # Sliding window sums for the trace side of the normalisation.
+    csum        = np.zeros((seg.shape[0], S+1))
+    csq         = np.zeros((seg.shape[0], S+1))
+    np.cumsum(seg       , axis=1, out=csum[:,1:])
+    np.cumsum(seg * seg , axis=1, out=csq [:,1:])
+
+    wsum        = csum[:, W:W+2*M+1] - csum[:, 0:2*M+1]
+    wsq         = csq [:, W:W+2*M+1] - csq [:, 0:2*M+1]
+    wvar        = np.maximum(wsq - wsum * wsum / W, 0)
+
+    bot         = np.sqrt(wvar) * ref_norm
+    bot[bot == 0] = 1
+
+    corr        = xcorr / bot
+
+    best        = np.argmax(corr, axis=1)
+    shifts      = best - M
+    best_corr   = corr[np.arange(corr.shape[0]), best]
+
+    return (shifts, best_corr)
+
+
+def shiftTraces(traces, shifts):
+    """
+    Return a copy of the 2d `traces` array where row i is moved by
+    shifts[i] samples, such that out[i][t] = traces[i][t+shifts[i]].
+    Samples shifted in from outside the trace repeat the edge value.
+    """
+    D, T    = traces.shape
+    idx     = np.arange(T)[np.newaxis,:] + np.asarray(shifts)[:,np.newaxis]
+    np.clip(idx, 0, T-1, out=idx)
+    return np.take_along_axis(traces, idx, axis=1)
+
+
+def _alignChunk(traces, reference, max_offset, window):
+    shifts, corr = findTraceShifts(traces, reference, max_offset, window)
+    return (shiftTraces(traces, shifts), shifts, corr)
+
+
+def alignTraces(
+        traces,
+        reference,
+        max_offset,
+        window      = None,
+        min_corr    = None,
+        num_threads = 1,
+        chunk_size  = 1024
+    ):
+    """
+    Statically align every trace against a reference trace to correct
+    for trigger jitter.
+
+    traces - np.ndarray
+        2d array, one trace per row.
+    reference - np.ndarray
+        The 1d reference trace, e.g. TraceSet.averageTrace().
+    max_offset - int
+        Maximum shift (in samples) applied to any trace.
+    window - (int,int) or None
+        (start, stop) sample range of the reference used for matching.
+    min_corr - float or None
+        If set, traces whose best correlation with the reference is
+        below this are dropped.
+    num_threads - int
+        Number of processes used to align chunks in parallel.
+    chunk_size - int
+        Number of traces aligned per chunk.
+
+    Returns a tuple (aligned, shifts, corr, keep) where aligned holds
+    only the kept traces, and shifts, corr and keep (a boolean mask) are
+    over all of the input traces.
+    """
+    D           = traces.shape[0]
+    starts      = range(0, D, chunk_size)
+    chunks      = [traces[s:s+chunk_size] for s in starts]
+
+    map_arguments = zip(
+        chunks,
+        repeat(reference),
+        repeat(max_offset),
+        repeat(window)
+    )
+
+    if(num_threads > 1):
+        with Pool(num_threads) as p:
+            results = p.starmap(_alignChunk, map_arguments)
+    else:
+        results = [_alignChunk(*a) for a in map_arguments]
+
+    aligned = np.concatenate([r[0] for r in results])
+    shifts  = np.concatenate([r[1] for r in results])
+    corr    = np.concatenate([r[2] for r in results])
+
+    keep    = np.ones(D, dtype=bool)
+
+    if(min_corr is not None):
+        keep = corr >= min_corr
+        log.info("Dropping %d of %d traces with alignment corr < %f" % (
+            D - np.count_nonzero(keep), D, min_corr))
+        aligned = aligned[keep]
+
+    return (aligned, shifts, corr, keep)
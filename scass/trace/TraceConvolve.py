@@ -0,0 +1,140 @@
+
+import numpy as np
+
+from scipy.signal import oaconvolve
+
+# Kernels shorter than this are applied directly. Longer kernels use
+# overlap-add FFT convolution.
+DIRECT_MAX_KERNEL_LEN = 64
+
+def movingSum2d(traces, l, out = None):
+    """
+    Apply an 'l' length filter of all ones to every row of the 2d
+    `traces` array, using a cumulative sum so the cost is O(T) per trace
+    regardless of l. Output matches numpy.convolve(trace, [1]*l, 'same').
+
+    traces - np.ndarray
+        2d array, one trace per row.
+    l - int
+        Length of the filter. Must be no longer than a trace.
+    out - np.ndarray or None
+        Optional array to write the result into. May be `traces` itself,
+        in which case the operation happens in place.
+    """
+    D, T = traces.shape
+
+    assert(l > 0 and l <= T)
+
+    acc_dtype = np.result_type(traces.dtype, np.int64)
+
+    # csum[:,i] = sum(traces[:,0:i])
+    csum        = np.zeros((D, T+1), dtype=acc_dtype)
+    np.cumsum(traces, axis=1, dtype=acc_dtype, out=csum[:,1:])
+
+    # 'same' output element i is the full convolution element i+off,
+    # which covers input samples [i+off-l+1, i+off].
+    off         = (l-1)//2
+    idx         = np.arange(T)
+    hi          = np.minimum(idx + off + 1, T)
+    lo          = np.maximum(idx + off - l + 1, 0)
+
+    if(out is None):
+        out = np.empty((D, T), dtype=acc_dtype)
+
+    np.subtract(csum[:,hi], csum[:,lo], out=out, casting="unsafe")
+
+    return out
+
+
+def directConvolve2d(traces, weights):
+    """
+    Convolve every row of `traces` with `weights` using a direct
+    O(T*L) sum over the (short) kernel, vectorised across all traces.
+    Output matches numpy.convolve(trace, weights, 'same').
+    """
+    D, T    = traces.shape
+    L       = weights.size
+
+    rdtype  = np.result_type(traces.dtype, weights.dtype)
+
+    off     = (L-1)//2
+    padded  = np.zeros((D, T + L - 1), dtype=rdtype)
+    padded[:, L-1-off : L-1-off+T] = traces
+
+    out     = np.zeros((D, T), dtype=rdtype)
+
+    # out[:,i] = sum_k weights[k] * traces[:, i + off - k]
+    for k in range(0, L):
+        out += weights[k] * padded[:, L-1-k : L-1-k+T]
+
+    return out
+
+
+def convolveTraces2d(traces, weights, method = "auto"):
+    """
+    Convolve every row of the 2d `traces` array with the `weights`
+    filter, giving the same result as calling
+    numpy.convolve(trace, weights, 'same') on each row.
+
+    traces - np.ndarray
+        2d array, one trace per row.
+    weights - array like
+        The convolution filter. Must be no longer than a trace, as
+        numpy.convolve then returns the longer filter's length.
+    method - str
+        One of "auto", "cumsum", "direct" or "fft". "auto" uses a
+        cumulative-sum moving sum for uniform filters, direct
+        convolution for short filters and overlap-add FFT convolution
+        for long ones.
+
+    Returns a new 2d np.ndarray, except for uniform filters over floating
+    point traces, which are filtered in place and `traces` is returned.
+    """
+    assert(isinstance(traces, np.ndarray) and traces.ndim == 2)
+
+    weights = np.asarray(weights)
+    L       = weights.size
+    T       = traces.shape[1]
+
+    assert(L > 0 and L <= T), \
+        "Filter length %d must be between 1 and the trace length %d" % (L, T)
+
+    uniform = np.all(weights == weights[0])
+
+    if(method == "auto"):
+        if(uniform):
+            method = "cumsum"
+        elif(L <= DIRECT_MAX_KERNEL_LEN):
+            method = "direct"
+        else:
+            method = "fft"
+
+    if(method == "cumsum"):
+        assert(uniform), "cumsum method requires a uniform filter"
+
+        in_place = np.issubdtype(traces.dtype, np.floating) and \
+                   np.can_cast(weights.dtype, traces.dtype)
+        out      = traces if in_place else None
+
+        result   = movingSum2d(traces, L, out=out)
+
+        if(weights[0] != 1):
+            if(np.can_cast(weights.dtype, result.dtype)):
+                result *= weights[0]
+            else:
+                result  = result * weights[0]
+
+        return result
+
+    elif(method == "direct"):
+        return directConvolve2d(traces, weights)
+
+    elif(method == "fft"):
+        result = oaconvolve(traces, weights[np.newaxis,:], mode="same",
+            axes=1)
+        if(not np.issubdtype(np.result_type(traces, weights),np.floating)):
+            result = np.rint(result).astype(np.result_type(traces, weights))
+        return result
+
+    else:
+        raise ValueError("Unknown convolution method: '%s'" % method)
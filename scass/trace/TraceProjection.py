@@ -0,0 +1,287 @@
+
+"""
+Linear dimensionality reduction of traces. A Projection maps traces of
+T samples to a few components, and can be fitted by PCA (no labels) or
+LDA (labelled profiling traces).
+
+The fitting functions take their traces from a chunk source, which is
+either a 2d array of traces (one per row) or a callable returning a new
+iterator over DxT chunks each time it is called, e.g.
+
+    lambda: scass.trace.iterTracesFromDisk(path, chunk_size)
+
+so that traces which do not fit in memory can be streamed several times.
+"""
+
+import numpy as np
+
+from scipy.linalg import eigh
+
+class Projection(object):
+    """
+    A linear projection of traces, (T[:,samples] - mean) @ components
+    - offset.
+    """
+
+    def __init__(self, mean, components, offset = None, samples = None):
+        """
+        mean - np.ndarray
+            Length P mean subtracted from every (selected) trace.
+        components - np.ndarray
+            PxC projection matrix.
+        offset - np.ndarray
+            Optional length C vector subtracted after projecting.
+        samples - np.ndarray
+            Optional indexes of the P samples to use from each trace.
+            All samples are used if None.
+        """
+        self.mean       = np.asarray(mean, dtype=np.float64)
+        self.components = np.asarray(components, dtype=np.float64)
+        self.offset     = np.zeros(self.components.shape[1]) \
+            if offset is None else np.asarray(offset, dtype=np.float64)
+        self.samples    = None \
+            if samples is None else np.asarray(samples, dtype=np.int64)
+
+        assert(self.mean.size == self.components.shape[0]), \
+            "Mean has %d samples, components have %d" % (
+                self.mean.size, self.components.shape[0])
+
+    @property
+    def num_components(self):
+        """Number of output components"""
+        return self.components.shape[1]
+
+    @property
+    def input_length(self):
+        """Number of samples used from each input trace"""
+        return self.mean.size
+
+    def project(self, T):
+        """
+        Project the DxT traces in T, returning a DxC float32 matrix.
+        """
+        if(self.samples is not None):
+            T = T[:, self.samples]
+
+        P = np.dot(np.asarray(T, dtype=np.float64) - self.mean,
+            self.components)
+
+        return (P - self.offset).astype(np.float32)
+
+    def then(self, other):
+        """
+        Return a single Projection equivalent to applying this projection
+        and then other.
+        """
+        assert(other.samples is None), \
+            "Cannot compose with a projection which selects samples"
+
+        return Projection(
+            self.mean,
+            np.dot(self.components, other.components),
+            np.dot(self.offset + other.mean, other.components) + other.offset,
+            self.samples
+        )
+
+    def save(self, filepath):
+        """
+        Save the projection to an .npz file.
+        """
+        np.savez(filepath,
+            mean        = self.mean,
+            components  = self.components,
+            offset      = self.offset,
+            samples     = np.array([], dtype=np.int64) \
+                if self.samples is None else self.samples
+        )
+
+    @staticmethod
+    def load(filepath):
+        """
+        Load a projection saved with Projection.save
+        """
+        data    = np.load(filepath)
+        samples = data["samples"]
+
+        return Projection(
+            data["mean"],
+            data["components"],
+            data["offset"],
+            None if samples.size == 0 else samples
+        )
+
+
+def _chunks(source, samples = None):
+    """
+    Iterate over the chunks of a chunk source as float64 arrays.
+    """
+    if(isinstance(source, np.ndarray)):
+        it = [source[i:i+10000] for i in range(0, source.shape[0], 10000)]
+    else:
+        it = source()
+
+    for chunk in it:
+        if(samples is not None):
+            chunk = chunk[:, samples]
+        yield np.asarray(chunk, dtype=np.float64)
+
+
+def fitPCA(
+        source,
+        num_components,
+        samples     = None,
+        oversample  = 10,
+        num_iter    = 2,
+        seed        = None
+    ):
+    """
+    Fit a PCA projection onto the num_components directions of highest
+    variance, using a randomised subspace iteration. Only a
+    T x (num_components + oversample) matrix is held in memory, and the
+    source is read num_iter + 2 times.
+
+    source - np.ndarray or callable
+        Chunk source, see the module documentation.
+    samples - np.ndarray
+        Optional indexes of the samples to use from each trace.
+    oversample - int
+        Extra dimensions in the random subspace, improving accuracy.
+    num_iter - int
+        Number of power iterations. More helps when the variance of the
+        traces is spread over many components.
+    """
+    n       = 0
+    total   = 0
+
+    for chunk in _chunks(source, samples):
+        n      += chunk.shape[0]
+        total   = total + np.sum(chunk, axis=0)
+
+    mean    = total / n
+    T       = mean.size
+    L       = min(num_components + oversample, T)
+
+    rng     = np.random.default_rng(seed)
+    G       = np.linalg.qr(rng.standard_normal((T, L)))[0]
+
+    # Subspace iteration on the covariance, G <- orth(X^T X G), one pass
+    # over the traces per iteration.
+    for i in range(0, num_iter):
+
+        Y = np.zeros((T, L))
+
+        for chunk in _chunks(source, samples):
+            X   = chunk - mean
+            Y  += np.dot(X.T, np.dot(X, G))
+
+        G = np.linalg.qr(Y)[0]
+
+    # Rayleigh-Ritz: exact eigen decomposition within the subspace.
+    C = np.zeros((L, L))
+
+    for chunk in _chunks(source, samples):
+        XG  = np.dot(chunk - mean, G)
+        C  += np.dot(XG.T, XG)
+
+    evals, evecs = eigh(C / max(n - 1, 1))
+
+    order       = np.argsort(evals)[::-1][0:num_components]
+    components  = np.dot(G, evecs[:, order])
+
+    projection  = Projection(mean, components, samples = samples)
+
+    # Variance of the traces along each component.
+    projection.explained_variance = evals[order]
+
+    return projection
+
+
+def fitLDA(
+        source,
+        labels,
+        num_components,
+        num_classes     = 256,
+        samples         = None,
+        pre             = None,
+        regularisation  = 1e-6
+    ):
+    """
+    Fit a Fisher LDA projection onto the num_components directions which
+    best separate the class labels, relative to the pooled within class
+    scatter. The scatter matrices are PxP, so the traces must first be
+    reduced to a modest number of samples, either by selecting points of
+    interest with samples, or by a PCA projection given as pre.
+
+    source - np.ndarray or callable
+        Chunk source, see the module documentation.
+    labels - np.ndarray
+        Length D array of integer class labels, one per trace.
+    pre - Projection
+        Optional projection applied to each chunk before fitting. The
+        returned projection includes it.
+    regularisation - float
+        Added to the diagonal of the within class scatter, relative to
+        its mean diagonal value, so it is always invertible.
+    """
+    labels  = np.asarray(labels).reshape(-1)
+
+    n       = 0
+    count   = np.zeros(num_classes, dtype=np.int64)
+    sums    = None
+    sum_xx  = None
+    first   = 0
+
+    for chunk in _chunks(source, None if pre is not None else samples):
+
+        if(pre is not None):
+            chunk = pre.project(chunk).astype(np.float64)
+
+        D       = chunk.shape[0]
+        l_chunk = labels[first:first+D]
+        first  += D
+
+        if(sums is None):
+            sums    = np.zeros((num_classes, chunk.shape[1]))
+            sum_xx  = np.zeros((chunk.shape[1], chunk.shape[1]))
+
+        order   = np.argsort(l_chunk, kind="stable")
+        l_chunk = l_chunk[order]
+        chunk   = chunk[order]
+
+        classes, starts = np.unique(l_chunk, return_index=True)
+
+        sums  [classes] += np.add.reduceat(chunk, starts, axis=0)
+        count [classes] += np.diff(np.append(starts, D))
+        sum_xx          += np.dot(chunk.T, chunk)
+        n               += D
+
+    used    = count > 0
+    c_n     = count[used].astype(np.float64)
+    means   = sums[used] / c_n[:,np.newaxis]
+    mean    = np.sum(sums, axis=0) / n
+
+    # Within class scatter: sum over classes of sum (x - mu_c)(x - mu_c)^T
+    S_w     = sum_xx - np.dot((means * c_n[:,np.newaxis]).T, means)
+
+    # Between class scatter: sum over classes of n_c (mu_c - mu)(mu_c - mu)^T
+    M       = means - mean
+    S_b     = np.dot((M * c_n[:,np.newaxis]).T, M)
+
+    S_w    += np.eye(S_w.shape[0]) * regularisation * \
+        max(np.mean(np.diag(S_w)), np.finfo(np.float64).tiny)
+
+    evals, evecs = eigh(S_b, S_w)
+
+    order       = np.argsort(evals)[::-1][0:num_components]
+
+    lda         = Projection(mean, evecs[:, order])
+
+    if(pre is not None):
+        lda     = pre.then(lda)
+    else:
+        lda     = Projection(mean, evecs[:, order], samples = samples)
+
+    # Ratio of between to within class scatter along each component.
+    lda.eigenvalues = evals[order]
+
+    return lda
@@ -2,6 +2,8 @@
 import numpy as np
 
 from .TraceReaderBase import TraceReaderBase
+from .TraceConvolve   import convolveTraces2d
+from .TraceAlign      import alignTraces
 
 def ResampleLinear1D(original, targetLen):
     """
@@ -171,25 +173,83 @@ class TraceSet(object):
         self.__aux_data = reader.aux_data
 
 
-    def convolveTraces(self, weights):
+    def convolveTraces(self, weights, method = "auto"):
         """
         For each trace in the set, apply the supplied `weights` convolution
-        filter, where weights is "array like". Uses the numpy.convolve
-        function.
+        filter, where weights is "array like". Gives the same result as
+        numpy.convolve(trace, weights, 'same') on every trace.
+        If all traces are the same length and no shorter than the filter,
+        the whole set is filtered as one matrix using
+        scass.trace.TraceConvolve.convolveTraces2d, which picks a
+        moving-sum, direct or FFT method based on `method` and the filter
+        length.
         This operation is destructive. The original traces can only be
         recovered by re-loading them from somewhere.
         """
 
-        for i,trace in enumerate(self.__traces):
-            
-            self.__traces[i] = np.convolve(trace, weights, 'same')
+        if(self.num_traces == 0):
+            return
+
+        weights = np.asarray(weights)
+
+        if(not self.traces_are_uniform_length or
+           weights.size > self.trace_length):
+
+            for i,trace in enumerate(self.__traces):
+                
+                self.__traces[i] = np.convolve(trace, weights, 'same')
+
+            return
+
+        tmat    = np.stack(self.__traces)
+        result  = convolveTraces2d(tmat, weights, method=method)
+
+        self.__traces = list(result)
 
     def convolveTracesUniform(self, l):
         """
         Calls convolveTraces with an 'l' length convolution filter, where
         all elements in l are 1.
         """
-        self.convolveTraces([1]*l)
+        self.convolveTraces(np.ones(l, dtype=np.int64))
+
+
+    def alignTraces(
+            self,
+            max_offset,
+            reference   = None,
+            window      = None,
+            min_corr    = None,
+            num_threads = 1
+        ):
+        """
+        Shift every trace so that it best matches the reference trace,
+        using scass.trace.TraceAlign.alignTraces. If reference is None,
+        the average trace of the set is used. Traces whose correlation
+        with the reference is below min_corr are removed from the set,
+        along with their aux data.
+        This operation is destructive.
+        Returns the array of shifts applied to each (original) trace.
+        """
+        
+        if(reference is None):
+            reference = self.averageTrace()
+
+        tmat    = np.stack(self.__traces)
+
+        aligned, shifts, corr, keep = alignTraces(
+            tmat,
+            reference,
+            max_offset,
+            window      = window,
+            min_corr    = min_corr,
+            num_threads = num_threads
+        )
+
+        self.__traces   = list(aligned)
+        self.__aux_data = [a for a,k in zip(self.__aux_data,keep) if k]
+
+        return shifts
 
 
     def subsampleTraces(self, factor):
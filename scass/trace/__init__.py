@@ -1,6 +1,8 @@
 
 import lz4.frame
 import gzip
+import json
+import os
 import numpy as np
 import logging as log
 
@@ -9,9 +11,52 @@ from .TraceReaderBase   import TraceReaderBase
 from .TraceWriterSimple import TraceWriterSimple
 from .TraceReaderSimple import TraceReaderSimple
 from .TraceSet          import TraceSet
+from .TraceConvolve     import convolveTraces2d
+from .TraceAlign        import alignTraces
+from .TraceProjection   import Projection
+from .TraceProjection   import fitPCA
+from .TraceProjection   import fitLDA
 from .TraceCapture      import TraceCapture
 
 
+def saveTraceIndex(filepath, files, rows = None):
+    """
+    Write a .json trace index, which loadTracesFromDisk and
+    iterTracesFromDisk read as the concatenation of the arrays in files,
+    in order. E.g. to present the per-bench shards of a capture campaign
+    as a single trace set without copying them.
+
+    files - list of str
+        Paths of the array files. Stored relative to the index.
+    rows - list of int or None
+        Optional number of rows in each file, for information.
+    """
+    base = os.path.dirname(os.path.abspath(filepath))
+
+    index = {
+        "files" : [os.path.relpath(os.path.abspath(f), base) for f in files],
+        "rows"  : None if rows is None else [int(r) for r in rows]
+    }
+
+    with open(filepath, "w") as fh:
+        json.dump(index, fh, indent=4)
+
+    log.info("Saved trace index of %d files to '%s'" % (len(files), filepath))
+
+
+def loadTraceIndex(filepath):
+    """
+    Return the list of array file paths in a .json trace index written
+    by saveTraceIndex.
+    """
+    base = os.path.dirname(os.path.abspath(filepath))
+
+    with open(filepath, "r") as fh:
+        index = json.load(fh)
+
+    return [os.path.join(base, f) for f in index["files"]]
+
+
 def saveTracesToDisk(filepath, traces):
     
     assert(isinstance(traces,np.ndarray))
@@ -59,9 +104,96 @@ def loadTracesFromDisk(filepath):
         
         data = np.load(filepath)
 
+    elif(filepath.endswith(".json")):
+
+        data = np.concatenate(
+            [loadTracesFromDisk(f) for f in loadTraceIndex(filepath)])
+
     else:
         log.error("Unknown file extension: '%s'" % filepath)
         log.error("Could not load traces from disk.")
         raise Exception("Unknown file extension: '%s'" % filepath)
 
     return data
+
+
+def _readNpyHeader(fh):
+    """
+    Read the header of a .npy stream, returning (shape, fortran, dtype).
+    """
+    version = np.lib.format.read_magic(fh)
+    if(version == (1,0)):
+        return np.lib.format.read_array_header_1_0(fh)
+    else:
+        return np.lib.format.read_array_header_2_0(fh)
+
+
+def _iterNpyStream(fh, chunk_size):
+    """
+    Yield consecutive blocks of at most chunk_size rows from an open .npy
+    file stream, without reading the whole array into memory.
+    """
+    shape, fortran, dtype = _readNpyHeader(fh)
+
+    if(fortran or len(shape) == 0 or dtype.hasobject):
+        # Can't stream these layouts row by row.
+        raise Exception("Cannot stream array with shape %s, dtype %s" % (
+            str(shape), str(dtype)))
+
+    rows        = shape[0]
+    row_shape   = shape[1:]
+    row_bytes   = int(np.prod(row_shape, dtype=np.int64)) * dtype.itemsize
+
+    done        = 0
+
+    while(done < rows):
+        
+        n       = min(chunk_size, rows - done)
+        buf     = fh.read(n * row_bytes)
+
+        if(len(buf) != n * row_bytes):
+            raise Exception("Unexpected end of file after %d rows" % done)
+
+        yield np.frombuffer(buf, dtype=dtype).reshape((n,) + row_shape)
+
+        done   += n
+
+
+def iterTracesFromDisk(filepath, chunk_size = 10000):
+    """
+    Like loadTracesFromDisk, but yields the array stored at filepath in
+    blocks of at most chunk_size rows, so that peak memory use does not
+    depend on the number of traces in the file.
+    .npy files are memory mapped. .gz and .lz4 files are decompressed
+    as a stream. The files of a .json trace index are streamed in turn,
+    and blocks do not span files.
+    """
+
+    log.info("Streaming traces from '%s'" % filepath)
+
+    if(filepath.endswith(".gz")):
+
+        with gzip.GzipFile(filepath,"r") as gzfh:
+            yield from _iterNpyStream(gzfh, chunk_size)
+
+    elif(filepath.endswith(".lz4")):
+
+        with lz4.frame.open(filepath,mode="r") as lz4h:
+            yield from _iterNpyStream(lz4h, chunk_size)
+
+    elif(filepath.endswith(".npy")):
+        
+        data = np.load(filepath, mmap_mode="r")
+
+        for i in range(0, data.shape[0], chunk_size):
+            yield np.asarray(data[i:i+chunk_size])
+
+    elif(filepath.endswith(".json")):
+
+        for f in loadTraceIndex(filepath):
+            yield from iterTracesFromDisk(f, chunk_size)
+
+    else:
+        log.error("Unknown file extension: '%s'" % filepath)
+        log.error("Could not load traces from disk.")
+        raise Exception("Unknown file extension: '%s'" % filepath)
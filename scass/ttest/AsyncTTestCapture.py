@@ -0,0 +1,183 @@
+
+import asyncio
+
+import numpy as np
+
+from tqdm    import tqdm
+
+from ..comms.AsyncTarget import AsyncTarget
+from ..scope.AsyncScope  import AsyncScope
+
+from .TTestCapture import TTestCapture
+from .TTestCapture import no_progress_bar
+
+class AsyncTTestCapture(TTestCapture):
+    """
+    A TTestCapture driven by an asyncio event loop, through an
+    AsyncTarget and AsyncScope. Waiting on the target or scope yields to
+    the event loop, so captures on several benches can run concurrently
+    in one process:
+
+        await asyncio.gather(
+            capture_a.performTTestAsync(),
+            capture_b.performTTestAsync())
+
+    The synchronous setup and teardown steps are reused as they are,
+    run on the target's writer thread and a worker thread respectively.
+    performTTest still works synchronously.
+    """
+
+    def __init__(self,
+                 atarget,
+                 ascope,
+                 trigger_channel,
+                 signal_channel,
+                 traces_file,
+                 fixed_file,
+                 num_traces = 1000,
+                 num_samples= 1000,
+                 trs_dtype  = np.float32):
+        """
+        As TTestCapture, but taking an AsyncTarget and an AsyncScope.
+        """
+        assert(isinstance(atarget, AsyncTarget))
+        assert(isinstance(ascope, AsyncScope))
+
+        TTestCapture.__init__(self, atarget.target, ascope.scope,
+            trigger_channel, signal_channel, traces_file, fixed_file,
+            num_traces = num_traces, num_samples = num_samples,
+            trs_dtype = trs_dtype)
+
+        self.atarget    = atarget
+        self.ascope     = ascope
+
+        # (vid, value) uploads for the next trace, while running async.
+        self._uploads   = None
+
+
+    def _upload_var_value(self, var):
+        """
+        As TTestCapture._upload_var_value, but while running async,
+        save the upload for _gather_trace_async to send.
+        """
+        if(self._uploads is None):
+            TTestCapture._upload_var_value(self, var)
+        else:
+            self._uploads.append((var.vid, var.current_value))
+
+
+    async def _gather_trace_async(self, fixed):
+        """
+        As _gather_trace, also sending the uploads saved for this trace.
+        """
+        sent = []
+
+        for vid, value in self._uploads:
+            sent.append(await self.atarget.send(
+                self.target.doSetVarValue, vid, value))
+
+        self._uploads.clear()
+
+        await self.ascope.runCapture()
+
+        sent.append(await self.atarget.send(self.target.doRunFixedExperiment
+            if fixed else self.target.doRunRandomExperiment))
+
+        await self.ascope.waitForData()
+
+        # Check the variable uploads and run all succeeded.
+        await asyncio.gather(*sent)
+
+        return await self.ascope.getRawChannelData(
+            self.signal_channel,
+            numSamples = self.num_samples
+        )
+
+
+    async def _gather_burst_async(self, fixed):
+        """
+        As _gather_burst.
+        """
+        await self.ascope.runSegmentedCapture(len(fixed))
+
+        status = await self.atarget.doRunBurst(fixed,
+            timeout = self.burst_timeout)
+
+        self._check_burst_status(status, len(fixed))
+
+        await self.ascope.waitForData()
+
+        return await self.ascope.getRawSegmentedChannelData(
+            self.signal_channel,
+            len(fixed),
+            numSamples = self.num_samples
+        )
+
+
+    async def _run_ttest_async(self):
+        """
+        As _run_ttest.
+        """
+        progress = tqdm if self.progress_bar else no_progress_bar
+
+        await self.atarget.doInitExperiment()
+
+        if(self.burst_size > 0):
+            await self._run_ttest_bursts_async()
+            return
+
+        self._uploads = []
+
+        try:
+            for gather_fixed in progress(self.fixed_bits.astype(bool).tolist()):
+
+                self._pre_gather_trace()
+
+                if(gather_fixed):
+                    self._pre_gather_fixed_value_trace()
+                else:
+                    self._pre_gather_random_value_trace()
+
+                new_trace = await self._gather_trace_async(gather_fixed)
+
+                # May refresh the target randomness or read outputs.
+                await self.atarget.call(
+                    self._post_gather_trace, new_trace, gather_fixed)
+
+        finally:
+            self._uploads = None
+
+
+    async def _run_ttest_bursts_async(self):
+        """
+        As _run_ttest_bursts.
+        """
+        progress = tqdm if self.progress_bar else no_progress_bar
+
+        self._check_burst_capture()
+
+        for first in progress(range(0, self.num_traces, self.burst_size)):
+
+            fixed   = self.fixed_bits[first:first+self.burst_size]
+            traces  = await self._gather_burst_async(fixed)
+
+            await self.atarget.call(self._post_gather_burst, traces, fixed)
+
+
+    async def initialiseTTestAsync(self):
+        """
+        As initialiseTTest.
+        """
+        await self.atarget.call(self._initialise)
+
+
+    async def performTTestAsync(self):
+        """
+        As performTTest.
+        """
+        await self.atarget.call(self._pre_run_ttest)
+        await self._run_ttest_async()
+
+        # Saving the traces is slow, but does not need the target.
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._post_run_ttest)
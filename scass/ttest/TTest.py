@@ -8,7 +8,8 @@ class TTest(object):
     Class for performing Welch's TTest on trace sets.
     """
 
-    def __init__(self, ts_fixed, ts_random, second_order=False):
+    def __init__(self, ts_fixed, ts_random, second_order=False,
+                 samples=None):
         """
         Create a new TTest object, perform the ttest, and produce
         useful outputs.
@@ -21,8 +22,16 @@ class TTest(object):
         second_order - bool
             Perform a "second order ttest where the average traces
             are squared.
+        samples - np.ndarray
+            Optional indexes of the samples to test, e.g. points of
+            interest. The ttrace then has one entry per sample index.
         """
 
+        if(samples is not None):
+            ts_fixed    = ts_fixed [:, samples]
+            ts_random   = ts_random[:, samples]
+
+        self.samples    = samples
         self.ts_fixed   = ts_fixed
         self.ts_random  = ts_random
         self.second_order = second_order
@@ -0,0 +1,320 @@
+
+import hashlib
+import multiprocessing
+import os
+import queue
+import random
+import secrets
+import time
+
+import logging as log
+
+from ..comms import Target
+from ..scope import fromConfig
+from ..scope import findTriggerWindowSize
+from ..trace import saveTraceIndex
+
+from .TTestCapture import TTestCapture
+from .TTestCapture import balancedSchedule
+
+class CaptureBench(object):
+    """
+    One capture bench: a target board on a serial port and the scope
+    sampling it.
+    """
+
+    def __init__(self, port, scope_config, baud = 9600, power_channel = "A"):
+        """
+        port - str
+            Serial port of the target.
+        scope_config - str
+            Scope configuration file, as for scass.scope.fromConfig.
+        baud - int
+            Baud rate to connect to the target at.
+        power_channel - str
+            Scope channel ID which samples the power signal.
+        """
+        self.port           = port
+        self.scope_config   = scope_config
+        self.baud           = baud
+        self.power_channel  = power_channel
+
+
+    def __repr__(self):
+        return "%s@%d/%s" % (self.port, self.baud, self.scope_config)
+
+
+def campaignFixedValue(seed, name, size):
+    """
+    Return the size byte fixed value every shard of a campaign with the
+    given seed uses for the variable called name.
+    """
+    out     = b""
+    counter = 0
+
+    while(len(out) < size):
+        out += hashlib.sha256(("%d:%s:%d" % (seed, name, counter)).encode(
+            "ascii")).digest()
+        counter += 1
+
+    return out[0:size]
+
+
+def shardSizes(num_traces, num_shards):
+    """
+    Split num_traces as evenly as possible into num_shards counts.
+    """
+    base, extra = divmod(num_traces, num_shards)
+
+    return [base + (1 if i < extra else 0) for i in range(num_shards)]
+
+
+class TTestCampaign(object):
+    """
+    Shards one TTest capture campaign across several benches, each
+    captured by its own process, so throughput scales with the number
+    of benches.
+
+    Every shard shares the campaign's fixed values and settings, and
+    follows its slice of one balanced fixed/random schedule for the
+    whole campaign. Shards trace the same window of samples: the
+    smallest trigger window any bench finds, unless num_samples is set.
+    Each shard writes its own trace, fixed/random and variable files to
+    shard-NN/ in output_dir.
+    Once all shards finish, .json trace indexes in output_dir (see
+    scass.trace.saveTraceIndex) present them as a single trace set:
+    traces.json, fixed.json and var-<name>.json.
+    """
+
+    def __init__(self, benches, output_dir, num_traces, trace_ext = ".npy"):
+        """
+        benches - list of CaptureBench
+        output_dir - str
+            Directory for the shard files and indexes. Created if needed.
+        num_traces - int
+            Total number of traces to capture, across all benches.
+        trace_ext - str
+            Trace file extension, as for scass.trace.saveTracesToDisk.
+        """
+        assert(len(benches) > 0), "Need at least one bench"
+
+        self.benches        = benches
+        self.output_dir     = output_dir
+        self.num_traces     = num_traces
+        self.trace_ext      = trace_ext
+
+        # Seeds the fixed values (see campaignFixedValue) and the
+        # fixed/random schedule.
+        self.seed           = secrets.randbits(32)
+
+        # Fixed values, by variable name, as for TTestCapture.fixed_values.
+        # Override the seeded ones.
+        self.fixed_values   = {}
+
+        # TTestCapture attributes set on every shard, e.g.
+        # {"target_prng": True, "burst_size": 64}
+        self.capture_options= {}
+
+        # If set, every shard captures this many samples per trace
+        # rather than the smallest trigger window found.
+        self.num_samples    = None
+
+        self.negotiate_baud = False
+
+        # Seconds shards wait for each other to find their windows.
+        self.sync_timeout   = 300
+
+
+    def shardPath(self, index, name):
+        """Return the path of file name in the directory of shard index"""
+        return os.path.join(self.output_dir, "shard-%02d" % index, name)
+
+
+    def run(self):
+        """
+        Capture every shard, then write the indexes.
+
+        Returns a list with a dict summarising each shard, with keys
+        "index", "bench", "traces", "fixed", "vars" (file paths by
+        variable name), "num_traces", "num_samples", "fixed_count" and
+        "seconds".
+        """
+        n       = len(self.benches)
+        sizes   = shardSizes(self.num_traces, n)
+        schedule= balancedSchedule(self.num_traces, self.seed)
+
+        ctx     = multiprocessing.get_context()
+        barrier = ctx.Barrier(n, timeout = self.sync_timeout)
+        windows = ctx.Array("i", n)
+        results = ctx.Queue()
+
+        workers = []
+        offset  = 0
+
+        for i, bench in enumerate(self.benches):
+
+            os.makedirs(os.path.dirname(self.shardPath(i, "x")), exist_ok=True)
+
+            spec = {
+                "index"         : i,
+                "bench"         : bench,
+                "num_traces"    : sizes[i],
+                "schedule"      : schedule[offset:offset+sizes[i]],
+                "traces"        : self.shardPath(i, "traces" + self.trace_ext),
+                "fixed"         : self.shardPath(i, "fixed.npy"),
+                "seed"          : self.seed,
+                "fixed_values"  : self.fixed_values,
+                "options"       : self.capture_options,
+                "num_samples"   : self.num_samples,
+                "negotiate_baud": self.negotiate_baud
+            }
+
+            log.info("Shard %d: %d traces on %s" % (i, sizes[i], str(bench)))
+
+            worker = ctx.Process(target = _captureShard,
+                args = (spec, barrier, windows, results))
+            worker.start()
+            workers.append(worker)
+
+            offset += sizes[i]
+
+        summaries = self.__collect(workers, results)
+
+        for w in workers:
+            w.join()
+
+        errors = [s for s in summaries if "error" in s]
+
+        if(len(errors) > 0):
+            for s in errors:
+                log.error("Shard %d failed: %s" % (s["index"], s["error"]))
+            raise Exception("%d of %d shards failed" % (len(errors), n))
+
+        summaries.sort(key = lambda s: s["index"])
+
+        self.__writeIndexes(summaries)
+
+        return summaries
+
+
+    def __collect(self, workers, results):
+        """Wait for a result from every worker."""
+        summaries = []
+
+        while(len(summaries) < len(workers)):
+            try:
+                summaries.append(results.get(timeout = 1))
+            except queue.Empty:
+                done = set([s["index"] for s in summaries])
+                for i, w in enumerate(workers):
+                    if(i not in done and not w.is_alive()):
+                        summaries.append({"index": i, "error":
+                            "process exited with code %s" % str(w.exitcode)})
+
+        return summaries
+
+
+    def __writeIndexes(self, summaries):
+        """Write the indexes presenting the shards as one trace set."""
+        rows = [s["num_traces"] for s in summaries]
+
+        saveTraceIndex(os.path.join(self.output_dir, "traces.json"),
+            [s["traces"] for s in summaries], rows)
+
+        saveTraceIndex(os.path.join(self.output_dir, "fixed.json"),
+            [s["fixed"] for s in summaries], rows)
+
+        for name in summaries[0]["vars"]:
+            saveTraceIndex(
+                os.path.join(self.output_dir, "var-%s.json" % name),
+                [s["vars"][name] for s in summaries], rows)
+
+
+def _captureShard(spec, barrier, windows, results):
+    """
+    Process body capturing one shard of a TTestCampaign. Puts a summary
+    dict, or a dict with an "error", on results.
+    """
+    index   = spec["index"]
+    bench   = spec["bench"]
+    start   = time.time()
+
+    try:
+        random.seed("%d:%d" % (spec["seed"], index))
+
+        target  = Target(bench.port, bench.baud)
+
+        assert(target.doHelloWorld()), "Failed target hello world handshake"
+
+        if(spec["negotiate_baud"]):
+            log.info("Shard %d: negotiated %d baud" % (
+                index, target.negotiateBaud()))
+
+        scope   = fromConfig(bench.scope_config)
+        power   = scope.getChannel(bench.power_channel)
+
+        assert(target.doInitExperiment()), "Failed target experiment init"
+
+        # Every shard must capture the same number of samples.
+        window  = spec["num_samples"]
+
+        if(window is None):
+            windows[index] = findTriggerWindowSize(scope, target, power)
+            assert(windows[index] > 10), "Failed to find trigger window"
+
+        barrier.wait()
+
+        if(window is None):
+            window = min(windows[:])
+
+        ttest   = TTestCapture(
+            target,
+            scope,
+            scope.trigger_channel,
+            power,
+            spec["traces"],
+            spec["fixed"],
+            num_traces  = spec["num_traces"],
+            num_samples = window
+        )
+
+        ttest.progress_bar = False
+        ttest.schedule     = spec["schedule"]
+
+        for name, value in spec["options"].items():
+            setattr(ttest, name, value)
+
+        ttest.initialiseTTest()
+
+        ttest.fixed_values.update(spec["fixed_values"])
+
+        for var in ttest.tgt_vars:
+            if(var.name in ttest.fixed_values or ttest.zeros_as_fixed_value):
+                continue
+            elif(var.is_input and
+                 (var.is_ttest_variable or var.is_randomisable)):
+                ttest.fixed_values[var.name] = campaignFixedValue(
+                    spec["seed"], var.name, var.size)
+
+        ttest.performTTest()
+
+        vdir    = os.path.dirname(spec["traces"])
+
+        results.put({
+            "index"         : index,
+            "bench"         : str(bench),
+            "traces"        : spec["traces"],
+            "fixed"         : spec["fixed"],
+            "vars"          : dict([(v.name,
+                os.path.join(vdir, "var-" + v.name + ".npy.gz"))
+                for v in ttest.tgt_vars]),
+            "num_traces"    : ttest.trace_count,
+            "num_samples"   : window,
+            "fixed_count"   : ttest.fixed_count,
+            "seconds"       : time.time() - start
+        })
+
+    except Exception as e:
+        barrier.abort()
+        log.exception("Shard %d failed" % index)
+        results.put({"index": index, "error": str(e)})
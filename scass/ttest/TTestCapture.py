@@ -11,6 +11,8 @@ import numpy as np
 from tqdm    import tqdm
 
 from ..comms import Target
+from ..comms import TargetPRNG
+from ..comms.TargetPRNG import isPRNGVariable
 from ..scope.Scope import Scope
 from ..scope.ScopeChannel import ScopeChannel
 from ..trace import TraceWriterBase
@@ -19,6 +21,32 @@ from ..trace import saveTracesToDisk
 def no_progress_bar(x):
     return x
 
+
+def balancedSchedule(num_traces, seed = None):
+    """
+    Return a shuffled fixed/random schedule for num_traces traces, as an
+    int8 array which is 1 for fixed traces, with equal numbers of fixed
+    and random traces. If num_traces is odd, the extra trace is fixed or
+    random at random.
+
+    seed - int or None
+        Seeds the shuffle. Defaults to bits from the random module, so
+        seeding that makes the schedule repeatable.
+    """
+    if(seed is None):
+        seed = random.getrandbits(64)
+
+    rng         = np.random.default_rng(seed)
+    num_fixed   = num_traces // 2 + int(rng.integers(0, 2) * (num_traces % 2))
+
+    schedule    = np.zeros((num_traces), dtype=np.int8)
+    schedule[0:num_fixed] = 1
+
+    rng.shuffle(schedule)
+
+    return schedule
+
+
 class TTestCapture(object):
     """
     A class which automates the capture process for TTest trace sets.
@@ -91,10 +119,17 @@ class TTestCapture(object):
             dtype=trs_dtype
         )
 
+        # Fixed/random schedule: 1 for traces which use the fixed
+        # values. Filled in by _pre_run_ttest, from schedule if set.
         self.fixed_bits     = np.zeros(
             (num_traces), dtype=np.int8
         )
 
+        # If set, a fixed/random schedule of num_traces entries to use
+        # instead of a new balancedSchedule. E.g. a slice of a schedule
+        # shared by several captures.
+        self.schedule       = None
+
         # Dict of np.ndarray, keyed by target input variable names.
         self.tgt_vars_values= {}
 
@@ -108,10 +143,39 @@ class TTestCapture(object):
 
         self.zeros_as_fixed_value = False
 
+        # Fixed values to use for input variables, keyed by variable
+        # name, instead of random ones (TTest and randomisable variables)
+        # or the target's own (other inputs). E.g. so several captures
+        # share the same fixed values. Either bytes, or an int stored
+        # little endian.
+        self.fixed_values         = {}
+
+        # If set, read back the value of every output variable from the
+        # target after each trace, so that e.g. ciphertexts are stored
+        # alongside the traces. Costs one extra command per variable.
+        self.read_output_vars     = False
+
+        # If set, the target generates randomisable input values itself
+        # with its seeded PRNG, rather than having them uploaded before
+        # every trace. The host replays the PRNG to recover the values.
+        self.target_prng          = False
+        self.prng                 = None
+
+        # If > 0, capture traces in bursts of this many runs, each from a
+        # single Target.doRunBurst command and a segmented scope capture.
+        # Needs target_prng if any variables are randomisable.
+        self.burst_size           = 0
+        self.burst_timeout        = 30
+
         # Target clock information. Populated in _pre_run_ttest
         self.current_clk_cfg = None
         self.clk_configs     = None
 
+        # If set to a scass.comms.TargetMetadata, e.g. from a
+        # TargetMetadataCache, variable, randomness and clock information
+        # is taken from it rather than queried from the target.
+        self.metadata        = None
+
     @property
     def target_clk_info(self):
         return self.clk_configs[self.current_clk_cfg]
@@ -193,18 +257,24 @@ class TTestCapture(object):
         Called by _initialise
         """
 
-        self.tgt_var_num  = self.target.doGetVarNum()
-        
-        assert(self.tgt_var_num != False)
+        if(self.metadata is not None):
+            found_vars = self.metadata.targetVars()
+        else:
+            found_vars = []
+            var_num    = self.target.doGetVarNum()
 
-        self.tgt_vars       = []
-        self.tgt_vars_ttest = []
+            assert(var_num != False)
 
-        for i in range(0,self.tgt_var_num):
+            for i in range(0,var_num):
+                var = self.target.doGetVarInfo(i)
+                assert(var != False)
+                found_vars.append(var)
 
-            var = self.target.doGetVarInfo(i)
+        self.tgt_var_num    = len(found_vars)
+        self.tgt_vars       = []
+        self.tgt_vars_ttest = []
 
-            assert(var != False)
+        for var in found_vars:
 
             self.tgt_vars.append(var)
 
@@ -216,8 +286,13 @@ class TTestCapture(object):
                 dtype=np.uint8
             )
 
-        self.tgt_randomness_size = self.target.doRandGetLen()
-        self.tgt_randomness_rate = self.target.doRandGetRefreshRate()
+        if(self.metadata is not None):
+            self.tgt_randomness_size = self.metadata.randomness_len
+            self.tgt_randomness_rate = self.metadata.randomness_rate
+        else:
+            self.tgt_randomness_size = self.target.doRandGetLen()
+            self.tgt_randomness_rate = self.target.doRandGetRefreshRate()
+
         self.tgt_randomness_count= 0
 
 
@@ -237,6 +312,13 @@ class TTestCapture(object):
         both randomisable and ttest variables.
         """
 
+        inputs = [var.name for var in self.tgt_vars if var.is_input]
+
+        for name in self.fixed_values:
+            assert(name in inputs), \
+                "Cannot set fixed value of '%s': no input variable named so" %(
+                    name)
+
         if(len(self.tgt_vars) > 0):
             log.info("vid | %20s | Fixed Value" % "Variable")
             log.info("-"*80)
@@ -247,7 +329,23 @@ class TTestCapture(object):
             var.setFixedValue(bytes(var.size))
             var.takeFixedValue()
 
-            if(var.is_input and (var.is_ttest_variable or var.is_randomisable)):
+            if(var.is_input and var.name in self.fixed_values):
+                fixed_val = self.fixed_values[var.name]
+
+                if(isinstance(fixed_val, int)):
+                    fixed_val = fixed_val.to_bytes(var.size,byteorder="little")
+
+                fixed_val = bytes(fixed_val)
+
+                assert(len(fixed_val) == var.size), \
+                    "Fixed value of %s should be %d bytes" % (
+                        var.name, var.size)
+
+                var.setFixedValue(fixed_val)
+                var.takeFixedValue()
+
+            elif(var.is_input and
+                 (var.is_ttest_variable or var.is_randomisable)):
                 fixed_val = None
 
                 if(self.zeros_as_fixed_value):
@@ -282,7 +380,26 @@ class TTestCapture(object):
         called.
         """
         self._assign_ttest_fixed_values()
-        self.current_clk_cfg, self.clk_configs = self.target.doGetSysClkInfo()
+
+        if(self.schedule is not None):
+            assert(len(self.schedule) == self.num_traces), \
+                "Schedule needs %d entries" % self.num_traces
+            self.fixed_bits = (np.asarray(self.schedule) != 0).astype(np.int8)
+        else:
+            self.fixed_bits = balancedSchedule(self.num_traces)
+
+        if(self.metadata is not None):
+            self.current_clk_cfg = self.metadata.current_clk_cfg
+            self.clk_configs     = self.metadata.clk_configs
+        else:
+            self.current_clk_cfg, self.clk_configs = \
+                self.target.doGetSysClkInfo()
+
+        if(self.target_prng):
+            seed = secrets.randbits(32)
+            log.info("Seeding target input PRNG with %s" % hex(seed))
+            self.target.doPRNGSeed(seed)
+            self.prng = TargetPRNG(seed)
 
 
     def _pre_gather_trace(self):
@@ -299,14 +416,18 @@ class TTestCapture(object):
         Gathers a single trace where all TTest variables take on
         their fixed values.
         """
-        # No need to do anything since fixed values are already
-        # On the target device.
+        # No need to upload TTest variables since fixed values are
+        # already on the target device. Other randomisable variables
+        # (e.g. masks) must stay random, so are uploaded unless the
+        # target PRNG generates them.
         for var in self.tgt_vars:
             if(var.is_ttest_variable):
                 var.takeFixedValue()
+            elif(self.target_prng and isPRNGVariable(var.flags, True)):
+                continue
             elif(var.is_randomisable):
                 var.randomiseValue()
-                self.target.doSetVarValue(var.vid, var.current_value)
+                self._upload_var_value(var)
 
 
     def _pre_gather_random_value_trace(self):
@@ -315,11 +436,21 @@ class TTestCapture(object):
         their random values.
         """
         for var in self.tgt_vars:
-            if(var.is_randomisable):
+            if(self.target_prng and isPRNGVariable(var.flags, False)):
+                continue
+            elif(var.is_randomisable):
                 var.randomiseValue()
-                self.target.doSetVarValue(var.vid, var.current_value)
+                self._upload_var_value(var)
 
     
+    def _upload_var_value(self, var):
+        """
+        Send the current value of var to the target, ahead of the next
+        run. The command is checked once the trace is gathered.
+        """
+        self.target.doSetVarValue(var.vid, var.current_value, wait=False)
+
+
     def _gather_trace(self, fixed):
         """
         Gather a single trace from the target device.
@@ -327,13 +458,16 @@ class TTestCapture(object):
         self.scope.runCapture()
         
         if(fixed):
-            self.target.doRunFixedExperiment()
+            self.target.doRunFixedExperiment(wait=False)
         else:
-            self.target.doRunRandomExperiment()
+            self.target.doRunRandomExperiment(wait=False)
 
         while(not self.scope.dataReady()):
             pass
 
+        # Check the variable uploads and run all succeeded.
+        self.target.waitForCommands()
+
         trace = self.scope.getRawChannelData(
             self.signal_channel,
             numSamples = self.num_samples
@@ -342,7 +476,44 @@ class TTestCapture(object):
         return trace
 
 
-    def _post_gather_trace(self, new_trace, gather_fixed):
+    def _gather_burst(self, fixed):
+        """
+        Gather len(fixed) traces with a single burst command, where
+        fixed[i] says whether run i uses the fixed values. Returns a
+        (len(fixed), num_samples) array of traces.
+        """
+        self.scope.runSegmentedCapture(len(fixed))
+
+        status = self.target.doRunBurst(fixed, timeout=self.burst_timeout)
+
+        self._check_burst_status(status, len(fixed))
+
+        while(not self.scope.dataReady()):
+            pass
+
+        return self.scope.getRawSegmentedChannelData(
+            self.signal_channel,
+            len(fixed),
+            numSamples = self.num_samples
+        )
+
+
+    def _check_burst_status(self, status, count):
+        """
+        Check the status returned by Target.doRunBurst for a burst of
+        count runs, warning about any runs which failed.
+        """
+        assert(status != False), "Burst of %d runs failed" % count
+
+        completed, failures, first_failure = status
+
+        if(failures > 0):
+            log.warning("%d of %d burst runs failed, first at run %d" % (
+                failures, completed, first_failure))
+
+
+    def _post_gather_trace(self, new_trace, gather_fixed,
+                           refresh_randomness = True):
         """
         Called after each new trace (fixed or random) is gathered.
         Responsible for trace post-processing and adding traces to
@@ -353,30 +524,76 @@ class TTestCapture(object):
 
         :param gather_fixed:
             A bool. True iff a fixed value trace, false if random value.
+            Must match fixed_bits[trace_count], the schedule.
+
+        :param refresh_randomness:
+            If False, leave counting the run against the target
+            randomness to the caller, e.g. once per burst.
         """
 
         if(gather_fixed):
-            self.fixed_bits[self.trace_count] = 1
-            self.fixed_count                 += 1
+            self.fixed_count += 1
         else:
-            self.fixed_bits[self.trace_count] = 0
-            self.rand_count                  += 1
-        
+            self.rand_count  += 1
+
         self.traces [self.trace_count] = new_trace
 
+        if(self.read_output_vars):
+            self._read_output_vars()
+
         for var in self.tgt_vars:
-            for i in range(0,var.size):
-                self.tgt_vars_values[var.name][self.trace_count][i] = \
-                    var.current_value[i]
-                
+            self.tgt_vars_values[var.name][self.trace_count] = \
+                np.frombuffer(var.current_value, dtype=np.uint8)
+
 
-        self.tgt_randomness_count += 1
+        if(refresh_randomness):
+            self._use_target_randomness(1)
+
+        self.trace_count += 1
+
+
+    def _use_target_randomness(self, runs):
+        """
+        Count runs more experiment runs against the target randomness,
+        and refresh it once it has been used for more than
+        tgt_randomness_rate runs.
+        """
+        self.tgt_randomness_count += runs
 
         if(self.tgt_randomness_count > self.tgt_randomness_rate):
             if(self.tgt_randomness_rate > 0):
                 self._update_target_randomness()
+                self.tgt_randomness_count = 0
+
+
+    def _read_output_vars(self):
+        """
+        Read the current value of every output variable back from the
+        target device.
+        """
+        for var in self.tgt_vars:
+            if(var.is_output):
+                value = self.target.doGetVarValue(var.vid, var.size)
+                assert(value != False), \
+                    "Failed to read output variable %s" % var.name
+                var.setCurrentValue(value)
 
-        self.trace_count += 1
+
+    def _replay_target_prng(self):
+        """
+        Fill in the values of the variables the target generated with
+        its PRNG, by replaying it for every captured trace.
+        """
+        fixed   = self.fixed_bits[0:self.trace_count] >= 1
+        values  = self.prng.replay(self.tgt_vars, fixed)
+
+        for var in self.tgt_vars:
+            if(var.name in values):
+                rows = np.where(fixed,
+                    isPRNGVariable(var.flags, True),
+                    isPRNGVariable(var.flags, False))
+                self.tgt_vars_values[var.name][0:self.trace_count][rows] = \
+                    values[var.name][rows]
 
 
     def _run_ttest(self):
@@ -387,12 +604,19 @@ class TTestCapture(object):
 
         self.target.doInitExperiment()
 
-        for i in self.__progress_bar_func(range(0,self.num_traces)):
+        if(self.burst_size > 0):
+            self._run_ttest_bursts()
+            return
+
+        # As plain bools, so following the schedule costs nothing per
+        # trace.
+        schedule = self.fixed_bits.astype(bool).tolist()
+
+        for gather_fixed in self.__progress_bar_func(schedule):
 
             self._pre_gather_trace()
 
             new_trace       = None
-            gather_fixed    = random.choice([True,False])
 
             if(gather_fixed):
                 self._pre_gather_fixed_value_trace()
@@ -404,6 +628,51 @@ class TTestCapture(object):
             self._post_gather_trace(new_trace, gather_fixed)
 
 
+    def _run_ttest_bursts(self):
+        """
+        As _run_ttest, but gathers traces burst_size at a time with
+        _gather_burst. Inputs cannot be uploaded between the runs of a
+        burst, so randomisable variables must come from the target PRNG.
+        """
+        self._check_burst_capture()
+
+        for first in self.__progress_bar_func(
+            range(0, self.num_traces, self.burst_size)):
+
+            fixed   = self.fixed_bits[first:first+self.burst_size]
+            traces  = self._gather_burst(fixed)
+
+            self._post_gather_burst(traces, fixed)
+
+
+    def _check_burst_capture(self):
+        """Check the capture settings allow burst capture."""
+        assert(self.target_prng or \
+            not any([v.is_randomisable for v in self.tgt_vars])), \
+            "Burst capture needs target_prng to randomise input variables"
+        assert(not self.read_output_vars), \
+            "Output variables cannot be read back during burst capture"
+
+
+    def _post_gather_burst(self, traces, fixed):
+        """
+        Call _post_gather_trace for each trace of a burst, where fixed[i]
+        says whether run i used the fixed values. The target randomness
+        cannot change during a burst, so it is refreshed, if due, once
+        the burst is done.
+        """
+        for new_trace, gather_fixed in zip(traces, np.asarray(fixed) != 0):
+
+            for var in self.tgt_vars:
+                if(gather_fixed and var.is_ttest_variable):
+                    var.takeFixedValue()
+
+            self._post_gather_trace(new_trace, gather_fixed,
+                refresh_randomness = False)
+
+        self._use_target_randomness(len(traces))
+
+
     def _post_run_ttest(self):
         """
         Called after the main ttest function finishes. Can be used
@@ -415,6 +684,10 @@ class TTestCapture(object):
             self.trace_count, self.fixed_count, self.rand_count
         ))
 
+        if(self.prng is not None):
+            log.info("Replaying target PRNG for input variable values")
+            self._replay_target_prng()
+
         fixed_trace_idx = np.nonzero(self.fixed_bits >= 1)
         rand_trace_idx  = np.nonzero(self.fixed_bits <  1)
 
@@ -0,0 +1,241 @@
+
+import json
+import os
+import time
+
+import logging as log
+
+from ..comms import TargetMetadata
+from ..scope import findTriggerWindowSize
+
+from .TTestCapture import TTestCapture
+
+class TTestClockSweep(object):
+    """
+    Captures one TTest trace set for each of several target system clock
+    configurations in a single session, e.g. to compare leakage across
+    clock rates.
+
+    The target connection and scope stay open throughout. For each
+    configuration the target is switched with Target.doSetSysClk, the
+    scope sampling frequency is re-tuned so every trace covers the same
+    number of samples per target clock cycle, and the trigger window is
+    measured (or taken from the metadata cache). Every configuration
+    uses the same fixed values. Each trace set is written to its own
+    chunk directory in output_dir, labelled with the configuration index
+    and clock rate, and sweep.json in output_dir lists them.
+    """
+
+    def __init__(self, target, scope, power_channel, output_dir, num_traces,
+                 clk_cfgs = None, trace_ext = ".npy"):
+        """
+        target - scass.comms.Target
+        scope - scass.scope.Scope
+        power_channel - scass.scope.ScopeChannel
+            The scope channel which samples the power signal.
+        output_dir - str
+            Directory for the chunk directories and sweep.json. Created
+            if needed.
+        num_traces - int
+            Number of traces to capture for each clock configuration.
+        clk_cfgs - list of int or None
+            Indexes of the clock configurations to sweep, in order, as
+            listed by Target.doGetSysClkInfo. Defaults to all of them.
+        trace_ext - str
+            Trace file extension, as for scass.trace.saveTracesToDisk.
+        """
+        self.target         = target
+        self.scope          = scope
+        self.power_channel  = power_channel
+        self.output_dir     = output_dir
+        self.num_traces     = num_traces
+        self.clk_cfgs       = clk_cfgs
+        self.trace_ext      = trace_ext
+
+        # TTestCapture class used for each configuration.
+        self.ttest_class    = TTestCapture
+
+        # TTestCapture attributes set for every configuration, e.g.
+        # {"target_prng": True, "burst_size": 64}
+        self.capture_options= {}
+
+        # Fixed values, by variable name. Filled in with those the first
+        # configuration picks, so all configurations share them.
+        self.fixed_values   = {}
+
+        # Scope samples per target clock cycle. Defaults to the scope's
+        # sampling frequency over the target clock rate when run starts.
+        self.samples_per_cycle = None
+
+        # If set, capture this many samples per trace rather than the
+        # trigger window found for each configuration.
+        self.num_samples    = None
+
+        # scass.comms.TargetMetadataCache to take the target metadata
+        # from. If scope_config, the scope configuration file, is also
+        # set, trigger windows are cached in it too.
+        self.cache          = None
+        self.scope_config   = None
+
+        # Clock configuration to restore afterwards. Set by run.
+        self.original_clk_cfg = None
+
+
+    def chunkDir(self, clk_cfg, clk_info):
+        """Return the directory the trace set of clk_cfg is written to."""
+        return os.path.join(self.output_dir, "clk-%02d-%dHz" % (
+            clk_cfg, clk_info.sys_clk_rate))
+
+
+    def run(self):
+        """
+        Capture a trace set for every clock configuration, then switch
+        the target back to the one it started with.
+
+        Returns a list with a dict summarising each configuration, with
+        keys "clk_cfg", "sys_clk_rate", "sys_clk_src", "sample_freq",
+        "traces", "fixed", "num_traces", "num_samples", "fixed_count"
+        and "seconds". These are also written to sweep.json.
+        """
+        if(self.cache is not None):
+            metadata = self.cache.lookup(self.target)
+        else:
+            metadata = TargetMetadata.fromTarget(self.target)
+
+        configs = self.clk_cfgs
+        if(configs is None):
+            configs = list(range(0, len(metadata.clk_configs)))
+
+        for cfg in configs:
+            assert(cfg >= 0 and cfg < len(metadata.clk_configs)), \
+                "Target has no clock configuration %d" % cfg
+
+        self.original_clk_cfg = metadata.current_clk_cfg
+
+        if(self.samples_per_cycle is None):
+            self.samples_per_cycle = self.scope.sample_freq / \
+                metadata.clk_configs[self.original_clk_cfg].sys_clk_rate
+
+        log.info("Sweeping %d clock configurations at %f samples/cycle" % (
+            len(configs), self.samples_per_cycle))
+
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        summaries = []
+
+        try:
+            for cfg in configs:
+                summaries.append(self.__captureConfig(metadata, cfg))
+
+        finally:
+            self.__switchClock(metadata, self.original_clk_cfg)
+
+        with open(os.path.join(self.output_dir, "sweep.json"), "w") as fh:
+            json.dump(summaries, fh, indent = 4)
+
+        return summaries
+
+
+    def __switchClock(self, metadata, clk_cfg):
+        """Switch the target to clk_cfg and check it took effect."""
+        if(metadata.current_clk_cfg == clk_cfg):
+            return
+
+        assert(self.target.doSetSysClk(clk_cfg)), \
+            "Failed to set clock configuration %d" % clk_cfg
+
+        current, _ = self.target.doGetSysClkInfo()
+
+        metadata.current_clk_cfg = current
+
+        assert(current == clk_cfg), \
+            "Target is on clock configuration %d, not %d" % (current, clk_cfg)
+
+
+    def __findWindow(self, metadata, clk_cfg):
+        """
+        Return the trigger window for clk_cfg at the current sampling
+        frequency, cached if possible.
+        """
+        key = None
+
+        if(self.cache is not None and self.scope_config is not None):
+            key = TargetMetadata.windowKey(self.scope_config,
+                self.power_channel.channel_id, clk_cfg, self.scope.sample_freq)
+
+            if(key in metadata.trigger_windows):
+                return metadata.trigger_windows[key]
+
+        window = findTriggerWindowSize(self.scope, self.target,
+            self.power_channel)
+
+        assert(window > 10), \
+            "Failed to find trigger window for clock configuration %d" % (
+                clk_cfg)
+
+        if(key is not None):
+            metadata.trigger_windows[key] = window
+            self.cache.save()
+
+        return window
+
+
+    def __captureConfig(self, metadata, clk_cfg):
+        """Capture the trace set for one clock configuration."""
+        start   = time.time()
+        info    = metadata.clk_configs[clk_cfg]
+
+        log.info("Clock configuration %d: %s" % (clk_cfg, str(info)))
+
+        self.__switchClock(metadata, clk_cfg)
+
+        self.scope.sample_freq = self.samples_per_cycle * info.sys_clk_rate
+
+        log.info("- Sample Frequency: %fHz" % self.scope.sample_freq)
+
+        window  = self.num_samples
+        if(window is None):
+            window = self.__findWindow(metadata, clk_cfg)
+
+        log.info("- Trigger Window  : %d" % window)
+
+        cdir    = self.chunkDir(clk_cfg, info)
+        os.makedirs(cdir, exist_ok=True)
+
+        ttest   = self.ttest_class(
+            self.target,
+            self.scope,
+            self.scope.trigger_channel,
+            self.power_channel,
+            os.path.join(cdir, "traces" + self.trace_ext),
+            os.path.join(cdir, "fixed.npy"),
+            num_traces  = self.num_traces,
+            num_samples = window
+        )
+
+        for name, value in self.capture_options.items():
+            setattr(ttest, name, value)
+
+        ttest.metadata      = metadata
+        ttest.fixed_values  = dict(self.fixed_values)
+
+        ttest.initialiseTTest()
+        ttest.performTTest()
+
+        # Later configurations use the same fixed values.
+        for var in ttest.tgt_vars:
+            if(var.is_input and (var.is_ttest_variable or var.is_randomisable)):
+                self.fixed_values.setdefault(var.name, var.fixed_value)
+
+        return {
+            "clk_cfg"       : clk_cfg,
+            "sys_clk_rate"  : info.sys_clk_rate,
+            "sys_clk_src"   : info.sys_clk_src.name,
+            "sample_freq"   : self.scope.sample_freq,
+            "traces"        : ttest.trs_file,
+            "fixed"         : ttest.trs_fb_file,
+            "num_traces"    : ttest.trace_count,
+            "num_samples"   : window,
+            "fixed_count"   : ttest.fixed_count,
+            "seconds"       : time.time() - start
+        }
@@ -1,4 +1,9 @@
 
 from .TTestCapture      import TTestCapture
+from .TTestCapture      import balancedSchedule
+from .AsyncTTestCapture import AsyncTTestCapture
+from .TTestCampaign     import TTestCampaign
+from .TTestCampaign     import CaptureBench
+from .TTestClockSweep   import TTestClockSweep
 from .TTest             import TTest
 from .TTestIncremental  import TTestIncremental
@@ -0,0 +1,18 @@
+#
+# Include in a firmware Makefile to give the firmware a build ID, which
+# the host uses to cache information about the experiment. Set
+# SCASS_BUILD_ID_SRCS to every source and header file built into the
+# firmware image first, then add $(SCASS_BUILD_ID_CFLAGS) to the flags
+# scass_target.c is compiled with.
+#
+# The build ID is a hash of those files and of the compiler and flags,
+# so it changes whenever the firmware does. Make scass_target.c's object
+# file depend on $(SCASS_BUILD_ID_SRCS), so it is rebuilt with the new ID.
+#
+
+SCASS_BUILD_ID_SRCS    ?= $(wildcard *.c *.h)
+
+SCASS_BUILD_ID         := $(shell { cat $(sort $(SCASS_BUILD_ID_SRCS)) ; \
+    echo '$(subst ','\'',$(CC) $(CFLAGS))' ; } | sha256sum | cut -c 1-16)
+
+SCASS_BUILD_ID_CFLAGS   = -DSCASS_BUILD_ID=\"$(SCASS_BUILD_ID)\"
@@ -30,18 +30,53 @@ static void get_experiment_name(
 }
 
 
+//! Protocol version in use, changed by SCASS_CMD_SET_PROTOCOL.
+static uint8_t protocol_version = 1;
+
+/*!
+@brief Send the firmware build ID to the host.
+@details Writes a single byte indicating the length of the build ID
+string, followed by the build ID string.
+*/
+static void get_build_id(
+    scass_target_cfg * cfg
+) {
+    char * build_id = cfg -> build_id ? cfg -> build_id : SCASS_BUILD_ID;
+
+    size_t len = strlen(build_id);
+
+    if(len > 255) {
+        len = 255;
+    }
+
+    cfg -> scass_io_wr_char(len);
+
+    for(size_t i = 0; i < len; i ++) {
+        cfg -> scass_io_wr_char(build_id[i]);
+    }
+}
+
+
 /*!
 @brief write a 32-bit integer to the UART
-@note Writes least significant byte first.
+@note Writes most significant byte first for protocol v1, and least
+    significant byte first for protocol v2, matching read_uint32.
 */
 static void dump_uint32(
     scass_target_cfg * cfg,
     uint32_t data
 ) {
-    cfg -> scass_io_wr_char((data >> 24)&0xFF);
-    cfg -> scass_io_wr_char((data >> 16)&0xFF);
-    cfg -> scass_io_wr_char((data >>  8)&0xFF);
-    cfg -> scass_io_wr_char((data >>  0)&0xFF);
+    if(protocol_version >= 2) {
+        cfg -> scass_io_wr_char((data >>  0)&0xFF);
+        cfg -> scass_io_wr_char((data >>  8)&0xFF);
+        cfg -> scass_io_wr_char((data >> 16)&0xFF);
+        cfg -> scass_io_wr_char((data >> 24)&0xFF);
+    } else {
+        cfg -> scass_io_wr_char((data >> 24)&0xFF);
+        cfg -> scass_io_wr_char((data >> 16)&0xFF);
+        cfg -> scass_io_wr_char((data >>  8)&0xFF);
+        cfg -> scass_io_wr_char((data >>  0)&0xFF);
+    }
 }
 
 
@@ -167,6 +202,84 @@ static int seed_randomness (
 }
 
 
+//! Non-zero if the input PRNG generates variable values before each run.
+static uint8_t  prng_enabled = 0;
+
+//! Hashed PRNG seed. Word n of the stream is lowbias32(prng_key + n).
+static uint32_t prng_key     = 0;
+
+//! Index of the next PRNG word.
+static uint32_t prng_counter = 0;
+
+
+/*!
+@brief The lowbias32 integer hash. Must match scass/comms/TargetPRNG.py
+*/
+static uint32_t lowbias32 (
+    uint32_t x
+) {
+    x ^= x >> 16;
+    x *= 0x7feb352d;
+    x ^= x >> 15;
+    x *= 0x846ca68b;
+    x ^= x >> 16;
+    return x;
+}
+
+
+/*!
+@brief Reads a 1 byte enable flag and a 4 byte (little endian) seed from
+    the UART, and (re)starts the input PRNG.
+@returns 0
+*/
+static int seed_prng (
+    scass_target_cfg * cfg
+) {
+    prng_enabled = cfg -> scass_io_rd_char();
+    prng_key     = lowbias32(read_uint32(cfg));
+    prng_counter = 0;
+
+    return 0;
+}
+
+
+/*!
+@brief Fill every randomisable input variable with PRNG output, except
+    TTest variables on fixed runs. Each variable takes whole 32-bit words,
+    least significant byte first, and unused bytes are discarded.
+*/
+static void prng_randomise_inputs (
+    scass_target_cfg * cfg,
+    char               fixed
+) {
+    for(uint8_t i = 0; i < cfg -> num_variables; i ++) {
+
+        scass_target_var * var = &cfg -> variables[i];
+
+        if(!(var -> flags & SCASS_FLAG_RANDOMISE) ||
+           !(var -> flags & SCASS_FLAG_INPUT    )) {
+            continue;
+        }
+
+        if(fixed && (var -> flags & SCASS_FLAG_TTEST_VAR)) {
+            continue;
+        }
+
+        uint8_t * dst = (uint8_t*)var -> value;
+
+        for(uint32_t j = 0; j < var -> size; j += 4) {
+
+            uint32_t w = lowbias32(prng_key + prng_counter);
+            prng_counter ++;
+
+            for(uint32_t b = 0; b < 4 && j + b < var -> size; b ++) {
+                dst[j + b] = (w >> (8*b)) & 0xFF;
+            }
+        }
+    }
+}
+
+
 /*!
 @brief Reads 4 bytes from the UART (little endian) and turns this into
  an address. It then Jumps to this address without returning.
@@ -189,6 +302,10 @@ static int run_experiment (
     scass_target_cfg * cfg,
     char                fixed
 ){
+
+    if(prng_enabled) {
+        prng_randomise_inputs(cfg, fixed);
+    }
                 
     if(cfg -> scass_experiment_pre_run != NULL) {
         cfg -> scass_experiment_pre_run(cfg,fixed);
@@ -205,6 +322,65 @@ static int run_experiment (
 }
 
 
+//! Fixed/random bitmap for the current burst. Bit i is set if run i is fixed.
+static uint8_t burst_bitmap[(SCASS_BURST_MAX_RUNS + 7) / 8];
+
+
+/*!
+@brief Run the experiment N times back to back.
+@details Reads a 4 byte (little endian) run count N, followed by N/8
+    (rounded up) bitmap bytes, where bit i%8 of byte i/8 is set if run i
+    should use the fixed variable values. The whole bitmap is buffered
+    before the first run, so the UART is idle while running. Each run
+    raises the trigger as normal, so the scope sees one trigger pulse
+    per run.
+
+    Then writes a status block of three 4 byte values: the number of runs
+    completed, the number of runs which failed, and the index of the
+    first failed run (0xFFFFFFFF if none).
+@returns Zero if N was valid, non-zero otherwise.
+*/
+static int run_burst (
+    scass_target_cfg * cfg
+) {
+    uint32_t num_runs   = read_uint32(cfg);
+    uint32_t num_bytes  = (num_runs + 7) / 8;
+
+    if(num_runs > SCASS_BURST_MAX_RUNS) {
+        // Consume the bitmap anyway to stay in sync with the host.
+        for(uint32_t i = 0; i < num_bytes; i ++) {
+            cfg -> scass_io_rd_char();
+        }
+        return 1;
+    }
+
+    for(uint32_t i = 0; i < num_bytes; i ++) {
+        burst_bitmap[i] = cfg -> scass_io_rd_char();
+    }
+
+    uint32_t failures      = 0;
+    uint32_t first_failure = 0xFFFFFFFF;
+
+    for(uint32_t i = 0; i < num_runs; i ++) {
+
+        char fixed = (burst_bitmap[i / 8] >> (i % 8)) & 0x1;
+
+        if(run_experiment(cfg, fixed)) {
+            if(failures == 0) {
+                first_failure = i;
+            }
+            failures ++;
+        }
+    }
+
+    dump_uint32(cfg, num_runs     );
+    dump_uint32(cfg, failures     );
+    dump_uint32(cfg, first_failure);
+
+    return 0;
+}
+
+
 /*!
 @brief Send the clock information for the target back to the host.
 */
@@ -245,6 +421,214 @@ static int do_set_clk_info (
     return 0;
 }
 
+//! Protocol version to switch to once the current response is sent.
+static uint8_t  pending_protocol = 0;
+
+//! Baud rate to switch to once the current response is sent.
+static uint32_t pending_baud     = 0;
+
+//! Baud rate to return to if the new one turns out to be unreliable.
+static uint32_t fallback_baud    = 0;
+
+/*!
+@brief Set while a new baud rate is waiting for SCASS_CMD_CONFIRM_BAUD.
+@details Any framing error during this time switches back to
+    fallback_baud, so a host which cannot talk at the new rate can always
+    recover the link at the old one.
+*/
+static uint8_t  baud_probation   = 0;
+
+
+//! Switch protocol version. Takes effect after the response is sent.
+static int do_set_protocol (
+    scass_target_cfg * cfg
+) {
+    uint8_t version = cfg -> scass_io_rd_char();
+
+    if(version != 1 && version != 2) {
+        return 1;
+    }
+
+    pending_protocol = version;
+
+    return 0;
+}
+
+
+/*!
+@brief Switch baud rate, after the response is sent, on probation.
+@details Reads the new rate and the rate to fall back to. Only
+    available with protocol v2, which is needed to detect a bad rate.
+*/
+static int do_set_baud (
+    scass_target_cfg * cfg
+) {
+    uint32_t baud     = read_uint32(cfg);
+    uint32_t fallback = read_uint32(cfg);
+
+    if(cfg -> scass_io_set_baud == NULL || protocol_version < 2 || baud == 0) {
+        return 1;
+    }
+
+    pending_baud  = baud;
+    fallback_baud = fallback;
+
+    return 0;
+}
+
+
+//! Read a length byte and that many bytes, and send the bytes back.
+static int do_echo (
+    scass_target_cfg * cfg
+) {
+    uint8_t len = cfg -> scass_io_rd_char();
+
+    for(uint16_t i = 0; i < len; i ++) {
+        cfg -> scass_io_wr_char(cfg -> scass_io_rd_char());
+    }
+
+    return 0;
+}
+
+
+//! Apply any protocol or baud rate change requested by the last command.
+static void apply_pending_changes (
+    scass_target_cfg * cfg
+) {
+    if(pending_protocol) {
+        protocol_version = pending_protocol;
+        pending_protocol = 0;
+    }
+
+    if(pending_baud) {
+        baud_probation   = cfg -> scass_io_set_baud(pending_baud) == 0;
+        pending_baud     = 0;
+    }
+}
+
+
+//! Update a CRC16-CCITT (polynomial 0x1021, MSB first) with one byte.
+static uint16_t crc16_update (
+    uint16_t crc,
+    uint8_t  data
+) {
+    crc ^= (uint16_t)data << 8;
+
+    for(int i = 0; i < 8; i ++) {
+        crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+    }
+
+    return crc;
+}
+
+
+//! The target's own UART functions, while the cfg points at the frame ones.
+static uint8_t (*uart_rd_char)()          = NULL;
+static void    (*uart_wr_char)(uint8_t c) = NULL;
+
+//! Opcode and payload of the current command frame.
+static uint8_t  rx_frame[SCASS_FRAME_MAX_LEN];
+static uint16_t rx_len      = 0;
+static uint16_t rx_pos      = 0;
+
+//! Payload of the current response frame.
+static uint8_t  tx_frame[SCASS_FRAME_MAX_LEN];
+static uint16_t tx_len      = 0;
+
+//! Set if a command read past the end of its frame, or overfilled tx_frame.
+static uint8_t  frame_overrun = 0;
+
+
+//! Read the next byte of the current command frame.
+static uint8_t frame_rd_char() {
+    if(rx_pos < rx_len) {
+        return rx_frame[rx_pos ++];
+    }
+    frame_overrun = 1;
+    return 0;
+}
+
+
+/*!
+@brief Append a byte to the current response frame.
+@details Leaves room for the opcode and response byte, so the response
+    frame is never longer than SCASS_FRAME_MAX_LEN.
+*/
+static void frame_wr_char(uint8_t c) {
+    if(tx_len < SCASS_FRAME_MAX_LEN - 2) {
+        tx_frame[tx_len ++] = c;
+    } else {
+        frame_overrun = 1;
+    }
+}
+
+
+/*!
+@brief Receive the next command frame into rx_frame.
+@details Skips anything before the next SCASS_FRAME_SOF, unless a new
+    baud rate is on probation, in which case that is an error too.
+@returns Zero if a valid frame was received, non-zero otherwise.
+*/
+static int recv_frame (
+    scass_target_cfg * cfg
+) {
+    while(cfg -> scass_io_rd_char() != SCASS_FRAME_SOF) {
+        if(baud_probation) {
+            return 1;
+        }
+    }
+
+    uint8_t  len_lo = cfg -> scass_io_rd_char();
+    uint8_t  len_hi = cfg -> scass_io_rd_char();
+    uint16_t len    = len_lo | ((uint16_t)len_hi << 8);
+    uint16_t crc    = crc16_update(crc16_update(0xFFFF, len_lo), len_hi);
+
+    if(len == 0 || len > SCASS_FRAME_MAX_LEN) {
+        return 1;
+    }
+
+    for(uint16_t i = 0; i < len; i ++) {
+        rx_frame[i] = cfg -> scass_io_rd_char();
+        crc         = crc16_update(crc, rx_frame[i]);
+    }
+
+    uint16_t rx_crc  = cfg -> scass_io_rd_char();
+             rx_crc |= (uint16_t)cfg -> scass_io_rd_char() << 8;
+
+    rx_len = len;
+    rx_pos = 1;
+
+    return rx_crc != crc;
+}
+
+
+//! Send a frame with the given opcode and payload.
+static void send_frame (
+    scass_target_cfg * cfg    ,
+    uint8_t            opcode ,
+    uint8_t          * payload,
+    uint16_t           count
+) {
+    uint16_t len = count + 1;
+    uint16_t crc = 0xFFFF;
+    uint8_t  hdr[3] = {len & 0xFF, len >> 8, opcode};
+
+    cfg -> scass_io_wr_char(SCASS_FRAME_SOF);
+
+    for(int i = 0; i < 3; i ++) {
+        cfg -> scass_io_wr_char(hdr[i]);
+        crc = crc16_update(crc, hdr[i]);
+    }
+
+    for(uint16_t i = 0; i < count; i ++) {
+        cfg -> scass_io_wr_char(payload[i]);
+        crc = crc16_update(crc, payload[i]);
+    }
+
+    cfg -> scass_io_wr_char(crc & 0xFF);
+    cfg -> scass_io_wr_char(crc >> 8);
+}
+
 #ifdef __riscv_xlen
 void __scass_set_panic_handler();
 
@@ -296,6 +680,12 @@ void scass_panic() {
     ra=0;
 #endif
     char nl = '\n';
+
+    // Write straight to the UART, even part way through a framed command.
+    if(uart_wr_char != NULL) {
+        pcfg -> scass_io_wr_char = uart_wr_char;
+    }
+
     pcfg -> scass_io_wr_char(nl);
     pcfg -> scass_io_wr_char('p');
     pcfg -> scass_io_wr_char('a');
@@ -317,6 +707,209 @@ void scass_panic() {
 }
 
 
+/*!
+@brief Run a single command, reading its arguments and writing its
+    response data through the cfg IO functions.
+@returns Zero if the command succeeded, non-zero otherwise.
+*/
+static uint8_t run_command (
+    scass_target_cfg * cfg,
+    uint8_t            cmd
+) {
+    uint8_t success = 1;
+
+    switch(cmd) {
+        case SCASS_CMD_HELLOWORLD:
+            success = 0;
+            break;
+
+        case SCASS_CMD_INIT_EXPERIMENT:
+            success = cfg -> scass_experiment_init(cfg);
+            break;
+
+        case SCASS_CMD_RUN_FIXED:
+            success  = run_experiment(cfg,1);
+            break;
+        
+        case SCASS_CMD_RUN_RANDOM:
+            success  = run_experiment(cfg,0);
+            break;
+
+        case SCASS_CMD_RUN_BURST:
+            success  = run_burst(cfg);
+            break;
+
+        case SCASS_CMD_EXPERIMENT_NAME:
+            get_experiment_name(cfg);
+            success = 0;
+            break;
+
+        case SCASS_CMD_GET_CYCLES:
+            dump_uint32(cfg, cfg -> experiment_cycles);
+            success = 0;
+            break;
+
+        case SCASS_CMD_GET_INSTRRET:
+            dump_uint32(cfg, cfg -> experiment_instrret);
+            success = 0;
+            break;
+        
+        case SCASS_CMD_GOTO:
+            do_goto(cfg); // Does not return.
+            __builtin_unreachable();
+            break;
+
+        case SCASS_CMD_GET_VAR_NUM:
+            cfg -> scass_io_wr_char(cfg -> num_variables);
+            success = 0;
+            break;
+
+        case SCASS_CMD_GET_VAR_INFO:
+            success = dump_variable_info(cfg);
+            break;
+
+        case SCASS_CMD_GET_VAR_VALUE:
+            success = dump_variable_value(cfg,0);
+            break;
+        
+        case SCASS_CMD_SET_VAR_VALUE:
+            success = set_variable_value(cfg,0);
+            break;
+        
+        case SCASS_CMD_GET_VAR_FIXED:
+            success = dump_variable_value(cfg,1);
+            break;
+        
+        case SCASS_CMD_SET_VAR_FIXED:
+            success = set_variable_value(cfg,1);
+            break;
+
+        case SCASS_CMD_RAND_GET_LEN:
+            dump_uint32(cfg, cfg -> randomness_len);
+            success = 0;
+            break;
+
+        case SCASS_CMD_RAND_GET_INTERVAL:
+            dump_uint32(cfg, cfg -> randomness_refresh_rate);
+            success = 0;
+            break;
+
+        case SCASS_CMD_RAND_SEED:
+            success = seed_randomness(cfg);
+            break;
+
+        case SCASS_CMD_PRNG_SEED:
+            success = seed_prng(cfg);
+            break;
+
+        case SCASS_CMD_GET_CLK_INFO:
+            success = do_get_clk_info(cfg);
+            break;
+
+        case SCASS_CMD_SET_SYS_CLK:
+            success = do_set_clk_info(cfg);
+            break;
+
+        case SCASS_CMD_SET_PROTOCOL:
+            success = do_set_protocol(cfg);
+            break;
+
+        case SCASS_CMD_SET_BAUD:
+            success = do_set_baud(cfg);
+            break;
+
+        case SCASS_CMD_CONFIRM_BAUD:
+            baud_probation = 0;
+            success = 0;
+            break;
+
+        case SCASS_CMD_ECHO:
+            success = do_echo(cfg);
+            break;
+
+        case SCASS_CMD_GET_BUILD_ID:
+            get_build_id(cfg);
+            success = 0;
+            break;
+
+        default:
+            break;
+    }
+
+    return success;
+}
+
+
+//! Read, run and respond to one protocol v1 command.
+static void serve_raw_command (
+    scass_target_cfg * cfg
+) {
+    uint8_t cmd     = cfg -> scass_io_rd_char();
+    uint8_t success = run_command(cfg, cmd);
+    uint8_t rsp     = success ? SCASS_RSP_ERROR : SCASS_RSP_OKAY;
+
+    // Always respond, so the host can check every command. Errors
+    // are followed by the failed command.
+    cfg -> scass_io_wr_char(rsp);
+
+    if(rsp == SCASS_RSP_ERROR) {
+        cfg -> scass_io_wr_char(cmd);
+    }
+}
+
+
+/*!
+@brief Receive, run and respond to one protocol v2 command frame.
+@details The command reads its arguments from, and writes its response
+    data to, frame buffers rather than the UART. The response frame
+    carries the same bytes a v1 response would, except that on failure
+    any response data is dropped, leaving just SCASS_RSP_ERROR and the
+    command.
+*/
+static void serve_framed_command (
+    scass_target_cfg * cfg
+) {
+    if(recv_frame(cfg)) {
+        if(baud_probation) {
+            // The host cannot talk at the new rate. Go back to the old one.
+            cfg -> scass_io_set_baud(fallback_baud);
+            baud_probation = 0;
+        } else {
+            send_frame(cfg, SCASS_RSP_NAK, NULL, 0);
+        }
+        return;
+    }
+
+    uint8_t cmd     = rx_frame[0];
+
+    uart_rd_char    = cfg -> scass_io_rd_char;
+    uart_wr_char    = cfg -> scass_io_wr_char;
+
+    cfg -> scass_io_rd_char = frame_rd_char;
+    cfg -> scass_io_wr_char = frame_wr_char;
+
+    tx_len          = 0;
+    frame_overrun   = 0;
+
+    uint8_t success = run_command(cfg, cmd);
+
+    cfg -> scass_io_rd_char = uart_rd_char;
+    cfg -> scass_io_wr_char = uart_wr_char;
+
+    if(success || frame_overrun) {
+        tx_frame[0]     = SCASS_RSP_ERROR;
+        tx_frame[1]     = cmd;
+        tx_len          = 2;
+        pending_protocol= 0;
+        pending_baud    = 0;
+    } else {
+        tx_frame[tx_len ++] = SCASS_RSP_OKAY;
+    }
+
+    send_frame(cfg, cmd, tx_frame, tx_len);
+}
+
+
 void scass_loop (
     scass_target_cfg * cfg
 ) {
@@ -328,105 +921,13 @@ void scass_loop (
 
     while(1) {
 
-        uint8_t cmd = cfg -> scass_io_rd_char();
-        uint8_t success = 1;
-        uint8_t rsp = SCASS_RSP_ERROR;
-
-        switch(cmd) {
-            case SCASS_CMD_HELLOWORLD:
-                success = 0;
-                break;
-
-            case SCASS_CMD_INIT_EXPERIMENT:
-                success = cfg -> scass_experiment_init(cfg);
-                break;
-
-            case SCASS_CMD_RUN_FIXED:
-                success  = run_experiment(cfg,1);
-                break;
-            
-            case SCASS_CMD_RUN_RANDOM:
-                success  = run_experiment(cfg,0);
-                break;
-
-            case SCASS_CMD_EXPERIMENT_NAME:
-                get_experiment_name(cfg);
-                success = 0;
-                break;
-
-            case SCASS_CMD_GET_CYCLES:
-                dump_uint32(cfg, cfg -> experiment_cycles);
-                success = 0;
-                break;
-
-            case SCASS_CMD_GET_INSTRRET:
-                dump_uint32(cfg, cfg -> experiment_instrret);
-                success = 0;
-                break;
-            
-            case SCASS_CMD_GOTO:
-                do_goto(cfg); // Does not return.
-                __builtin_unreachable();
-                break;
-
-            case SCASS_CMD_GET_VAR_NUM:
-                cfg -> scass_io_wr_char(cfg -> num_variables);
-                success = 0;
-                break;
-
-            case SCASS_CMD_GET_VAR_INFO:
-                success = dump_variable_info(cfg);
-                break;
-
-            case SCASS_CMD_GET_VAR_VALUE:
-                success = dump_variable_value(cfg,0);
-                break;
-            
-            case SCASS_CMD_SET_VAR_VALUE:
-                success = set_variable_value(cfg,0);
-                break;
-            
-            case SCASS_CMD_GET_VAR_FIXED:
-                success = dump_variable_value(cfg,1);
-                break;
-            
-            case SCASS_CMD_SET_VAR_FIXED:
-                success = set_variable_value(cfg,1);
-                break;
-
-            case SCASS_CMD_RAND_GET_LEN:
-                dump_uint32(cfg, cfg -> randomness_len);
-                success = 0;
-                break;
-
-            case SCASS_CMD_RAND_GET_INTERVAL:
-                dump_uint32(cfg, cfg -> randomness_refresh_rate);
-                success = 0;
-                break;
-
-            case SCASS_CMD_RAND_SEED:
-                success = seed_randomness(cfg);
-                break;
-
-            case SCASS_CMD_GET_CLK_INFO:
-                success = do_get_clk_info(cfg);
-                break;
-
-            case SCASS_CMD_SET_SYS_CLK:
-                success = do_set_clk_info(cfg);
-                break;
-
-            default:
-                break;
+        if(protocol_version >= 2) {
+            serve_framed_command(cfg);
+        } else {
+            serve_raw_command(cfg);
         }
 
-        rsp = success ? SCASS_RSP_ERROR : SCASS_RSP_OKAY;
-
-        if(rsp == SCASS_RSP_ERROR) {
-        
-            cfg -> scass_io_wr_char(rsp);
-            cfg -> scass_io_wr_char(cmd);
-        }
+        apply_pending_changes(cfg);
 
     }
 
@@ -435,11 +936,38 @@ void scass_loop (
 }
 
 /*!
+@details With protocol v2 the string is sent as a frame of its own, with
+    SCASS_RSP_DEBUG as the opcode and no newline. Either way it goes
+    straight to the UART, even part way through a framed command.
 */
 void scass_debug_str(
     scass_target_cfg * cfg, //!< The config to debug with
     char             * str
 ){
-    // EMPTY
+    void (*wr_char)(uint8_t c) = cfg -> scass_io_wr_char;
+
+    if(wr_char == frame_wr_char) {
+        cfg -> scass_io_wr_char = uart_wr_char;
+    }
+
+    size_t len = strlen(str);
+
+    if(protocol_version >= 2) {
+
+        if(len > SCASS_FRAME_MAX_LEN - 1) {
+            len = SCASS_FRAME_MAX_LEN - 1;
+        }
+
+        send_frame(cfg, SCASS_RSP_DEBUG, (uint8_t*)str, len);
+
+    } else {
+
+        cfg -> scass_io_wr_char(SCASS_RSP_DEBUG);
+        dump_bytes(cfg, str, len);
+        cfg -> scass_io_wr_char('\n');
+
+    }
+
+    cfg -> scass_io_wr_char = wr_char;
 }
 
@@ -21,18 +21,67 @@
 #define SCASS_CMD_RAND_GET_LEN          'L'
 #define SCASS_CMD_RAND_GET_INTERVAL     'l'
 #define SCASS_CMD_RAND_SEED             'S'
+#define SCASS_CMD_PRNG_SEED             'P'
+#define SCASS_CMD_RUN_BURST             'B'
 #define SCASS_CMD_GET_CLK_INFO          'c'
 #define SCASS_CMD_SET_SYS_CLK           'r'
+#define SCASS_CMD_SET_PROTOCOL          'X'
+#define SCASS_CMD_SET_BAUD              'b'
+#define SCASS_CMD_CONFIRM_BAUD          'k'
+#define SCASS_CMD_ECHO                  'e'
+#define SCASS_CMD_GET_BUILD_ID          'h'
+
+/*!
+@brief Build ID sent for SCASS_CMD_GET_BUILD_ID if the config has none.
+@details Firmware builds should define this to something which changes
+    with the firmware image, as target/scass/scass_build_id.mk does with
+    a hash of the sources and compiler flags, or set
+    scass_target_cfg.build_id. The host caches information about the
+    experiment by build ID, and trusts it to change whenever the
+    variables do. If neither is set an empty build ID is sent, and the
+    host does not cache anything.
+*/
+#ifndef SCASS_BUILD_ID
+#define SCASS_BUILD_ID                  ""
+#endif
 
 #define SCASS_CLK_SRC_EXTERNAL          0b00000001
 #define SCASS_CLK_SRC_INTERNAL          0b00000010
 #define SCASS_CLK_SRC_PLL_EXT           0b00000100
 #define SCASS_CLK_SRC_PLL_INT           0b00001000
 
+/*!
+@brief Maximum number of runs in a single SCASS_CMD_RUN_BURST command.
+@details The fixed/random bitmap for a burst is buffered on the target,
+    taking SCASS_BURST_MAX_RUNS/8 bytes of RAM.
+*/
+#ifndef SCASS_BURST_MAX_RUNS
+#define SCASS_BURST_MAX_RUNS            4096
+#endif
+
+/*!
+@brief Maximum length of the opcode and payload of a protocol v2 frame.
+@details Frames are buffered on the target, which takes twice this
+    many bytes of RAM. The default fits a full SCASS_CMD_RUN_BURST bitmap.
+    A response carries at most SCASS_FRAME_MAX_LEN - 2 bytes of data,
+    between the opcode and the response byte. Commands which set a
+    variable carry its index and value, so the same limit applies to
+    them. Larger variables can only be read and written with protocol v1.
+*/
+#ifndef SCASS_FRAME_MAX_LEN
+#define SCASS_FRAME_MAX_LEN             ((SCASS_BURST_MAX_RUNS + 7) / 8 + 16)
+#endif
+
+//! First byte of every protocol v2 frame.
+#define SCASS_FRAME_SOF                 0x7E
+
 #define SCASS_RSP_OKAY            '0'
 #define SCASS_RSP_ERROR           '!'
 #define SCASS_RSP_DEBUG           '?'
 
+//! Opcode of the protocol v2 frame sent back for a corrupted command frame.
+#define SCASS_RSP_NAK             0x00
+
 #define SCASS_FLAG_RANDOMISE (0x1 << 0)
 #define SCASS_FLAG_INPUT     (0x1 << 1)
 #define SCASS_FLAG_OUTPUT    (0x1 << 2)
@@ -205,6 +254,27 @@ struct __scass_target_cfg {
         char               fixed
     );
 
+    /*!
+    @brief Change the baud rate of the target UART port.
+    @details May be set to NULL, in which case SCASS_CMD_SET_BAUD always
+        fails. Only called once any pending output has been sent.
+    @param baud - The new baud rate.
+    @returns 0 on success, non-zero if the rate is not supported, in which
+        case the baud rate must be left unchanged.
+    */
+    uint8_t (*scass_io_set_baud)(
+        uint32_t baud
+    );
+
+    /*!
+    @brief Identifies the firmware build, so the host can tell when
+        cached information about the experiment is out of date.
+    @details Must change whenever any of the firmware does, including
+        the experiment code, e.g. a hash of all the sources. May be NULL,
+        in which case SCASS_BUILD_ID is used.
+    */
+    char * build_id;
+
 };
 
 
@@ -212,6 +282,13 @@ struct __scass_target_cfg {
 /*!
 @brief The main control loop for the scass target.
 @details Continually loops waiting for commands from the host.
+    Commands start out as a single opcode character followed by any
+    arguments (protocol v1). After SCASS_CMD_SET_PROTOCOL switches to
+    protocol v2, every command and response is a frame of
+    SCASS_FRAME_SOF, a little endian 16-bit length, the opcode and
+    payload, then a little endian CRC16-CCITT of the length, opcode and
+    payload. Corrupted command frames are answered with a SCASS_RSP_NAK
+    frame, and the target then hunts for the next SCASS_FRAME_SOF.
 @note This function does not return.
 */
 void scass_loop(
@@ -224,7 +301,10 @@ void scass_loop(
 @details Sends the SCASS_RSP_DEBUG symbol to the host, followed by
     a null terminated string. The Host will read the string until
     a newline is encountered. The function automatically appends a
-    newline ('\n') to the string when sending it.
+    newline ('\n') to the string when sending it. The string should
+    not contain a newline itself. Only call this while running a
+    command, before any response data is written, so the host can tell
+    it apart from responses.
 @param str - The NULL terminated string to print.
 */
 void scass_debug_str(
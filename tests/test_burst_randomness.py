@@ -0,0 +1,91 @@
+"""
+Check burst capture refreshes the target randomness once per burst
+rather than once per run, using stand-ins for the target and scope.
+"""
+
+import numpy as np
+
+from scass.comms        import Target
+from scass.scope        import ScopeChannel
+from scass.scope.Scope  import Scope
+from scass.ttest        import TTestCapture
+from scass.cpa.CollectTraces import CollectTraces
+
+
+class BurstTarget(Target):
+    """Counts burst and randomness seed commands instead of sending them."""
+
+    def __init__(self):
+        self.bursts = 0
+        self.seeds  = 0
+
+    def doRunBurst(self, fixed, timeout = None, wait = True):
+        self.bursts += 1
+        return (len(fixed), 0, None)
+
+    def doRandSeed(self, data, wait = True):
+        self.seeds += 1
+        return True
+
+
+class BurstScope(Scope):
+    """Returns zero filled segmented captures."""
+
+    def __init__(self):
+        Scope.__init__(self)
+        self._channels["A"] = ScopeChannel(self, "A")
+
+    def runSegmentedCapture(self, num_segments):
+        pass
+
+    def dataReady(self):
+        return True
+
+    def getRawSegmentedChannelData(self, channel, num_segments,
+                                   numSamples = None):
+        return np.zeros((num_segments, numSamples), dtype=np.float32)
+
+
+def test_ttest_burst_refreshes_once_per_burst():
+    target  = BurstTarget()
+    scope   = BurstScope()
+    channel = scope.getChannel("A")
+
+    ttest   = TTestCapture(target, scope, channel, channel, None, None,
+        num_traces = 1000, num_samples = 4)
+
+    ttest.progress_bar          = False
+    ttest.burst_size            = 100
+    ttest.tgt_vars              = []
+    ttest.tgt_randomness_size   = 16
+    ttest.tgt_randomness_rate   = 250
+    ttest.tgt_randomness_count  = 0
+
+    ttest._run_ttest_bursts()
+
+    assert(target.bursts == 10)
+    assert(ttest.trace_count == 1000)
+
+    # Refreshed after the bursts ending at 300, 600 and 900 runs.
+    assert(target.seeds == 3)
+    assert(ttest.tgt_randomness_count == 100)
+
+
+def test_collect_traces_burst_refreshes_once_per_burst():
+    target  = BurstTarget()
+    scope   = BurstScope()
+    channel = scope.getChannel("A")
+
+    collect = CollectTraces(target, scope, channel, channel,
+        num_traces = 1000, num_samples = 4)
+
+    collect.tgt_randomness_size = 16
+    collect.tgt_randomness_rate = 250
+
+    for first in range(0, 1000, 100):
+        collect._gatherBurst(100)
+
+    assert(target.bursts == 10)
+    assert(collect.trace_count == 1000)
+    assert(target.seeds == 3)
+    assert(collect.tgt_randomness_count == 100)
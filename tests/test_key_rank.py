@@ -0,0 +1,36 @@
+"""
+Check the key rank helpers against hand worked examples.
+"""
+
+import numpy as np
+
+from scass.cpa import KeyRank
+
+
+def test_guess_ranks():
+    scores = np.array([[0.1, 0.5, 0.3, 0.2],
+                       [0.9, 0.5, 0.3, 0.2]])
+
+    assert(KeyRank.guessRanks(scores, 2).tolist() == [1, 2])
+    assert(KeyRank.guessRanks(scores, 0).tolist() == [3, 0])
+
+
+def test_guessing_entropy():
+    ranks = np.array([[0, 3], [2, 0]])
+
+    assert(KeyRank.guessingEntropy(ranks).tolist() == [2.0, 2.5])
+
+
+def test_log2_search_cost():
+    # (1-based) ranks 1 and 3, then 4 and 1: 3 and 4 full keys to try.
+    ranks = np.array([[0, 3], [2, 0]])
+
+    assert(np.allclose(KeyRank.log2SearchCost(ranks), np.log2([3, 4])))
+
+
+def test_traces_to_disclosure():
+    ranks = np.array([[3, 0, 1, 0, 0],
+                      [0, 0, 0, 0, 0]])
+
+    assert(KeyRank.tracesToDisclosure([10, 20, 30, 40, 50], ranks) == 40)
+    assert(KeyRank.tracesToDisclosure([10, 20], ranks[:, 0:2] + 1) is None)